@@ -1 +1 @@
-gcloud functions deploy webcam-scraper-v2 --source=single-scraper --runtime=python312 --trigger-topic=single-webcam-trigger --entry-point=scrape_all_cameras --region=us-east1
\ No newline at end of file
+gcloud functions deploy webcam-scraper-v2 --source=single-scraper --runtime=python312 --trigger-topic=single-webcam-trigger --entry-point=scrape_all_cameras --region=us-east1 --timeout=540s
\ No newline at end of file
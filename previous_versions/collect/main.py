@@ -1,6 +1,6 @@
 import functions_framework
 import requests
-from datetime import datetime
+from datetime import datetime, timedelta
 import pytz
 import json
 import concurrent.futures
@@ -8,15 +8,23 @@ import logging
 import os
 from pathlib import Path
 from flask import Flask
+from frame_validators import FrameValidators
+from status_store import LatestStatusStore
 from PIL import Image
 import imagehash
 import base64
 import csv
 import io
+import uuid
 
 app = Flask(__name__)
 
 BUCKET_NAME='nyc-webcam-capture'
+RUN_LOG_PREFIX = 'logs/runs'
+RUN_LOG_DAILY_NAME = 'daily.ndjson'
+COMPOSE_MAX_SOURCES = 32
+# Not single-scraper's metadata/frame_validators.json: both may run against the same bucket
+VALIDATORS_PATH = 'metadata/collect_frame_validators.json'
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -38,6 +46,11 @@ class CameraScraper:
             self.storage_client = storage.Client()
             self.bucket = self.storage_client.bucket(BUCKET_NAME)
             self.load_image_hashes()
+        # camera_id -> last ETag, Last-Modified and SHA-256 of the stored frame (kept in memory when local)
+        self.frame_validators = FrameValidators(None if is_local else self.bucket, VALIDATORS_PATH)
+        if not is_local:
+            self.frame_validators.load()
+        self.status_store = None
     
     def load_image_hashes(self):
         """Load image hashes from a JSON file in GCS."""
@@ -58,6 +71,16 @@ class CameraScraper:
         except Exception as e:
             logger.error(f"Failed to save image hashes: {e}")
 
+    def save_frame_validators(self):
+        """Save the frame validators to GCS."""
+        if self.is_local:
+            return
+        try:
+            self.frame_validators.save()
+            logger.info("Saved frame validators to GCS.")
+        except Exception as e:
+            logger.error(f"Failed to save frame validators: {e}")
+
     def get_datetime_path(self):
         """Generate timestamp-based path structure"""
         now = datetime.now(self.ny_tz)
@@ -106,15 +129,25 @@ class CameraScraper:
             camera_id = camera['id']
             url = f"https://webcams.nyctmc.org/api/cameras/{camera_id}/image"
             
-            response = requests.get(url, timeout=60)
+            response = requests.get(url, timeout=60, headers=self.frame_validators.request_headers(camera_id))
             response.raise_for_status()
 
+            # Checked before the image is decoded, so a frozen camera costs one request
+            if self.frame_validators.is_unchanged(camera_id, response):
+                return {
+                    'camera_id': camera_id,
+                    'camera_name': camera['name'],
+                    'status': 'unchanged',
+                    'timestamp': datetime.now(self.ny_tz).strftime('%Y%m%d_%H%M%S')
+                }
             # Calculate image hash
             img = Image.open(io.BytesIO(response.content))
             hash = str(imagehash.average_hash(img))
 
             # Compare with previous hash
             if self.image_hashes.get(camera_id) == hash:
+                # Same picture as far as the perceptual hash goes, but new bytes
+                self.frame_validators.record(camera_id, response)
                 return {
                     'camera_id': camera_id,
                     'camera_name': camera['name'],
@@ -157,6 +190,7 @@ class CameraScraper:
 
             # Save image
             self.save_file(img_byte_arr, filename, 'image/jpeg')
+            self.frame_validators.record(camera_id, response)
             
             return {
                 'camera_id': camera_id,
@@ -181,64 +215,153 @@ class CameraScraper:
                 'timestamp': datetime.now(self.ny_tz).strftime('%Y%m%d_%H%M%S')
             }
 
-    def log_results_to_csv(self, results):
-        """Append results to a CSV file in GCS."""
+    def get_status_store(self):
+        """The per-camera latest status store (GCS only, local runs just return their results)."""
+        if self.status_store is None and not self.is_local:
+            self.status_store = LatestStatusStore(self.bucket).load()
+        return self.status_store
+
+    def update_status(self, result):
+        """Record one camera's result in the latest status store as soon as it is known."""
+        store = self.get_status_store()
+        if store is None:
+            return
+        success = result['status'] == 'success'
+        store.update(
+            result['camera_id'],
+            result['camera_name'],
+            result['status'],
+            path=result.get('filename') if success else None,
+            capture_time=result.get('metadata', {}).get('capture_time') if success else None,
+        )
+
+    def save_status(self):
+        """Write this run's status changes, folding old ones into the snapshot now and then."""
+        store = self.get_status_store()
+        if store is None:
+            return
         try:
-            from google.cloud import storage
-            import csv
-            import io
+            store.flush()
+            store.compact()
+        except Exception as e:
+            logger.error(f"Failed to save latest status: {e}")
 
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(BUCKET_NAME)
-            
-            # Create a CSV in memory
-            output = io.StringIO()
-            writer = csv.writer(output)
-            
-            # Write header if the file doesn't exist
-            blob = bucket.blob('logs/images.csv')
-            if not blob.exists():
-                writer.writerow(['timestamp', 'camera_id', 'camera_name', 'filename', 'status', 'url', 'location'])
-            
-            # Write data
-            for result in results['details']:
-                if result['status'] == 'success':
-                    writer.writerow([
-                        result['timestamp'],
-                        result['camera_id'],
-                        result['camera_name'],
-                        result['filename'],
-                        result['status'],
-                        result['metadata']['url'],
-                        json.dumps(result['metadata']['location'])
-                    ])
-                elif result['status'] == 'skipped':
-                    writer.writerow([
-                        result['timestamp'],
-                        result['camera_id'],
-                        result['camera_name'],
-                        '',
-                        result['status'],
-                        '',
-                        ''
-                    ])
-                else:
-                    writer.writerow([
-                        result['timestamp'],
-                        result['camera_id'],
-                        result['camera_name'],
-                        '',
-                        result['status'],
-                        '',
-                        ''
-                    ])
-            
-            # Append to the file in GCS
-            blob.upload_from_string(output.getvalue(), 'text/csv')
-            logger.info("Logged results to CSV in GCS.")
+    def run_log_record(self, result, run_timestamp):
+        """One newline-delimited JSON record for a camera result."""
+        metadata = result.get('metadata', {})
+        return {
+            'run': run_timestamp,
+            'timestamp': result['timestamp'],
+            'camera_id': result['camera_id'],
+            'camera_name': result['camera_name'],
+            'filename': result.get('filename', '') if result['status'] == 'success' else '',
+            'status': result['status'],
+            'url': metadata.get('url', ''),
+            'location': metadata.get('location', ''),
+        }
 
+    def log_results(self, results):
+        """
+        Write this run's results as one small immutable object under logs/runs/{date}/.
+
+        Each run only writes its own records, so the cost is O(run) and no history is
+        overwritten. compact_run_logs() later merges a day's parts into daily.ndjson.
+        """
+        try:
+            run_timestamp = results['timestamp']
+            run_date = datetime.strptime(run_timestamp, '%Y%m%d_%H%M%S').strftime('%Y-%m-%d')
+            lines = [json.dumps(self.run_log_record(r, run_timestamp)) for r in results['details']]
+            filepath = f"{RUN_LOG_PREFIX}/{run_date}/part-{run_timestamp}-{uuid.uuid4().hex[:8]}.ndjson"
+            self.save_file('\n'.join(lines) + '\n', filepath, 'application/x-ndjson')
+            logger.info(f"Logged {len(lines)} results to {filepath}")
         except Exception as e:
-            logger.error(f"Failed to log results to CSV: {e}")
+            logger.error(f"Failed to log results: {e}")
+
+    def list_log_objects(self, run_date):
+        """Names of the log objects for one date partition, daily file first."""
+        prefix = f"{RUN_LOG_PREFIX}/{run_date}/"
+        if self.is_local:
+            names = [str(p.relative_to(self.base_dir)) for p in (self.base_dir / prefix).glob('*.ndjson')]
+        else:
+            names = [blob.name for blob in self.bucket.list_blobs(prefix=prefix)]
+        daily = prefix + RUN_LOG_DAILY_NAME
+        return sorted(names, key=lambda name: (name != daily, name))
+
+    def read_file(self, filepath):
+        if self.is_local:
+            return (self.base_dir / filepath).read_text()
+        return self.bucket.blob(filepath).download_as_text()
+
+    def read_run_logs(self, start_date, end_date):
+        """
+        Yield the log records for every date from start_date to end_date (inclusive).
+
+        Only the partitions in the range are listed and downloaded.
+        """
+        day = start_date
+        while day <= end_date:
+            for name in self.list_log_objects(day.strftime('%Y-%m-%d')):
+                for line in self.read_file(name).splitlines():
+                    if line:
+                        yield json.loads(line)
+            day += timedelta(days=1)
+
+    def compact_run_logs(self, run_date):
+        """
+        Merge a date partition's run parts into its daily.ndjson.
+
+        Uses GCS compose (at most 32 sources per call), so no records are downloaded.
+        Each compose is conditional on the daily generation it extends, and records the
+        names of the parts it added in the daily object's metadata; those parts are then
+        deleted. A part that failed to delete is still listed on the next run, and is
+        deleted there instead of being composed in a second time.
+        """
+        prefix = f"{RUN_LOG_PREFIX}/{run_date}/"
+        names = self.list_log_objects(run_date)
+        daily_name = prefix + RUN_LOG_DAILY_NAME
+        parts = [name for name in names if name != daily_name]
+        if not parts:
+            return 0
+
+        if self.is_local:
+            with open(self.base_dir / daily_name, 'a') as daily:
+                for name in parts:
+                    daily.write(self.read_file(name))
+                    (self.base_dir / name).unlink()
+        else:
+            daily = self.bucket.get_blob(daily_name)
+            if daily is not None:
+                # Left over by a run that composed them but did not finish deleting them
+                compacted = set(json.loads((daily.metadata or {}).get('compacted_parts', '[]')))
+                for name in (name for name in parts if name in compacted):
+                    self.bucket.blob(name).delete()
+                parts = [name for name in parts if name not in compacted]
+            else:
+                daily = self.bucket.blob(daily_name)
+            step = COMPOSE_MAX_SOURCES - 1
+            for i in range(0, len(parts), step):
+                chunk = [self.bucket.blob(name) for name in parts[i:i + step]]
+                generation = daily.generation or 0
+                sources = ([daily] if generation else []) + chunk
+                daily.content_type = 'application/x-ndjson'
+                daily.metadata = {'compacted_parts': json.dumps([blob.name for blob in chunk])}
+                # Raises PreconditionFailed if another compaction extended the daily object first
+                daily.compose(sources, if_generation_match=generation)
+                # A failed delete stops here, so leftovers are always in the last recorded chunk
+                for blob in chunk:
+                    blob.delete()
+        logger.info(f"Compacted {len(parts)} run logs into {daily_name}")
+        return len(parts)
+
+    def compact_old_run_logs(self, days=7):
+        """Compact the partitions of the last `days` days, excluding today."""
+        today = datetime.now(self.ny_tz).date()
+        for offset in range(1, days + 1):
+            run_date = (today - timedelta(days=offset)).strftime('%Y-%m-%d')
+            try:
+                self.compact_run_logs(run_date)
+            except Exception as e:
+                logger.error(f"Failed to compact run logs for {run_date}: {e}")
 
     def process_all_cameras(self, camera_name=None, max_workers=10):
         """Process all cameras with concurrent execution"""
@@ -257,6 +380,7 @@ class CameraScraper:
             'successful': 0,
             'failed': 0,
             'skipped': 0,
+            'unchanged': 0,
             'details': []
         }
         
@@ -265,6 +389,7 @@ class CameraScraper:
             return results
         
         logger.info(f"Starting to process {len(cameras)} cameras")
+        self.get_status_store()
         
         with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
             future_to_camera = {executor.submit(self.download_camera_image, camera): camera 
@@ -277,8 +402,11 @@ class CameraScraper:
                     results['successful'] += 1
                 elif result['status'] == 'skipped':
                     results['skipped'] += 1
+                elif result['status'] == 'unchanged':
+                    results['unchanged'] += 1
                 else:
                     results['failed'] += 1
+                self.update_status(result)
                 logger.info(f"Processed camera {result['camera_name']}: {result['status']}")
         
         # # Save run statistics in time-based path
@@ -289,24 +417,20 @@ class CameraScraper:
         #     'application/json'
         # )
         
-        self.log_results_to_csv(results)
+        self.log_results(results)
+        # Only the cameras of this run are written, see status_store.py
+        self.save_status()
 
-        # Remove metadata from details before saving to JSON
+        # Remove metadata from details before returning them
         for detail in results['details']:
             if 'metadata' in detail:
                 del detail['metadata']
 
-        stats_filename = f"metadata/latest_status.json"
-        self.save_file(
-            json.dumps(results, indent=2),
-            stats_filename,
-            'application/json'
-        )
-        
-
         self.save_image_hashes()
+        self.save_frame_validators()
 
-        logger.info(f"Completed processing. Success: {results['successful']}, Failed: {results['failed']}, Skipped: {results['skipped']}")
+        logger.info(f"Completed processing. Success: {results['successful']}, Failed: {results['failed']}, "
+                    f"Skipped: {results['skipped']}, Unchanged: {results['unchanged']}")
         return results
 
 @functions_framework.cloud_event
@@ -341,6 +465,22 @@ def scrape_all_cameras(cloud_event):
         }
 
 
+@functions_framework.cloud_event
+def compact_logs(cloud_event):
+    """Cloud Function for a daily scheduler trigger: compacts the last week of run logs"""
+    try:
+        is_local = os.getenv('ENVIRONMENT', 'production') == 'development'
+        scraper = CameraScraper(is_local=is_local)
+        scraper.compact_old_run_logs()
+        return {'status': 'complete'}
+    except Exception as e:
+        logger.error(f"Fatal error in compact_logs: {e}")
+        return {
+            'status': 'error',
+            'error': str(e)
+        }
+
+
 if __name__ == "__main__":
     # For direct Python execution
     scraper = CameraScraper(is_local=True)
@@ -4,17 +4,34 @@ import os
 
 # Step 1: Fetch the camera data from the API
 url = "https://webcams.nyctmc.org/api/cameras"
-response = requests.get(url)
+response = requests.get(url, timeout=60)
 data = response.json()  # Assuming the API returns a JSON response
 
-# Step 2: Generate the HTML for the Google Map
+# Step 2: Convert the cameras to a compact GeoJSON FeatureCollection
+features = []
+for camera in data:
+    features.append({
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [float(camera['longitude']), float(camera['latitude'])]},
+        "properties": {
+            "name": camera['name'],
+            "imageUrl": camera['imageUrl'],
+            "cameraUrl": f"https://webcams.nyctmc.org/api/cameras/{camera['id']}",
+        },
+    })
+geojson = json.dumps({"type": "FeatureCollection", "features": features}, separators=(",", ":"))
+
+with open("cameras.geojson", "w") as file:
+    file.write(geojson)
+
+# Step 3: Generate the HTML for the Google Map, with one generic loop over the GeoJSON
 API_KEY = os.environ['GOOGLE_MAPS_API_KEY']
 html_content = """
 <!DOCTYPE html>
 <html>
   <head>
     <title>Camera Locations</title>
-<script src="https://maps.googleapis.com/maps/api/js?key={{ API_KEY }}&callback=initMap" async defer></script>
+<script src="https://maps.googleapis.com/maps/api/js?key=__API_KEY__&callback=initMap" async defer></script>
     <style>
       #map {
         height: 100%;
@@ -31,57 +48,48 @@ html_content = """
     <div id="map"></div>
     <script>
       let map;
+      const cameras = __CAMERAS__;
 
       function initMap() {
         map = new google.maps.Map(document.getElementById("map"), {
           center: { lat: 40.730610, lng: -73.935242 },  // Default center (NYC)
           zoom: 11,
         });
-"""
 
-# Step 3: Add markers for each camera
-for camera in data:
-    name = camera['name']
-    latitude = camera['latitude']
-    longitude = camera['longitude']
-    image_url = camera['imageUrl']
-    camera_url = f"https://webcams.nyctmc.org/api/cameras/{camera['id']}"
+        // A single InfoWindow shared by every marker
+        const infoWindow = new google.maps.InfoWindow();
+        cameras.features.forEach(function(feature) {
+          const [lng, lat] = feature.geometry.coordinates;
+          const camera = feature.properties;
+          const marker = new google.maps.Marker({
+            position: { lat: lat, lng: lng },
+            map: map,
+            title: camera.name,
+          });
 
-    # Corrected way of adding f-string inside JavaScript code
-    html_content += f"""
-        const marker = new google.maps.Marker({{
-          position: {{ lat: {latitude}, lng: {longitude} }},
-          map: map,
-          title: "{name}",
-        }});
-
-        const infoWindow = new google.maps.InfoWindow({{
-          content: `
-            <div>
-              <h3>{name}</h3>
-              <a href="{camera_url}" target="_blank">
-                <img src="{image_url}" alt="{name}" style="width: 100px; height: auto;">
-              </a>
-              <p><a href="{camera_url}" target="_blank">View Camera</a></p>
-            </div>
-          `,
-        }});
-
-        marker.addListener("click", () => {{
-          infoWindow.open(map, marker);
-        }});
-    """
-
-# Step 4: Close the HTML content and the JavaScript
-html_content += """
+          marker.addListener("click", () => {
+            infoWindow.setContent(`
+              <div>
+                <h3>${camera.name}</h3>
+                <a href="${camera.cameraUrl}" target="_blank">
+                  <img src="${camera.imageUrl}" alt="${camera.name}" style="width: 100px; height: auto;">
+                </a>
+                <p><a href="${camera.cameraUrl}" target="_blank">View Camera</a></p>
+              </div>
+            `);
+            infoWindow.open(map, marker);
+          });
+        });
       }
     </script>
   </body>
 </html>
 """
+# The GeoJSON is embedded once as data instead of one block of code per camera
+html_content = html_content.replace("__API_KEY__", API_KEY).replace("__CAMERAS__", geojson.replace("</", "<\\/"))
 
-# Step 5: Write the HTML content to a file
+# Step 4: Write the HTML content to a file
 with open("camera_map.html", "w") as file:
     file.write(html_content)
 
-print("HTML file 'camera_map.html' has been generated!")
+print("HTML file 'camera_map.html' and 'cameras.geojson' have been generated!")
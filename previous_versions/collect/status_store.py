@@ -0,0 +1,148 @@
+"""
+Latest status of every camera, kept as one small record per camera:
+
+    {"camera_id", "camera_name", "last_path", "capture_time", "status", "failure_streak", "updated"}
+
+Writers add one delta object per run holding only the cameras that run touched,
+
+    metadata/status/changes/{YYYYmmddTHHMMSS}-{token}.json     [record, ...]
+
+and once enough of them have piled up, fold the old ones into a compact snapshot,
+
+    metadata/status/snapshot.json     {"through": <last folded delta>, "cameras": {camera_id: record}}
+
+Readers download the snapshot only when its generation changes and then only the
+deltas they have not applied yet, so both sides cost O(changed cameras) per run.
+"""
+import json
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+STATUS_PREFIX = 'metadata/status/'
+SNAPSHOT_PATH = STATUS_PREFIX + 'snapshot.json'
+CHANGES_PREFIX = STATUS_PREFIX + 'changes/'
+COMPACT_AFTER_CHANGES = 50
+# Only deltas this old are folded, so a run that is still flushing never ends up behind the snapshot
+COMPACT_MIN_AGE_SECONDS = 10 * 60
+
+
+def _change_name(when):
+    return f"{CHANGES_PREFIX}{when:%Y%m%dT%H%M%S}"
+
+
+class LatestStatusStore:
+    def __init__(self, bucket, timeout=60):
+        self.bucket = bucket
+        self.timeout = timeout  # seconds, for each storage call
+        self.records = {}
+        self.through = ''
+        self.snapshot_generation = None
+        self.applied = set()
+        self.changed = {}
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        """Bring the records up to date, returns True when anything changed."""
+        changed = False
+        blob = self.bucket.get_blob(SNAPSHOT_PATH, timeout=self.timeout)
+        generation = blob.generation if blob is not None else None
+        if generation != self.snapshot_generation:
+            snapshot = json.loads(blob.download_as_bytes(if_generation_match=generation, timeout=self.timeout)) if blob is not None else {}
+            with self.lock:
+                self.records = snapshot.get('cameras', {})
+                self.through = snapshot.get('through', '')
+                self.snapshot_generation = generation
+                self.applied = set()
+            changed = True
+
+        for delta in self.bucket.list_blobs(prefix=CHANGES_PREFIX, start_offset=self.through or None, timeout=self.timeout):
+            if delta.name <= self.through or delta.name in self.applied:
+                continue
+            records = json.loads(delta.download_as_bytes(timeout=self.timeout))
+            with self.lock:
+                for record in records:
+                    self.records[record['camera_id']] = record
+                self.applied.add(delta.name)
+            changed = True
+        return changed
+
+    def load(self):
+        try:
+            self.refresh()
+            logger.info(f"Loaded latest status for {len(self.records)} cameras.")
+        except Exception as e:
+            logger.error(f"Failed to load latest status, failure streaks restart at 0: {e}")
+        return self
+
+    def get(self, camera_id):
+        return self.records.get(camera_id)
+
+    def update(self, camera_id, camera_name, status, path=None, capture_time=None):
+        """
+        Record a camera's result as soon as it finishes.
+
+        The last stored frame (path, capture_time) is kept across runs that stored nothing
+        (errors, skipped or unchanged frames); failure_streak counts consecutive errors.
+        """
+        with self.lock:
+            previous = self.records.get(camera_id, {})
+            record = {
+                'camera_id': camera_id,
+                'camera_name': camera_name,
+                'last_path': path or previous.get('last_path', ''),
+                'capture_time': capture_time if path else previous.get('capture_time', ''),
+                'status': status,
+                'failure_streak': previous.get('failure_streak', 0) + 1 if status == 'error' else 0,
+                'updated': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            }
+            self.records[camera_id] = self.changed[camera_id] = record
+        return record
+
+    def flush(self):
+        """Write the records changed since the last flush as one delta object, returns its name."""
+        with self.lock:
+            records = list(self.changed.values())
+            self.changed = {}
+        if not records:
+            return None
+        name = f"{_change_name(datetime.now(timezone.utc))}-{uuid.uuid4().hex[:8]}.json"
+        self.bucket.blob(name).upload_from_string(json.dumps(records, separators=(',', ':')), 'application/json', timeout=self.timeout)
+        with self.lock:
+            self.applied.add(name)
+        logger.info(f"Wrote latest status of {len(records)} cameras to {name}")
+        return name
+
+    def compact(self, min_changes=COMPACT_AFTER_CHANGES, min_age_seconds=COMPACT_MIN_AGE_SECONDS):
+        """
+        Fold the deltas older than min_age_seconds into the snapshot once there are at least
+        min_changes of them, returns how many were folded.
+
+        Call after flush(). The snapshot is written before the folded deltas are deleted,
+        so a reader holding the old snapshot sees its generation change and reloads.
+        """
+        cutoff = _change_name(datetime.now(timezone.utc) - timedelta(seconds=min_age_seconds))
+        old = sorted(blob.name for blob in self.bucket.list_blobs(prefix=CHANGES_PREFIX, timeout=self.timeout) if blob.name < cutoff)
+        if len(old) < min_changes:
+            return 0
+
+        self.refresh()
+        with self.lock:
+            # Newer deltas may already be applied; they are applied again by readers, which is harmless
+            snapshot = {
+                'through': max(old[-1], self.through),
+                'updated': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'cameras': self.records,
+            }
+            payload = json.dumps(snapshot, separators=(',', ':'))
+        self.bucket.blob(SNAPSHOT_PATH).upload_from_string(payload, 'application/json', timeout=self.timeout)
+        for name in old:
+            try:
+                self.bucket.blob(name).delete(timeout=self.timeout)
+            except Exception as e:
+                logger.warning(f"Failed to delete folded status delta {name}: {e}")
+        logger.info(f"Folded {len(old)} status deltas into {SNAPSHOT_PATH}")
+        return len(old)
@@ -0,0 +1,155 @@
+"""
+Citywide bike-count analytics over detection results for every camera.
+
+Detection results (path, bike_count) are reduced to per-day summaries with one row per
+camera and hour. Summaries of closed days are cached on disk, so a query over a year
+reads 365 small files plus the raw results for today.
+"""
+import os
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+import pandas as pd
+
+SUMMARY_DIR = os.environ.get('ANALYTICS_SUMMARY_DIR', 'analytics_cache/daily')
+SUMMARY_COLUMNS = ['camera', 'date', 'hour', 'bike_sum', 'bike_max', 'frames']
+# data/{safe_name}/{Y}/{M}/{D}/{H}/{YYYYmmdd_HHMMSS}_{camera_id}.jpg
+PATH_PATTERN = r'^data/(?P<camera>[^/]+)/.*/(?P<timestamp>\d{8}_\d{6})_[^/]+\.jpg$'
+DAY_NAMES = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+
+def parse_results(df):
+    """
+    Add camera and capture timestamp columns parsed (vectorized) from the image paths.
+
+    Rows whose path does not follow the capture layout are dropped.
+    """
+    parts = df['path'].str.extract(PATH_PATTERN)
+    df = df.assign(
+        camera=parts['camera'],
+        timestamp=pd.to_datetime(parts['timestamp'], format='%Y%m%d_%H%M%S', errors='coerce'),
+    )
+    return df.dropna(subset=['camera', 'timestamp'])
+
+
+def summarize(df):
+    """Per camera/date/hour totals of parsed detection results."""
+    if df.empty:
+        return pd.DataFrame(columns=SUMMARY_COLUMNS)
+    grouped = df.groupby([df['camera'], df['timestamp'].dt.date.rename('date'), df['timestamp'].dt.hour.rename('hour')])
+    summary = grouped['bike_count'].agg(bike_sum='sum', bike_max='max', frames='size').reset_index()
+    return summary[SUMMARY_COLUMNS]
+
+
+class DailySummaryStore:
+    """
+    One CSV of summary rows per closed day, e.g. analytics_cache/daily/2024-11-02.csv.
+    """
+
+    def __init__(self, root=SUMMARY_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.load = lru_cache(maxsize=400)(self._load)
+
+    def path(self, day):
+        return os.path.join(self.root, f"{day.isoformat()}.csv")
+
+    def has(self, day):
+        return os.path.exists(self.path(day))
+
+    def _load(self, day):
+        if not self.has(day):
+            return None
+        summary = pd.read_csv(self.path(day))
+        summary['date'] = pd.to_datetime(summary['date']).dt.date
+        return summary
+
+    def save(self, day, summary):
+        summary.to_csv(self.path(day), index=False)
+        self.load.cache_clear()
+
+    def add_results(self, df, today=None):
+        """
+        Cache the summaries of every closed day found in parsed results; returns the days written.
+
+        The rows of the cameras in the results replace those cameras' rows in the day's
+        file, other cameras' rows are kept (the detector runs one camera at a time).
+        Today (and anything after) is left out: it is still filling up.
+        """
+        today = today or date.today()
+        summary = summarize(df)
+        written = []
+        for day, rows in summary.groupby('date'):
+            if day < today:
+                existing = self.load(day)
+                if existing is not None:
+                    others = existing[~existing['camera'].isin(rows['camera'])]
+                    rows = pd.concat([others, rows], ignore_index=True).sort_values(['camera', 'hour'])
+                self.save(day, rows)
+                written.append(day)
+        return written
+
+
+class BikeAnalytics:
+    """
+    Vectorized queries over the summaries of [start, end] for all cameras at once.
+
+    Closed days come from the store, the open day (today) is summarized from `today_results`.
+    """
+
+    def __init__(self, store, today_results=None, today=None):
+        self.store = store
+        self.today = today or date.today()
+        self.today_summary = summarize(parse_results(today_results)) if today_results is not None else None
+
+    def summaries(self, start, end):
+        frames = []
+        day = start
+        while day <= end:
+            if day >= self.today:
+                if self.today_summary is not None:
+                    frames.append(self.today_summary[self.today_summary['date'] == day])
+            else:
+                summary = self.store.load(day)
+                if summary is not None:
+                    frames.append(summary)
+            day += timedelta(days=1)
+        if not frames:
+            return pd.DataFrame(columns=SUMMARY_COLUMNS)
+        return pd.concat(frames, ignore_index=True)
+
+    def peak_hours(self, start, end):
+        """For each camera, the hour of day with the most bikes in total, and that total."""
+        summary = self.summaries(start, end)
+        by_hour = summary.groupby(['camera', 'hour'], as_index=False)['bike_sum'].sum()
+        peaks = by_hour.loc[by_hour.groupby('camera')['bike_sum'].idxmax()]
+        return peaks.rename(columns={'hour': 'peak_hour', 'bike_sum': 'bikes'}).set_index('camera')
+
+    def busiest_cameras(self, start, end, n=10):
+        """The n cameras with the most bikes in the window, with their frame count and average."""
+        summary = self.summaries(start, end)
+        totals = summary.groupby('camera').agg(bikes=('bike_sum', 'sum'), frames=('frames', 'sum'))
+        totals['bikes_per_frame'] = totals['bikes'] / totals['frames']
+        return totals.nlargest(n, 'bikes')
+
+    def day_of_week_profile(self, start, end, camera=None):
+        """Average bikes per frame by day of week (rows) and hour (columns)."""
+        summary = self.summaries(start, end)
+        if camera is not None:
+            summary = summary[summary['camera'] == camera]
+        dow = pd.to_datetime(summary['date']).dt.dayofweek.map(dict(enumerate(DAY_NAMES)))
+        grouped = summary.assign(dow=dow).groupby(['dow', 'hour'])[['bike_sum', 'frames']].sum()
+        profile = (grouped['bike_sum'] / grouped['frames']).unstack('hour')
+        return profile.reindex([d for d in DAY_NAMES if d in profile.index])
+
+    def citywide_totals(self, start, end):
+        """Bikes and frames per day summed over all cameras."""
+        summary = self.summaries(start, end)
+        return summary.groupby('date').agg(bikes=('bike_sum', 'sum'), frames=('frames', 'sum'), cameras=('camera', 'nunique'))
+
+    def hourly_profile_by_camera(self, start, end):
+        """{camera: [average bikes per frame for hours 0..23]}, as read by the scraper's poll scheduler."""
+        summary = self.summaries(start, end)
+        grouped = summary.groupby(['camera', 'hour'])[['bike_sum', 'frames']].sum()
+        profile = (grouped['bike_sum'] / grouped['frames']).unstack('hour').reindex(columns=range(24)).fillna(0)
+        return {camera: [round(v, 3) for v in row] for camera, row in zip(profile.index, profile.values.tolist())}
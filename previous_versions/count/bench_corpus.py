@@ -0,0 +1,106 @@
+"""
+Fetch (or publish) the labeled frame corpus bench_detect.py runs over.
+
+Corpus versions live in the bucket under bench/corpus/{version}/ and never change once
+published: labels.json holds the hand-labeled bike count and the sha256 of every frame,
+
+    {"version": "2025-11-v1",
+     "images": {"20251108_141621_cam.jpg": 0, ...},
+     "sha256": {"20251108_141621_cam.jpg": "9f2c...", ...}}
+
+and fetch checks each downloaded frame against it. CORPUS_VERSION pins the version the
+committed baselines were made with; bump it together with them.
+
+Usage:
+    python bench_corpus.py fetch --dest bench/corpus
+    python bench_corpus.py publish --source my_labeled_frames --version 2025-12-v1
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+from google.api_core.exceptions import PreconditionFailed
+from google.cloud import storage
+
+BUCKET_NAME = 'bike-crowding'
+CORPUS_PREFIX = 'bench/corpus/'
+CORPUS_VERSION = '2025-11-v1'
+
+
+def sha256_of(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def fetch(bucket, version, dest):
+    """Download a corpus version into dest, skipping frames already there with the right hash."""
+    prefix = f"{CORPUS_PREFIX}{version}/"
+    blob = bucket.get_blob(prefix + 'labels.json')
+    if blob is None:
+        raise SystemExit(f"gs://{bucket.name}/{prefix}labels.json not found, publish the corpus first")
+    labels = json.loads(blob.download_as_bytes(if_generation_match=blob.generation))
+    if labels.get('version') != version:
+        raise SystemExit(f"{prefix}labels.json is version {labels.get('version')}, expected {version}")
+
+    os.makedirs(dest, exist_ok=True)
+    fetched = 0
+    for name, digest in sorted(labels['sha256'].items()):
+        path = os.path.join(dest, name)
+        if os.path.exists(path) and sha256_of(path) == digest:
+            continue
+        bucket.blob(prefix + name).download_to_filename(path)
+        if sha256_of(path) != digest:
+            os.remove(path)
+            raise SystemExit(f"{name} does not match the sha256 in labels.json")
+        fetched += 1
+    # Written last, so an interrupted fetch is never mistaken for a complete corpus
+    with open(os.path.join(dest, 'labels.json'), 'w') as f:
+        json.dump(labels, f, indent=2)
+    print(f"Corpus {version}: {len(labels['images'])} frames in {dest} ({fetched} downloaded)")
+
+
+def publish(bucket, version, source):
+    """Upload a local labeled corpus (frames + labels.json without hashes) as a new version."""
+    with open(os.path.join(source, 'labels.json')) as f:
+        images = json.load(f)['images']
+    labels = {
+        'version': version,
+        'images': images,
+        'sha256': {name: sha256_of(os.path.join(source, name)) for name in sorted(images)},
+    }
+    prefix = f"{CORPUS_PREFIX}{version}/"
+    try:
+        # Versions are immutable: every object must not exist yet
+        for name in sorted(images):
+            bucket.blob(prefix + name).upload_from_filename(os.path.join(source, name), if_generation_match=0)
+        bucket.blob(prefix + 'labels.json').upload_from_string(
+            json.dumps(labels, indent=2), 'application/json', if_generation_match=0
+        )
+    except PreconditionFailed:
+        raise SystemExit(f"Corpus version {version} already exists, publish under a new version")
+    print(f"Published {len(images)} frames as gs://{bucket.name}/{prefix}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['fetch', 'publish'])
+    parser.add_argument('--version', default=CORPUS_VERSION)
+    parser.add_argument('--bucket', default=BUCKET_NAME)
+    parser.add_argument('--dest', default='bench/corpus', help='fetch: directory to write the corpus to')
+    parser.add_argument('--source', help='publish: directory with the frames and a labels.json')
+    args = parser.parse_args()
+
+    bucket = storage.Client().bucket(args.bucket)
+    if args.command == 'fetch':
+        fetch(bucket, args.version, args.dest)
+    else:
+        if not args.source:
+            parser.error('publish needs --source')
+        publish(bucket, args.version, args.source)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
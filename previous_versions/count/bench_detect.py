@@ -0,0 +1,300 @@
+"""
+Detection benchmark over a local, hand-labeled image corpus (no GCS).
+
+The corpus is a directory of frames with a labels.json next to them:
+
+    {"version": "2025-11-v1", "images": {"20251108_141621_cam.jpg": 0, ...}, "sha256": {...}}
+
+bench_corpus.py fetches the pinned version (bench_corpus.CORPUS_VERSION) from the bucket.
+
+Every (worker count, batch size) combination runs the stages of count/main.py over
+the whole corpus in a process pool and reports:
+
+    images_per_sec      corpus images / wall time of the pool run
+    stages              decode, preprocess, forward and postprocess latency per image (ms)
+    load_ms             network load per worker (once per process, not in the stages)
+    peak_rss_mb         peak resident memory of each worker
+    count error         mean absolute error and bias against the labels, exact-match rate
+
+--postprocess nms counts bicycles after non-maximum suppression, like count_objects in
+analysis/main.py; the default counts raw detections like _detect_bikes_in_single_image.
+
+Usage:
+    python bench_corpus.py fetch --dest bench/corpus
+    python bench_detect.py --corpus bench/corpus --workers 1,4 --batch-sizes 1,8 --output bench/baseline.json
+    python bench_detect.py --corpus bench/corpus --workers 1,4 --batch-sizes 1,8 --compare bench/baseline.json
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from main import count_bicycles, decode_image, forward, load_network, preprocess
+
+STAGES = ('decode', 'preprocess', 'forward', 'postprocess')
+DEFAULT_TOLERANCE = 0.10
+WARM_UP_TIMEOUT = 300  # seconds a worker may take to load the network
+
+_network_paths = None
+_load_ms = 0.0
+
+
+def count_bicycles_nms(outs, classes, images, threshold=0.5, nms_threshold=0.4):
+    """Bicycles per image kept by non-maximum suppression (the count_objects rules)."""
+    bicycle = classes.index('bicycle')
+    counts = []
+    for i, img in enumerate(images):
+        height, width = img.shape[:2]
+        boxes, confidences = [], []
+        for out in outs:
+            out = out.reshape(len(images), -1, out.shape[-1])[i]
+            scores = out[:, 5:]
+            keep = (scores.argmax(axis=1) == bicycle) & (scores.max(axis=1) > threshold)
+            for detection, confidence in zip(out[keep], scores[keep].max(axis=1)):
+                w, h = detection[2] * width, detection[3] * height
+                boxes.append([int(detection[0] * width - w / 2), int(detection[1] * height - h / 2), int(w), int(h)])
+                confidences.append(float(confidence))
+        counts.append(len(cv2.dnn.NMSBoxes(boxes, confidences, threshold, nms_threshold)) if boxes else 0)
+    return counts
+
+
+def peak_rss_mb():
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+
+def init_worker(ready, weights_path, cfg_path, names_path):
+    global _network_paths, _load_ms
+    _network_paths = (weights_path, cfg_path, names_path)
+    start = time.perf_counter()
+    load_network(*_network_paths)
+    _load_ms = (time.perf_counter() - start) * 1000
+    ready.release()
+
+
+def run_batch(task):
+    """Detect bicycles in one batch of corpus files, timing each stage."""
+    paths, postprocess = task
+    net, output_layers, classes = load_network(*_network_paths)
+    timings = {}
+
+    start = time.perf_counter()
+    images = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            images.append(decode_image(f.read()))
+    timings['decode'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    blob = preprocess(images)
+    timings['preprocess'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    outs = forward(net, output_layers, blob)
+    timings['forward'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if postprocess == 'nms':
+        counts = count_bicycles_nms(outs, classes, images)
+    else:
+        counts = count_bicycles(outs, classes, len(images))
+    timings['postprocess'] = time.perf_counter() - start
+
+    return {
+        'pid': os.getpid(),
+        'counts': dict(zip((os.path.basename(p) for p in paths), counts)),
+        # Per image, so batch sizes compare directly
+        'stage_ms': {stage: seconds * 1000 / len(paths) for stage, seconds in timings.items()},
+        'load_ms': _load_ms,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def load_corpus(corpus_dir):
+    with open(os.path.join(corpus_dir, 'labels.json')) as f:
+        corpus = json.load(f)
+    missing = [name for name in corpus['images'] if not os.path.exists(os.path.join(corpus_dir, name))]
+    if missing:
+        raise SystemExit(f"{len(missing)} labeled images missing from {corpus_dir}, e.g. {missing[0]}")
+    for name, digest in corpus.get('sha256', {}).items():
+        with open(os.path.join(corpus_dir, name), 'rb') as f:
+            if hashlib.sha256(f.read()).hexdigest() != digest:
+                raise SystemExit(f"{name} differs from corpus {corpus['version']}, fetch it again")
+    return corpus
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def run_config(corpus_dir, labels, network_paths, workers, batch_size, postprocess, repeat):
+    names = sorted(labels)
+    batches = [
+        ([os.path.join(corpus_dir, name) for name in names[i:i + batch_size]], postprocess)
+        for i in range(0, len(names), batch_size)
+    ] * repeat
+
+    ready = multiprocessing.Semaphore(0)
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=(ready, *network_paths)) as pool:
+        # Every worker has loaded the network (its initializer released once) before the clock starts
+        for _ in range(workers):
+            if not ready.acquire(timeout=WARM_UP_TIMEOUT):
+                raise SystemExit(f"Workers did not load the network within {WARM_UP_TIMEOUT}s")
+        start = time.perf_counter()
+        results = pool.map(run_batch, batches, chunksize=1)
+        wall = time.perf_counter() - start
+        pool.close()
+        pool.join()
+
+    counts = {}
+    per_image = {stage: [] for stage in STAGES}
+    per_worker = {}
+    for result in results:
+        counts.update(result['counts'])
+        for stage in STAGES:
+            per_image[stage].extend([result['stage_ms'][stage]] * len(result['counts']))
+        worker = per_worker.setdefault(result['pid'], {'load_ms': 0.0, 'peak_rss_mb': 0.0, 'images': 0})
+        worker['load_ms'] = result['load_ms']
+        worker['peak_rss_mb'] = max(worker['peak_rss_mb'], result['peak_rss_mb'])
+        worker['images'] += len(result['counts'])
+
+    errors = [counts[name] - labels[name] for name in names]
+    return {
+        'workers': workers,
+        'batch_size': batch_size,
+        'images': len(names) * repeat,
+        'wall_s': round(wall, 3),
+        'images_per_sec': round(len(names) * repeat / wall, 3),
+        'stages': {
+            stage: {
+                'mean_ms': round(statistics.fmean(values), 3),
+                'p50_ms': round(percentile(values, 50), 3),
+                'p95_ms': round(percentile(values, 95), 3),
+            }
+            for stage, values in per_image.items()
+        },
+        'workers_detail': [
+            {key: round(value, 1) if isinstance(value, float) else value for key, value in w.items()}
+            for w in per_worker.values()
+        ],
+        'peak_rss_mb': round(max(w['peak_rss_mb'] for w in per_worker.values()), 1),
+        'mae': round(statistics.fmean(abs(e) for e in errors), 4),
+        'bias': round(statistics.fmean(errors), 4),
+        'exact_match': round(sum(e == 0 for e in errors) / len(errors), 4),
+        'counts': {name: counts[name] for name in names},
+    }
+
+
+def config_key(result):
+    return f"workers={result['workers']},batch={result['batch_size']}"
+
+
+def compare(baseline, current, tolerance, count_tolerance):
+    """Regressions of current against baseline, one message each."""
+    regressions = []
+    if baseline.get('corpus_version') != current['corpus_version']:
+        regressions.append(f"corpus version {current['corpus_version']} != baseline {baseline.get('corpus_version')}")
+    if baseline.get('postprocess') != current['postprocess']:
+        regressions.append(f"postprocess {current['postprocess']} != baseline {baseline.get('postprocess')}")
+    old_results = {config_key(r): r for r in baseline['results']}
+    for new in current['results']:
+        key = config_key(new)
+        old = old_results.get(key)
+        if old is None:
+            print(f"{key}: not in baseline, skipped", file=sys.stderr)
+            continue
+        if new['images_per_sec'] < old['images_per_sec'] * (1 - tolerance):
+            regressions.append(f"{key}: images_per_sec {new['images_per_sec']} < baseline {old['images_per_sec']}")
+        for stage in STAGES:
+            was, now = old['stages'][stage]['p50_ms'], new['stages'][stage]['p50_ms']
+            if now > was * (1 + tolerance):
+                regressions.append(f"{key}: {stage} p50 {now} ms > baseline {was} ms")
+        if new['peak_rss_mb'] > old['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{key}: peak_rss_mb {new['peak_rss_mb']} > baseline {old['peak_rss_mb']}")
+        if new['mae'] > old['mae'] + count_tolerance:
+            regressions.append(f"{key}: count MAE {new['mae']} > baseline {old['mae']}")
+        changed = [name for name, count in new['counts'].items() if old['counts'].get(name, count) != count]
+        if changed:
+            # Not a regression by itself (counts may get better), but worth knowing about
+            print(f"{key}: {len(changed)} image counts changed, e.g. {changed[0]}", file=sys.stderr)
+    return regressions
+
+
+def parse_ints(value):
+    return [int(v) for v in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', default='bench/corpus', help='directory with the frames and labels.json')
+    parser.add_argument('--weights', default='yolov3.weights')
+    parser.add_argument('--cfg', default='yolov3.cfg')
+    parser.add_argument('--names', default='coco.names')
+    parser.add_argument('--workers', type=parse_ints, default=[1], help='comma-separated worker counts')
+    parser.add_argument('--batch-sizes', type=parse_ints, default=[1], help='comma-separated batch sizes')
+    parser.add_argument('--postprocess', choices=['raw', 'nms'], default='raw')
+    parser.add_argument('--repeat', type=int, default=1, help='passes over the corpus per configuration')
+    parser.add_argument('--output', help='write results (usable as a baseline) to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON to check the results against; exit 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='allowed relative slowdown / memory growth (default 0.10)')
+    parser.add_argument('--count-tolerance', type=float, default=0.0, help='allowed increase of the count MAE')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    network_paths = (args.weights, args.cfg, args.names)
+    # Fail here rather than in pool initializers, which the pool would keep restarting.
+    # Not cached, so forked workers still pay (and report) their own load.
+    load_network.__wrapped__(*network_paths)
+    results = []
+    for workers in args.workers:
+        for batch_size in args.batch_sizes:
+            result = run_config(args.corpus, corpus['images'], network_paths, workers, batch_size,
+                                args.postprocess, args.repeat)
+            print(f"{config_key(result)}: {result['images_per_sec']} img/s, "
+                  f"forward p50 {result['stages']['forward']['p50_ms']} ms, "
+                  f"peak RSS {result['peak_rss_mb']} MB, MAE {result['mae']}")
+            results.append(result)
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'corpus_version': corpus['version'],
+        'postprocess': args.postprocess,
+        'environment': {
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'machine': platform.machine(),
+            'cpu_count': multiprocessing.cpu_count(),
+            'cfg': os.path.basename(args.cfg),
+        },
+        'results': results,
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.tolerance, args.count_tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,108 +1,359 @@
 import os
 import tempfile
+from google.api_core.exceptions import NotFound, PreconditionFailed
 from google.cloud import storage
 import cv2
 import io
+import json
 import numpy as np
 import pandas as pd
-from datetime import datetime
+from datetime import date, datetime, timedelta
 import multiprocessing
 from functools import lru_cache
+import argparse
+import zlib
+
+from analytics import BikeAnalytics, DailySummaryStore, parse_results
+from sampling_profiler import merge_profiles, profile_enabled, profiled, start_worker_profiler
+
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+# Read by the scraper's adaptive polling (poll_schedule.BIKE_COUNTS_PATH)
+BIKE_COUNTS_PATH = 'metadata/bike_counts_by_hour.json'
+BIKE_COUNTS_DAYS = 28  # closed days the published hourly profile averages over
+# Cameras (safe names) bikes are counted on; the scraper's retention job reads the same setting
+DETECTION_CAMERAS = [c for c in os.environ.get('DETECTION_CAMERAS', 'Central_Park___72nd_St_Post_37').split(',') if c]
 
 
 @lru_cache
 def get_storage_client():
     return storage.Client()
 
+
+@lru_cache(maxsize=256)
+def get_pack_index(bucket_name, hour_prefix):
+    """
+    Frame name -> (archive, generation, offset, length) for a packed hour, or None.
+
+    Hours are packed by the scraper into packed/{safe_name}/{Y}/{M}/{D}/{H}.jpgpack with
+    a sidecar {H}.index.json; this lets the old data/... paths resolve to the archive.
+    Cached per process; get_uri_as_bytes clears the cache when a read shows it is stale.
+    """
+    index_name = 'packed/' + hour_prefix[len('data/'):].rstrip('/') + '.index.json'
+    blob = get_storage_client().bucket(bucket_name).get_blob(index_name)
+    if blob is None:
+        return None
+    index = json.loads(blob.download_as_bytes())
+    return {
+        frame['name']: (index['archive'], index['generation'], frame['offset'], frame['length'])
+        for frame in index['frames']
+    }
+
+
+# Detection stages, kept separate so bench_detect.py can time each one
+@lru_cache
+def load_network(weights_path, cfg_path, names_path):
+    """(net, output layer names, class names), loaded once per process."""
+    net = cv2.dnn.readNet(weights_path, cfg_path)
+    with open(names_path, 'r') as f:
+        classes = [line.strip() for line in f.readlines()]
+    layer_names = net.getLayerNames()
+    output_layers = [layer_names[i - 1] for i in np.array(net.getUnconnectedOutLayers()).flatten()]
+    return net, output_layers, classes
+
+
+def decode_image(data):
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Failed to decode image from the provided bytes.")
+    return img
+
+
+def preprocess(images):
+    """One 416x416 input blob for a batch of decoded images."""
+    return cv2.dnn.blobFromImages(images, 0.00392, (416, 416), (0, 0, 0), True, crop=False)
+
+
+def forward(net, output_layers, blob):
+    net.setInput(blob)
+    return net.forward(output_layers)
+
+
+def count_bicycles(outs, classes, batch_size=1, threshold=0.5):
+    """
+    Bicycle detections above threshold for each image of the batch.
+
+    YOLO outputs are (rows, 85) for a single image and (batch, rows, 85) for a batch.
+    """
+    bicycle = classes.index('bicycle')
+    counts = np.zeros(batch_size, dtype=int)
+    for out in outs:
+        out = out.reshape(batch_size, -1, out.shape[-1])
+        scores = out[:, :, 5:]
+        best = scores.argmax(axis=2)
+        confident = scores.max(axis=2) > threshold
+        counts += ((best == bicycle) & confident).sum(axis=1)
+    return counts.tolist()
+
+
+def max_bicycle_scores(outs, classes, batch_size=1):
+    """Highest bicycle score of any box in each image of the batch, whichever class the box is."""
+    bicycle = classes.index('bicycle')
+    best = np.zeros(batch_size)
+    for out in outs:
+        out = out.reshape(batch_size, -1, out.shape[-1])
+        best = np.maximum(best, out[:, :, 5 + bicycle].max(axis=1))
+    return best.tolist()
+
+
+class CascadePolicy:
+    """
+    When a frame scored by the fast model goes on to the full network.
+
+    A frame escalates when the fast model gives any box a bicycle score of at least the
+    camera's threshold. The thresholds sit well below the 0.5 count threshold, so both
+    frames with bicycle candidates and frames the fast model is unsure about escalate;
+    the rest are counted as 0 bikes. cascade_thresholds.json holds the thresholds:
+
+        {"default": 0.15, "cameras": {"Central_Park___72nd_St_Post_37": 0.1}, "audit_rate": 0.05}
+
+    A threshold of 0 sends every frame of a camera to the full network. audit_rate is the
+    share of frames (picked by path, so reruns audit the same frames) that run both models
+    to measure how often the cascade count agrees with the full network's.
+    """
+
+    DEFAULT_PATH = 'cascade_thresholds.json'
+    DEFAULT_THRESHOLD = 0.15
+    DEFAULT_AUDIT_RATE = 0.05
+
+    def __init__(self, thresholds=None, default=DEFAULT_THRESHOLD, audit_rate=DEFAULT_AUDIT_RATE):
+        self.thresholds = thresholds or {}
+        self.default = default
+        self.audit_rate = audit_rate
+
+    @classmethod
+    def load(cls, path=DEFAULT_PATH):
+        if not os.path.exists(path):
+            return cls()
+        with open(path) as f:
+            config = json.load(f)
+        return cls(
+            config.get('cameras', {}),
+            config.get('default', cls.DEFAULT_THRESHOLD),
+            config.get('audit_rate', cls.DEFAULT_AUDIT_RATE),
+        )
+
+    def threshold(self, camera):
+        return self.thresholds.get(camera, self.default)
+
+    def escalate(self, camera, score):
+        return score >= self.threshold(camera)
+
+    def audited(self, image_uri):
+        return zlib.crc32(image_uri.encode()) % 10000 < self.audit_rate * 10000
+
+
+def cascade_report(frames):
+    """
+    Escalation rate and count agreement per camera and overall, from the info dicts
+    returned by _detect_bikes_cascade.
+
+    Escalated frames are counted by the full network, so they agree by definition; the
+    agreement of the others is estimated from the audited ones. audit_agreement and
+    est_agreement are None (unavailable) when frames were skipped but none was audited.
+    """
+    df = pd.DataFrame(frames)
+    audited = df[~df['escalated']].dropna(subset=['full_count'])
+
+    def summarize(group, audited):
+        escalation_rate = group['escalated'].mean()
+        agree = round((audited['full_count'] == 0).mean(), 3) if len(audited) else None
+        if escalation_rate == 1:
+            est_agreement = 1.0
+        elif agree is None:
+            est_agreement = None
+        else:
+            est_agreement = round(escalation_rate + (1 - escalation_rate) * agree, 3)
+        return {
+            'frames': len(group),
+            'escalated': int(group['escalated'].sum()),
+            'escalation_rate': round(escalation_rate, 3),
+            'full_forwards_saved': round(group['full_count'].isna().mean(), 3),
+            'audited': len(audited),
+            'audit_agreement': agree,
+            'audit_missed_bikes': int(audited['full_count'].sum()),
+            'est_agreement': est_agreement,
+        }
+
+    report = {'overall': summarize(df, audited), 'cameras': {}}
+    for camera, group in df.groupby('camera'):
+        report['cameras'][camera] = summarize(group, audited[audited['camera'] == camera])
+    return report
+
+
 class ParallelBikeDetector:
-    def __init__(self, bucket_name, weights_path, cfg_path, names_path):
+    def __init__(self, bucket_name, weights_path, cfg_path, names_path, rendition=None,
+                 fast_weights_path=None, fast_cfg_path=None, cascade_policy=None):
         """
         Initialize detector with Google Cloud Storage and YOLO
+
+        rendition: prefix of the 416x416 copies written by the scraper at ingest (RENDITIONS
+        includes 'detect'), read instead of the full frame when present. None, the default,
+        always reads the full frame, so no request is spent on copies that were never written
+        fast_weights_path, fast_cfg_path: a small model (e.g. yolov3-tiny) that scores every
+        frame first; only the frames cascade_policy escalates run the full network
         """
         # self.storage_client = storage.Client()
         self.bucket_name = bucket_name
+        self.rendition = rendition
         self.weights_path = weights_path
         self.cfg_path = cfg_path
         self.names_path = names_path
+        self.fast_weights_path = fast_weights_path
+        self.fast_cfg_path = fast_cfg_path
+        self.cascade_policy = cascade_policy or CascadePolicy()
+        self.cascade_stats = None
+
+    @property
+    def cascade(self):
+        return bool(self.fast_weights_path and self.fast_cfg_path)
 
 
     def get_uri_as_bytes(self, uri: str) -> io.BytesIO:
                 
         storage_client = get_storage_client()
         bucket = storage_client.bucket(self.bucket_name)
-        blob = bucket.blob(uri)
-        
+
         # Download the file content into a BytesIO object
         file_content = io.BytesIO()
-        blob.download_to_file(file_content)
-        
+        if self.rendition:
+            try:
+                bucket.blob(f"{self.rendition}/{uri}").download_to_file(file_content)
+                file_content.seek(0)
+                return file_content
+            except NotFound:
+                file_content = io.BytesIO()
+
+        hour_prefix, _, name = uri.rpartition('/')
+        for attempt in range(2):
+            packed = get_pack_index(self.bucket_name, hour_prefix + '/') if uri.startswith('data/') else None
+            try:
+                if packed and name in packed:
+                    # Ranged read of just this frame out of the hour's archive
+                    archive, generation, offset, length = packed[name]
+                    bucket.blob(archive).download_to_file(
+                        file_content, start=offset, end=offset + length - 1, if_generation_match=generation
+                    )
+                else:
+                    bucket.blob(uri).download_to_file(file_content)
+                break
+            except (NotFound, PreconditionFailed):
+                # The hour was packed or rewritten since its index was cached
+                if attempt:
+                    raise
+                get_pack_index.cache_clear()
+                file_content = io.BytesIO()
+
         # Seek to the beginning of the BytesIO object so it can be read
         file_content.seek(0)
         
         return file_content
 
 
+    def list_image_uris(self, bucket, safe_name):
+        """
+        Frame paths for a camera, both per-file objects and frames packed into hourly archives.
+
+        Frames the scraper's quality gate tagged (dark, flat, placeholder) are left out.
+        """
+        blobs = list(bucket.list_blobs(prefix=f'data/{safe_name}/'))
+        image_uris = [x.name for x in blobs if x.name.endswith('.jpg') and not (x.metadata or {}).get('quality')]
+        for index_blob in bucket.list_blobs(prefix=f'packed/{safe_name}/'):
+            if not index_blob.name.endswith('.index.json'):
+                continue
+            hour_prefix = 'data/' + index_blob.name[len('packed/'):-len('.index.json')] + '/'
+            index = json.loads(index_blob.download_as_bytes())
+            image_uris.extend(hour_prefix + frame['name'] for frame in index['frames'] if not frame.get('quality'))
+        return sorted(set(image_uris))
+
+    @staticmethod
+    def _parse_timestamp(image_uri):
+        try:
+            # {YYYYmmdd}_{HHMMSS}_{camera_id}.jpg
+            filename = os.path.basename(image_uri)
+            timestamp_str = '_'.join(filename.split('_')[:2])
+            return datetime.strptime(timestamp_str, '%Y%m%d_%H%M%S')
+        except Exception:
+            return None
+
     def _detect_bikes_in_single_image(self, image_uri):
         """
         Detect bikes in a single image
         """
-        # Load YOLO for each process
-        net = cv2.dnn.readNet(self.weights_path, self.cfg_path)
-        
-        # Load class names
-        with open(self.names_path, 'r') as f:
-            classes = [line.strip() for line in f.readlines()]
-        
-        # Get output layer names
-        layer_names = net.getLayerNames()
-        output_layers = [layer_names[i - 1] for i in net.getUnconnectedOutLayers()]
+        # Loaded once per process
+        net, output_layers, classes = load_network(self.weights_path, self.cfg_path, self.names_path)
 
         # Read image
         file_content = self.get_uri_as_bytes(image_uri)
-        # Read image using cv2 (convert BytesIO to numpy array)
-        img_array = np.asarray(bytearray(file_content.read()), dtype=np.uint8)
-        
-        # Decode image
-        img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)  # or use cv2.IMREAD_GRAYSCALE for grayscale images
-        
-        if img is None:
-            raise ValueError("Failed to decode image from the provided bytes.")
-        
-        
+        img = decode_image(file_content.read())
+
         # Prepare image for YOLO
-        blob = cv2.dnn.blobFromImage(img, 0.00392, (416, 416), (0, 0, 0), True, crop=False)
-        net.setInput(blob)
-        outs = net.forward(output_layers)
+        outs = forward(net, output_layers, preprocess([img]))
         print('gs://bike-crowding/'+image_uri)
         # Count bikes
-        bike_count = 0
-        for out in outs:
-            for detection in out:
-                scores = detection[5:]
-                class_id = np.argmax(scores)
-                confidence = scores[class_id]
-                if classes[class_id] == 'bicycle' and confidence > 0.5:
-                    bike_count += 1
-        # Parse timestamp from filename
-        try:
-            filename = os.path.basename(image_uri)
-            timestamp_str = filename.split('_')[0]
-            timestamp = datetime.strptime(timestamp_str, '%Y%m%d')
-        except Exception:
-            timestamp = None
+        bike_count = count_bicycles(outs, classes)[0]
+
+        return (image_uri, bike_count, self._parse_timestamp(image_uri))
+
+    def _detect_bikes_cascade(self, image_uri):
+        """
+        Detect bikes with the fast model first, escalating to the full network per the
+        cascade policy. Returns (path, bike_count, timestamp, info) where info holds the
+        camera, the fast model's bicycle score and the full network's count (None when it
+        did not run).
+        """
+        fast_net, fast_layers, classes = load_network(self.fast_weights_path, self.fast_cfg_path, self.names_path)
 
-        return (image_uri, bike_count, timestamp)
+        file_content = self.get_uri_as_bytes(image_uri)
+        blob = preprocess([decode_image(file_content.read())])
+
+        # data/{safe_name}/{Y}/{M}/{D}/{H}/{file}
+        camera = image_uri.split('/')[1]
+        score = max_bicycle_scores(forward(fast_net, fast_layers, blob), classes)[0]
+        escalated = self.cascade_policy.escalate(camera, score)
+
+        full_count = None
+        if escalated or self.cascade_policy.audited(image_uri):
+            net, output_layers, classes = load_network(self.weights_path, self.cfg_path, self.names_path)
+            full_count = count_bicycles(forward(net, output_layers, blob), classes)[0]
+        bike_count = full_count if escalated else 0
+        print('gs://bike-crowding/' + image_uri, 'escalated' if escalated else 'fast')
 
-    def process_images_parallel(self, num_cores=None):
+        info = {'camera': camera, 'score': round(score, 4), 'escalated': escalated, 'full_count': full_count}
+        return (image_uri, bike_count, self._parse_timestamp(image_uri), info)
+
+    def process_images_parallel(self, num_cores=None, profile=None):
         """
         Process images in parallel from downloaded directory
+
+        profile: sample the parent and every pool worker, writing collapsed stacks and
+        top-function summaries to profiles/{timestamp}/ (defaults to the PROFILE env var)
         """
+        if profile is None:
+            profile = profile_enabled()
+        profile_dir = os.path.join(PROFILE_DIR, datetime.now().strftime('%Y%m%d_%H%M%S'))
 
+        with profiled('parent', profile_dir, enabled=profile):
+            df = self._process_images_parallel(num_cores, profile_dir if profile else None)
+        if profile:
+            merge_profiles(profile_dir)
+            print(f"Profile written to {profile_dir}")
+        return df
+
+    def _process_images_parallel(self, num_cores, profile_dir):
         storage_client = get_storage_client()
         bucket = storage_client.bucket(self.bucket_name)
       
-        blobs = list(bucket.list_blobs(prefix='data/Central_Park___72nd_St_Post_37/'))
-        image_uris = [x.name for x in blobs if x.name.endswith('.jpg')]
+        image_uris = [uri for camera in DETECTION_CAMERAS for uri in self.list_image_uris(bucket, camera)]
 
         # Use all available cores if not specified
         if num_cores is None:
@@ -114,16 +365,85 @@ class ParallelBikeDetector:
         #     results.append(self._detect_bikes_in_single_image(image_uri))
         
 
-        with multiprocessing.Pool(num_cores) as pool:
-            results = pool.map(self._detect_bikes_in_single_image, image_uris)
+        pool_kwargs = {}
+        if profile_dir:
+            pool_kwargs = {'initializer': start_worker_profiler, 'initargs': (profile_dir,)}
+        with multiprocessing.Pool(num_cores, **pool_kwargs) as pool:
+            detect = self._detect_bikes_cascade if self.cascade else self._detect_bikes_in_single_image
+            results = pool.map(detect, image_uris)
+            # Let the workers exit normally so their profiles get written
+            pool.close()
+            pool.join()
+
+        if self.cascade and results:
+            self.cascade_stats = cascade_report([result[3] for result in results])
+            results = [result[:3] for result in results]
 
-    
         # Convert to DataFrame
         df = pd.DataFrame(results, columns=['path', 'bike_count', 'timestamp'])
         df = df.dropna(subset=['timestamp'])
 
         return df
 
+    def export_detections(self, df, attempts=5):
+        """
+        Merge detection results into metadata/detections/{YYYY-MM-DD}.json, one object per
+        capture day:
+
+            {"frames": {path: bike_count}, "cameras": {safe_name: last path checked}}
+
+        frames holds the frames with bikes; cameras records, per camera, how far through the
+        day the detector got. The scraper's retention job keeps the frames with bikes when it
+        thins old days, only thins cameras listed here, and keeps their frames after the last
+        path checked. Writes are conditional on the generation read, so concurrent runs merge.
+        """
+        bucket = get_storage_client().bucket(self.bucket_name)
+        df = df.assign(camera=df['path'].str.split('/').str[1])
+        written = []
+        for day, rows in df.groupby(df['timestamp'].dt.date):
+            name = f"metadata/detections/{day.isoformat()}.json"
+            for attempt in range(attempts):
+                blob = bucket.get_blob(name)
+                generation = blob.generation if blob is not None else 0
+                detections = json.loads(blob.download_as_bytes(if_generation_match=generation)) if blob is not None else {}
+                frames = detections.get('frames', {})
+                cameras = detections.get('cameras', {})
+                frames.update({path: int(count) for path, count in zip(rows['path'], rows['bike_count']) if count > 0})
+                for camera, last_path in rows.groupby('camera')['path'].max().items():
+                    cameras[camera] = max(cameras.get(camera, ''), last_path)
+                try:
+                    bucket.blob(name).upload_from_string(
+                        json.dumps({'frames': frames, 'cameras': cameras}, separators=(',', ':')),
+                        'application/json', if_generation_match=generation,
+                    )
+                    break
+                except PreconditionFailed:
+                    if attempt == attempts - 1:
+                        raise
+            written.append(day)
+        return written
+
+    def publish_bike_counts(self, profile, attempts=5):
+        """
+        Merge {safe_name: [average bikes per frame for hours 0..23]} into BIKE_COUNTS_PATH,
+        so the scraper polls cameras more often at their busy hours. Cameras not in the
+        profile keep their published values.
+        """
+        bucket = get_storage_client().bucket(self.bucket_name)
+        for attempt in range(attempts):
+            blob = bucket.get_blob(BIKE_COUNTS_PATH)
+            generation = blob.generation if blob is not None else 0
+            counts = json.loads(blob.download_as_bytes(if_generation_match=generation)) if blob is not None else {}
+            counts.update(profile)
+            try:
+                bucket.blob(BIKE_COUNTS_PATH).upload_from_string(
+                    json.dumps(counts, separators=(',', ':')), 'application/json', if_generation_match=generation
+                )
+                return counts
+            except PreconditionFailed:
+                if attempt == attempts - 1:
+                    raise
+
     def analyze_bike_data(self, df):
         """
         Analyze bike detection results
@@ -142,19 +462,45 @@ class ParallelBikeDetector:
         }
 
 def main():
+    parser = argparse.ArgumentParser(description='Count bikes in the Central Park camera images')
+    parser.add_argument('--profile', action='store_true', help='sample the run and its workers (same as PROFILE=1)')
+    parser.add_argument('--export-detections', action='store_true', help='write frames with bikes to metadata/detections/ for the retention job')
+    parser.add_argument('--cascade', action='store_true', help='score frames with the fast model first, see CascadePolicy')
+    parser.add_argument('--fast-weights', default='yolov3-tiny.weights')
+    parser.add_argument('--fast-cfg', default='yolov3-tiny.cfg')
+    parser.add_argument('--cascade-thresholds', default=CascadePolicy.DEFAULT_PATH, help='per-camera escalation thresholds')
+    parser.add_argument('--audit-rate', type=float, help='share of frames that also run the full network (overrides the thresholds file)')
+    args = parser.parse_args()
+
     # YOLO file paths
     weights_path = 'yolov3.weights'
     cfg_path = 'yolov3.cfg'
     names_path = 'coco.names'
     
-    # Google Cloud Storage bucket name
-    bucket_name = 'bike-crowding'
+    # Google Cloud Storage bucket name; BUCKET_NAME=nyc-webcam-capture to read and publish
+    # to the scraper's bucket
+    bucket_name = os.environ.get('BUCKET_NAME', 'bike-crowding')
     
+    # Read the 416x416 copies only when the scraper is configured to write them (same env var)
+    rendition = 'detect' if 'detect' in os.environ.get('RENDITIONS', '').split(',') else None
+
     # Initialize detector
-    detector = ParallelBikeDetector(bucket_name, weights_path, cfg_path, names_path)
+    cascade = {}
+    if args.cascade:
+        policy = CascadePolicy.load(args.cascade_thresholds)
+        if args.audit_rate is not None:
+            policy.audit_rate = args.audit_rate
+        cascade = {'fast_weights_path': args.fast_weights, 'fast_cfg_path': args.fast_cfg, 'cascade_policy': policy}
+    # Checked here: a missing file would otherwise fail in every worker of the pool
+    model_files = [weights_path, cfg_path, names_path] + ([args.fast_weights, args.fast_cfg] if args.cascade else [])
+    missing = [path for path in model_files if not os.path.exists(path)]
+    if missing:
+        parser.error(f"model files not found: {', '.join(missing)} (the --cascade yolov3-tiny files are not "
+                     f"in the repo, the Detection Cascade section of the README shows how to download them)")
+    detector = ParallelBikeDetector(bucket_name, weights_path, cfg_path, names_path, rendition=rendition, **cascade)
     
     # Process images
-    bike_data = detector.process_images_parallel()
+    bike_data = detector.process_images_parallel(profile=args.profile or None)
     
     # Analyze results
     analysis = detector.analyze_bike_data(bike_data)
@@ -164,6 +510,35 @@ def main():
     print(f"Maximum Bike Count in Single Image: {analysis['max_bike_count']}")
     print(f"Peak Bike Hour: {analysis['peak_bike_hour']}")
     print(f"Total Bikes Detected: {analysis['total_bikes']}")
+    if detector.cascade_stats:
+        overall = detector.cascade_stats['overall']
+        print(f"Cascade: {overall['escalation_rate']:.1%} of {overall['frames']} frames escalated, "
+              f"{overall['full_forwards_saved']:.1%} of full-network passes saved")
+        if overall['est_agreement'] is None:
+            print("Cascade agreement with the full network: unavailable, no skipped frame was audited")
+        elif overall['audit_agreement'] is None:
+            print(f"Cascade agreement with the full network: {overall['est_agreement']:.1%} (every frame escalated)")
+        else:
+            print(f"Cascade agreement with the full network: {overall['audit_agreement']:.1%} of "
+                  f"{overall['audited']} audited frames, {overall['est_agreement']:.1%} estimated overall")
+        for camera, stats in detector.cascade_stats['cameras'].items():
+            print(f"  {camera}: {stats}")
+
+    if args.export_detections:
+        days = detector.export_detections(bike_data)
+        print(f"Exported detections for {len(days)} days")
+
+    # Cache the closed days for citywide queries (see analytics.py)
+    store = DailySummaryStore()
+    written = store.add_results(parse_results(bike_data))
+    print(f"Cached daily summaries: {len(written)} days")
+
+    # Hourly bike profile of the cameras in the cache, for the scraper's adaptive polling
+    yesterday = date.today() - timedelta(days=1)
+    profile = BikeAnalytics(store).hourly_profile_by_camera(yesterday - timedelta(days=BIKE_COUNTS_DAYS - 1), yesterday)
+    if profile:
+        detector.publish_bike_counts(profile)
+        print(f"Published hourly bike counts for {len(profile)} cameras to {BIKE_COUNTS_PATH}")
 
 if __name__ == "__main__":
     main()
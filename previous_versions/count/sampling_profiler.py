@@ -0,0 +1,177 @@
+"""
+Opt-in, low-overhead sampling profiler.
+
+A daemon thread snapshots every thread's stack with sys._current_frames() every
+PROFILE_INTERVAL_MS milliseconds. Stacks are written in the collapsed format
+("frame;frame;frame count" per line) read by flamegraph.pl, speedscope and
+inferno, together with a top-N summary of the hottest functions.
+
+Turned on with PROFILE=1; PROFILE_DIR picks the local output directory.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILE_ENV = 'PROFILE'
+DEFAULT_INTERVAL_MS = 10
+TOP_N = 30
+
+_active = None
+
+
+def profile_enabled():
+    return os.environ.get(PROFILE_ENV, '').lower() in ('1', 'true', 'yes')
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(self, name, interval_ms=None):
+        self.name = name
+        self.interval = (interval_ms or int(os.environ.get('PROFILE_INTERVAL_MS', DEFAULT_INTERVAL_MS))) / 1000
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self.started_at = None
+        self.elapsed = 0.0
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.elapsed = time.perf_counter() - self.started_at
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write(self, out_dir):
+        """Write {name}.collapsed and {name}.top.txt, returns their paths."""
+        os.makedirs(out_dir, exist_ok=True)
+        collapsed = os.path.join(out_dir, f"{self.name}.collapsed")
+        write_collapsed(self.stacks, collapsed)
+        top = os.path.join(out_dir, f"{self.name}.top.txt")
+        with open(top, 'w') as f:
+            f.write(f"# {self.name}: {self.samples} samples every {self.interval * 1000:.0f} ms over {self.elapsed:.1f} s\n")
+            f.write(top_functions(self.stacks))
+        return [collapsed, top]
+
+
+def write_collapsed(stacks, path):
+    with open(path, 'w') as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+
+
+def read_collapsed(path):
+    stacks = Counter()
+    with open(path) as f:
+        for line in f:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack:
+                stacks[stack] += int(count)
+    return stacks
+
+
+def top_functions(stacks, n=TOP_N):
+    """Hottest functions by self samples (leaf frame) and by total samples (anywhere on the stack)."""
+    self_counts = Counter()
+    total_counts = Counter()
+    total = sum(stacks.values()) or 1
+    for stack, count in stacks.items():
+        # The first entry is the thread name, not a function
+        frames = stack.split(';')[1:]
+        if not frames:
+            continue
+        self_counts[frames[-1]] += count
+        for frame in set(frames):
+            total_counts[frame] += count
+
+    lines = ["", f"Top {n} by self time:"]
+    lines += [f"{count / total:7.1%}  {count:7d}  {frame}" for frame, count in self_counts.most_common(n)]
+    lines += ["", f"Top {n} by total time:"]
+    lines += [f"{count / total:7.1%}  {count:7d}  {frame}" for frame, count in total_counts.most_common(n)]
+    return '\n'.join(lines) + '\n'
+
+
+class profiled:
+    """
+    Context manager profiling its body when PROFILE is set (or enabled=True).
+
+    Nested uses while a profiler is already running just reuse it, so profiling
+    scrape_all_cameras also covers the create_file_index_gcs call it makes.
+    """
+
+    def __init__(self, name, out_dir, enabled=None):
+        self.name = name
+        self.out_dir = out_dir
+        self.enabled = profile_enabled() if enabled is None else enabled
+        self.profiler = None
+        self.paths = []
+
+    def __enter__(self):
+        global _active
+        if self.enabled and _active is None:
+            self.profiler = _active = SamplingProfiler(self.name).start()
+        return self
+
+    def __exit__(self, *exc):
+        global _active
+        if self.profiler is not None:
+            self.profiler.stop()
+            _active = None
+            self.paths = self.profiler.write(self.out_dir)
+        return False
+
+
+def start_worker_profiler(out_dir, prefix='worker'):
+    """
+    multiprocessing.Pool initializer: profiles the worker process until it exits.
+
+    The profile is written by a multiprocessing finalizer, which runs when the worker
+    exits normally, so the pool must be close()d and join()ed rather than terminated.
+    """
+    from multiprocessing import util
+
+    profiler = SamplingProfiler(f"{prefix}-{os.getpid()}").start()
+
+    def finish():
+        profiler.stop()
+        profiler.write(out_dir)
+
+    util.Finalize(None, finish, exitpriority=10)
+
+
+def merge_profiles(out_dir, name='combined'):
+    """Merge every .collapsed file in out_dir into {name}.collapsed plus a {name}.top.txt summary."""
+    stacks = Counter()
+    for filename in sorted(os.listdir(out_dir)):
+        if filename.endswith('.collapsed') and filename != f"{name}.collapsed":
+            stacks.update(read_collapsed(os.path.join(out_dir, filename)))
+    write_collapsed(stacks, os.path.join(out_dir, f"{name}.collapsed"))
+    with open(os.path.join(out_dir, f"{name}.top.txt"), 'w') as f:
+        f.write(f"# {name}: {sum(stacks.values())} samples\n")
+        f.write(top_functions(stacks))
+    return stacks
@@ -1,67 +1,210 @@
-from flask import Flask, render_template
+from flask import Flask, abort, jsonify, render_template, request
 import requests
 import os
 import json
+import threading
+import time
+from functools import lru_cache
 from google.cloud import storage
 from pprint import pprint
 
+from geo import CameraIndex, feature_collection
+from status_store import LatestStatusStore
+
 # Initialize Flask app
 app = Flask(__name__)
+app.json.compact = True
 
 # Constants
 CAMERA_API_URL = "https://webcams.nyctmc.org/api/cameras"
 GCS_BUCKET_NAME = "bike-crowding"
-GCS_FILE_PATH = "metadata/latest_status.json"
+REQUEST_TIMEOUT = 10  # seconds, for each upstream call made by the refresher
+REFRESH_SECONDS = 60  # how often the camera view is rebuilt in the background
+STALE_AFTER_SECONDS = 10 * 60  # log a warning when serving a view older than this
+THUMB_RENDITION = "thumb"
 
-def fetch_camera_data():
-    """Fetch camera data from the API."""
-    try:
-        response = requests.get(CAMERA_API_URL)
-        response.raise_for_status()
-        return response.json()
-    except requests.RequestException as e:
-        app.logger.error(f"Error fetching camera data: {e}")
-        return []
-
-def get_camera_info():
-    """Fetch and parse JSON data from Google Cloud Storage."""
+
+def gcs_link(filename, rendition=None):
+    if not filename:
+        return 'UNKNOWN' if rendition is None else ''
+    if rendition:
+        filename = f"{rendition}/{filename}"
+    return f'https://storage.cloud.google.com/{GCS_BUCKET_NAME}/{filename}'
+
+
+@lru_cache
+def get_storage_client():
+    return storage.Client()
+
+
+class CameraView:
+    """
+    Merged camera list + GCS status, rebuilt by a background thread and served from memory.
+
+    Page views never wait on upstream I/O: they get the last built view, and a view older
+    than REFRESH_SECONDS wakes the refresher (stale-while-revalidate). Upstream fetches are
+    conditional: unchanged camera data is not downloaded, and the status store only
+    fetches the records of cameras that changed since the last refresh.
+    """
+
+    def __init__(self):
+        self.session = requests.Session()
+        self.cameras = []
+        self.status = None
+        self.camera_data = []
+        self.index = CameraIndex([])
+        self.built_at = 0.0
+        self.attempted_at = 0.0
+        self.api_validators = {}
+        self.wake = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def get(self):
+        now = time.monotonic()
+        age = now - self.built_at
+        # Retries of a failing refresh stay REFRESH_SECONDS apart
+        if now - max(self.built_at, self.attempted_at) > REFRESH_SECONDS:
+            self.wake.set()
+        if self.built_at and age > STALE_AFTER_SECONDS:
+            app.logger.warning(f"Serving camera view built {age:.0f}s ago")
+        return self.index
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="camera-view-refresher", daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                app.logger.error(f"Error refreshing camera view: {e}")
+            self.wake.wait(REFRESH_SECONDS)
+            self.wake.clear()
+
+    def refresh(self):
+        self.attempted_at = time.monotonic()
+        cameras_changed = self.fetch_camera_data()
+        info_changed = self.get_camera_info()
+        if cameras_changed or info_changed or not self.built_at:
+            self.camera_data = self.build_camera_data()
+            self.index = CameraIndex(self.camera_data)
+        # A failed fetch keeps the old view, which then ages into the stale warning
+        if cameras_changed is not None and info_changed is not None:
+            self.built_at = time.monotonic()
+
+    def fetch_camera_data(self):
+        """Fetch camera data from the API, returns True when it changed and None when the fetch failed."""
+        try:
+            response = self.session.get(CAMERA_API_URL, headers=self.api_validators, timeout=REQUEST_TIMEOUT)
+            if response.status_code == 304:
+                return False
+            response.raise_for_status()
+        except requests.RequestException as e:
+            app.logger.error(f"Error fetching camera data: {e}")
+            return None
+        self.api_validators = {}
+        if response.headers.get("ETag"):
+            self.api_validators["If-None-Match"] = response.headers["ETag"]
+        if response.headers.get("Last-Modified"):
+            self.api_validators["If-Modified-Since"] = response.headers["Last-Modified"]
+        self.cameras = response.json()
+        return True
+
+    def get_camera_info(self):
+        """Apply the latest status changes from Google Cloud Storage, returns True when any arrived and None on failure."""
+        try:
+            if self.status is None:
+                self.status = LatestStatusStore(get_storage_client().bucket(GCS_BUCKET_NAME), timeout=REQUEST_TIMEOUT)
+            return self.status.refresh()
+        except Exception as e:
+            app.logger.error(f"Error fetching camera status: {e}")
+            return None
+
+    def latest_file(self, camera_id):
+        record = self.status.get(camera_id) if self.status is not None else None
+        return record.get('last_path') if record else None
+
+    def build_camera_data(self):
+
+        # Filter and structure the camera data for rendering
+        return [
+            {
+                'name': camera['name'],
+                'gcslink': gcs_link(self.latest_file(camera['id'])),
+                # 160 px rendition written at ingest, the InfoWindow shows images 100 px wide
+                'thumbUrl': gcs_link(self.latest_file(camera['id']), THUMB_RENDITION),
+                'latitude': float(camera['latitude']),
+                'longitude': float(camera['longitude']),
+                'imageUrl': camera['imageUrl'],
+                'cameraUrl': f"https://webcams.nyctmc.org/api/cameras/{camera['id']}"
+            }
+            for camera in self.cameras if camera.get('isOnline') == 'true'
+        ]
+
+
+camera_view = CameraView()
+camera_view.start()
+
+
+def parse_bbox():
+    """bbox=west,south,east,north query parameter, defaults to the whole world."""
+    value = request.args.get('bbox')
+    if not value:
+        return -180.0, -90.0, 180.0, 90.0
     try:
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(GCS_BUCKET_NAME)
-        blob = bucket.blob(GCS_FILE_PATH)
-        json_content = blob.download_as_text()
-        return json.loads(json_content)
-    except Exception as e:
-        app.logger.error(f"Error fetching GCS file: {e}")
-        return {}
+        west, south, east, north = (float(v) for v in value.split(','))
+    except ValueError:
+        return abort(400, f"Invalid bbox: {value}")
+    return west, south, east, north
+
 
 @app.route('/')
 def index():
-    """Render the Google Maps page with camera markers."""
-    # Fetch camera data from API and GCS
-    cameras = fetch_camera_data()
-    camera_info = get_camera_info()
-
-    # Build a dictionary for camera name to GCS file link mapping
-    name_to_link = {
-        cam['camera_name']: f'https://storage.cloud.google.com/bike-crowding/{cam["filename"]}'
-        for cam in camera_info.get('details', [])
-    }
-
-    # Filter and structure the camera data for rendering
-    camera_data = [
-        {
-            'name': camera['name'],
-            'gcslink': name_to_link.get(camera["name"], 'UNKNOWN'),
-            'latitude': camera['latitude'],
-            'longitude': camera['longitude'],
-            'imageUrl': camera['imageUrl'],
-            'cameraUrl': f"https://webcams.nyctmc.org/api/cameras/{camera['id']}"
-        }
-        for camera in cameras if camera.get('isOnline') == 'true'
-    ]
+    """Render the Google Maps page, markers are loaded from /cameras/clusters."""
+    camera_view.get()
+    return render_template('map.html', API_KEY=os.environ['GOOGLE_MAPS_API_KEY'])
 
-    return render_template('map.html', cameras=camera_data, API_KEY=os.environ['GOOGLE_MAPS_API_KEY'])
+
+@app.route('/cameras.geojson')
+def cameras_geojson():
+    """Online cameras as a GeoJSON FeatureCollection, optionally limited to a bbox."""
+    # Served from memory, the background refresher keeps it up to date
+    index = camera_view.get()
+    return jsonify(feature_collection(index.bbox(*parse_bbox())))
+
+
+@app.route('/cameras/clusters')
+def camera_clusters():
+    """Pre-clustered markers for a viewport: bbox=west,south,east,north&zoom=N."""
+    try:
+        zoom = int(request.args.get('zoom', 11))
+    except ValueError:
+        return abort(400, "Invalid zoom")
+    index = camera_view.get()
+    return jsonify(feature_collection(index.clusters(*parse_bbox(), zoom)))
+
+
+@app.route('/cameras/nearest')
+def nearest_cameras():
+    """The k cameras closest to lat/lng, with their distance in meters."""
+    try:
+        lat = float(request.args['lat'])
+        lng = float(request.args['lng'])
+        k = min(max(int(request.args.get('k', 1)), 1), 50)
+    except (KeyError, ValueError):
+        return abort(400, "lat and lng are required")
+    index = camera_view.get()
+    if not index.grid.covers(lat, lng):
+        return abort(400, "lat and lng must be finite and near the cameras")
+    features = [
+        dict(feature, properties=dict(feature['properties'], distance_m=round(distance, 1)))
+        for distance, feature in index.nearest(lat, lng, k)
+    ]
+    return jsonify(feature_collection(features))
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,192 @@
+import math
+from collections import defaultdict
+
+METERS_PER_DEGREE = 111320
+GRID_CELL_DEGREES = 0.01  # about 1 km, a handful of cameras per cell in Manhattan
+CLUSTER_RADIUS_PX = 60  # cameras closer than this on screen are merged into one marker
+MAX_CLUSTER_ZOOM = 16  # above this every camera gets its own marker
+TILE_SIZE = 256
+# Nearest-camera queries further than this from any camera cell are refused (about 50 km)
+NEAREST_MARGIN_CELLS = 50
+
+
+def camera_feature(camera):
+    """GeoJSON point feature for one camera; properties are everything but the coordinates."""
+    properties = {k: v for k, v in camera.items() if k not in ('latitude', 'longitude')}
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'Point', 'coordinates': [camera['longitude'], camera['latitude']]},
+        'properties': properties,
+    }
+
+
+def feature_collection(features):
+    return {'type': 'FeatureCollection', 'features': list(features)}
+
+
+class GridIndex:
+    """
+    Uniform latitude/longitude grid over (lat, lng, item) points.
+
+    Answers bounding-box queries by visiting only the cells the box overlaps, and
+    nearest-neighbour queries by searching rings of cells outwards from the query point.
+    """
+
+    def __init__(self, points, cell_size=GRID_CELL_DEGREES):
+        self.cell_size = cell_size
+        self.cells = defaultdict(list)
+        for lat, lng, item in points:
+            self.cells[self._cell(lat, lng)].append((lat, lng, item))
+        self.size = sum(len(v) for v in self.cells.values())
+        rows = [r for r, _ in self.cells] or [0]
+        cols = [c for _, c in self.cells] or [0]
+        self.extent = (min(rows), min(cols), max(rows), max(cols))
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_size), math.floor(lng / self.cell_size))
+
+    def bbox(self, west, south, east, north):
+        """Items inside the box, which may cross the antimeridian (west > east)."""
+        if west > east:
+            return self.bbox(west, south, 180.0, north) + self.bbox(-180.0, south, east, north)
+        row_min, col_min = self._cell(south, west)
+        row_max, col_max = self._cell(north, east)
+        row_min, col_min = max(row_min, self.extent[0]), max(col_min, self.extent[1])
+        row_max, col_max = min(row_max, self.extent[2]), min(col_max, self.extent[3])
+        if row_max < row_min or col_max < col_min:
+            return []
+        if (row_max - row_min + 1) * (col_max - col_min + 1) > len(self.cells):
+            # Box covers more cells than are occupied, so scan the occupied ones instead
+            candidates = (p for points in self.cells.values() for p in points)
+        else:
+            candidates = (
+                p
+                for row in range(row_min, row_max + 1)
+                for col in range(col_min, col_max + 1)
+                for p in self.cells.get((row, col), ())
+            )
+        return [item for lat, lng, item in candidates if south <= lat <= north and west <= lng <= east]
+
+    def covers(self, lat, lng, margin=NEAREST_MARGIN_CELLS):
+        """True when lat/lng is finite and within `margin` cells of the occupied extent."""
+        if not (math.isfinite(lat) and math.isfinite(lng)):
+            return False
+        row, col = self._cell(lat, lng)
+        return (self.extent[0] - margin <= row <= self.extent[2] + margin
+                and self.extent[1] - margin <= col <= self.extent[3] + margin)
+
+    def _ring_cells(self, row0, col0, ring):
+        """Cells on the perimeter of the square `ring` cells out from (row0, col0), clipped to the extent."""
+        row_min, col_min, row_max, col_max = self.extent
+        if ring == 0:
+            yield row0, col0
+            return
+        cols = range(max(col0 - ring, col_min), min(col0 + ring, col_max) + 1)
+        for row in (row0 - ring, row0 + ring):
+            if row_min <= row <= row_max:
+                for col in cols:
+                    yield row, col
+        rows = range(max(row0 - ring + 1, row_min), min(row0 + ring - 1, row_max) + 1)
+        for col in (col0 - ring, col0 + ring):
+            if col_min <= col <= col_max:
+                for row in rows:
+                    yield row, col
+
+    def nearest(self, lat, lng, k=1):
+        """
+        The k closest items as (distance_m, item) pairs, closest first.
+
+        Raises ValueError for points the index does not cover (see covers()), whose
+        search would have to visit every ring out to the extent.
+        """
+        if not self.covers(lat, lng):
+            raise ValueError(f"{lat},{lng} is outside the area of the index")
+        k = min(k, self.size)
+        if k <= 0:
+            return []
+        cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+
+        def distance(p):
+            return math.hypot(p[0] - lat, (p[1] - lng) * cos_lat)
+
+        row0, col0 = self._cell(lat, lng)
+        max_ring = max(
+            abs(row0 - self.extent[0]), abs(row0 - self.extent[2]),
+            abs(col0 - self.extent[1]), abs(col0 - self.extent[3]),
+        )
+        best = []
+        for ring in range(max_ring + 1):
+            for cell in self._ring_cells(row0, col0, ring):
+                best.extend((distance(p), p[2]) for p in self.cells.get(cell, ()))
+            if len(best) >= k:
+                best.sort(key=lambda d: d[0])
+                del best[k:]
+                # Anything in a further ring is at least ring * cell_size * cos(lat) away
+                if best[-1][0] <= ring * self.cell_size * cos_lat:
+                    break
+        best.sort(key=lambda d: d[0])
+        return [(d * METERS_PER_DEGREE, item) for d, item in best[:k]]
+
+
+def _pixel(lat, lng, zoom):
+    """Web Mercator pixel coordinates, as used by Google Maps."""
+    scale = TILE_SIZE * 2 ** zoom
+    siny = min(max(math.sin(math.radians(lat)), -0.9999), 0.9999)
+    x = (lng + 180.0) / 360.0 * scale
+    y = (0.5 - math.log((1 + siny) / (1 - siny)) / (4 * math.pi)) * scale
+    return x, y
+
+
+class CameraIndex:
+    """
+    Spatial index over the camera list plus pre-computed marker clusters for every zoom level.
+
+    Clusters are built once per camera list by bucketing cameras into CLUSTER_RADIUS_PX
+    screen-space cells at each zoom, and each zoom level gets its own GridIndex, so a
+    viewport query only touches the markers it returns.
+    """
+
+    def __init__(self, cameras):
+        self.features = [camera_feature(c) for c in cameras]
+        self.grid = GridIndex((c['latitude'], c['longitude'], f) for c, f in zip(cameras, self.features))
+        self.cluster_grids = [self._build_clusters(cameras, zoom) for zoom in range(MAX_CLUSTER_ZOOM + 1)]
+
+    def _build_clusters(self, cameras, zoom):
+        cells = defaultdict(list)
+        for camera, feature in zip(cameras, self.features):
+            x, y = _pixel(camera['latitude'], camera['longitude'], zoom)
+            cells[(int(x // CLUSTER_RADIUS_PX), int(y // CLUSTER_RADIUS_PX))].append((camera, feature))
+
+        points = []
+        for members in cells.values():
+            if len(members) == 1:
+                camera, feature = members[0]
+                points.append((camera['latitude'], camera['longitude'], feature))
+                continue
+            lat = sum(c['latitude'] for c, _ in members) / len(members)
+            lng = sum(c['longitude'] for c, _ in members) / len(members)
+            points.append((lat, lng, {
+                'type': 'Feature',
+                'geometry': {'type': 'Point', 'coordinates': [lng, lat]},
+                'properties': {
+                    'cluster': True,
+                    'point_count': len(members),
+                    'bbox': [
+                        min(c['longitude'] for c, _ in members), min(c['latitude'] for c, _ in members),
+                        max(c['longitude'] for c, _ in members), max(c['latitude'] for c, _ in members),
+                    ],
+                },
+            }))
+        return GridIndex(points)
+
+    def bbox(self, west, south, east, north):
+        return self.grid.bbox(west, south, east, north)
+
+    def nearest(self, lat, lng, k=1):
+        return self.grid.nearest(lat, lng, k)
+
+    def clusters(self, west, south, east, north, zoom):
+        zoom = max(int(zoom), 0)
+        if zoom > MAX_CLUSTER_ZOOM:
+            return self.bbox(west, south, east, north)
+        return self.cluster_grids[zoom].bbox(west, south, east, north)
@@ -4,9 +4,12 @@ import pytz
 import json
 import time
 import logging
+import math
 import os
+import statistics
+import concurrent.futures
 from pathlib import Path
-from flask import Flask
+from flask import Flask, request
 from PIL import Image
 import imagehash
 import io
@@ -18,17 +21,27 @@ BUCKET_NAME = 'nyc-webcam-capture'
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Cameras captured in bursts, by name, so they can be fetched without downloading the camera list
+BURST_CAMERAS = {
+    'Central Park @ 72nd St Post 37': '3f04a686-f97c-4187-8968-cb09265e08ff',
+}
+MIN_BURST_INTERVAL = 1.0  # seconds, filenames only have second resolution
+MAX_BURST_FRAMES = 60
+
 class CameraScraper:
     def __init__(self):
         self.ny_tz = pytz.timezone('America/New_York')
         from google.cloud import storage
         self.storage_client = storage.Client()
         self.bucket = self.storage_client.bucket(BUCKET_NAME)
+        self.session = requests.Session()
 
     def get_camera_by_name(self, camera_name):
+        if camera_name in BURST_CAMERAS:
+            return {'name': camera_name, 'id': BURST_CAMERAS[camera_name]}
         try:
             url = "https://webcams.nyctmc.org/api/cameras"
-            response = requests.get(url, timeout=30)
+            response = self.session.get(url, timeout=30)
             response.raise_for_status()
             all_cameras = response.json()
             for camera in all_cameras:
@@ -39,15 +52,18 @@ class CameraScraper:
             return None
         return None
 
-    def download_camera_image(self, camera):
+    def fetch_camera_frame(self, camera):
+        """Fetch the current image; the capture time is taken when the response arrives."""
+        url = f"https://webcams.nyctmc.org/api/cameras/{camera['id']}/image"
+        response = self.session.get(url, timeout=30)
+        response.raise_for_status()
+        return response.content, datetime.now(self.ny_tz)
+
+    def upload_frame(self, camera, content, now):
+        from google.api_core.exceptions import PreconditionFailed
+
         try:
             camera_id = camera['id']
-            url = f"https://webcams.nyctmc.org/api/cameras/{camera_id}/image"
-            
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
-
-            now = datetime.now(self.ny_tz)
             timestamp = now.strftime('%Y%m%d_%H%M%S')
             
             safe_name = "".join(c if c.isalnum() else "_" for c in camera['name'])
@@ -55,12 +71,17 @@ class CameraScraper:
             filename = f"data/{safe_name}/{now.year}/{now.month:02d}/{now.day:02d}/{now.hour:02d}/{timestamp}_{camera_id}.jpg"
             
             img_byte_arr = io.BytesIO()
-            img = Image.open(io.BytesIO(response.content))
+            img = Image.open(io.BytesIO(content))
             img.save(img_byte_arr, format='JPEG', quality=85)
             img_byte_arr = img_byte_arr.getvalue()
 
             blob = self.bucket.blob(filename)
-            blob.upload_from_string(img_byte_arr, 'image/jpeg')
+            try:
+                # Names have second resolution: a late burst frame must not replace the previous one
+                blob.upload_from_string(img_byte_arr, 'image/jpeg', if_generation_match=0)
+            except PreconditionFailed:
+                logger.warning(f"gs://{BUCKET_NAME}/{filename} already exists, frame dropped")
+                return {"status": "duplicate", "filename": filename}
             logger.info(f"Uploaded to GCS: gs://{BUCKET_NAME}/{filename}")
             
             return {"status": "success", "filename": filename}
@@ -69,21 +90,91 @@ class CameraScraper:
             logger.error(f"Error processing camera {camera.get('id', 'unknown')}: {e}")
             return {"status": "error", "error": str(e)}
 
+    def download_camera_image(self, camera):
+        try:
+            content, now = self.fetch_camera_frame(camera)
+        except Exception as e:
+            logger.error(f"Error processing camera {camera.get('id', 'unknown')}: {e}")
+            return {"status": "error", "error": str(e)}
+        return self.upload_frame(camera, content, now)
+
+    def capture_burst(self, camera, frames, interval):
+        """
+        Capture `frames` images at fixed absolute deadlines, `interval` seconds apart.
+
+        Frame N is uploaded on a background thread while frame N+1 is being fetched, so
+        neither the upload nor a slow fetch pushes later captures back. A deadline that
+        has already passed when its turn comes is skipped rather than taken late.
+        Raises ValueError for an interval that is not a positive, finite number.
+        """
+        if not math.isfinite(interval) or interval <= 0:
+            raise ValueError(f"interval must be a positive, finite number of seconds, got {interval}")
+        interval = max(interval, MIN_BURST_INTERVAL)
+        results = []
+        fetched_at = []
+        skipped = 0
+        start = time.monotonic()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as uploader:
+            uploads = []
+            for i in range(frames):
+                deadline = start + i * interval
+                now = time.monotonic()
+                if now > deadline + interval / 2:
+                    skipped += 1
+                    results.append({"status": "skipped", "deadline": i, "late_by": round(now - deadline, 3)})
+                    continue
+                if deadline > now:
+                    time.sleep(deadline - now)
+                started = time.monotonic()
+                try:
+                    content, captured = self.fetch_camera_frame(camera)
+                except Exception as e:
+                    logger.error(f"Error fetching frame {i} for {camera['name']}: {e}")
+                    results.append({"status": "error", "error": str(e), "deadline": i})
+                    continue
+                fetched_at.append((i, started))
+                result = {"deadline": i, "late_by": round(started - deadline, 3)}
+                results.append(result)
+                uploads.append((result, uploader.submit(self.upload_frame, camera, content, captured)))
+            for result, future in uploads:
+                result.update(future.result())
+
+        starts = [t for _, t in fetched_at]
+        intervals = [b - a for a, b in zip(starts, starts[1:])]
+        lateness = [r["late_by"] for r in results if "late_by" in r and r.get("status") != "skipped"]
+        stats = {
+            "target_interval": interval,
+            "frames": frames,
+            "captured": sum(1 for r in results if r.get("status") == "success"),
+            "skipped": skipped,
+            "duplicates": sum(1 for r in results if r.get("status") == "duplicate"),
+            "achieved_interval_mean": round(statistics.mean(intervals), 3) if intervals else None,
+            "achieved_interval_stdev": round(statistics.pstdev(intervals), 3) if intervals else None,
+            "jitter_mean": round(statistics.mean(lateness), 3) if lateness else None,
+            "jitter_max": round(max(lateness), 3) if lateness else None,
+            "duration": round(time.monotonic() - start, 3),
+        }
+        logger.info(f"Burst for {camera['name']}: {stats}")
+        return results, stats
+
 @app.route('/')
 def scrape():
+    camera_name = request.args.get('camera', 'Central Park @ 72nd St Post 37')
+    try:
+        frames = min(int(request.args.get('frames', 3)), MAX_BURST_FRAMES)
+        interval = float(request.args.get('interval', 5))
+    except ValueError:
+        return "Invalid frames or interval", 400
+    if not math.isfinite(interval) or interval <= 0:
+        return "Invalid frames or interval", 400
+
     scraper = CameraScraper()
-    camera = scraper.get_camera_by_name('Central Park @ 72nd St Post 37')
+    camera = scraper.get_camera_by_name(camera_name)
     if not camera:
         return "Camera not found", 404
 
-    results = []
-    for i in range(3):
-        logger.info(f"Scraping attempt {i+1}...")
-        result = scraper.download_camera_image(camera)
-        results.append(result)
-        time.sleep(5) # Wait 5 seconds between scrapes
-
-    return json.dumps(results, indent=2)
+    results, stats = scraper.capture_burst(camera, frames, interval)
+    return json.dumps({"results": results, "stats": stats}, indent=2)
 
 if __name__ == "__main__":
     app.run(debug=True, host='0.0.0.0', port=int(os.environ.get('PORT', 8080)))
@@ -0,0 +1,71 @@
+import numpy as np
+
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Returns the indices of at most `threshold` points that keep the visual
+    shape of the series (x must be sorted, neither array may contain NaN).
+    """
+    n = len(x)
+    if threshold >= n:
+        return np.arange(n)
+    if threshold < 3:
+        return np.array([0, n - 1])
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # First and last points are always kept, the rest go into threshold - 2 buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    indices = np.empty(threshold, dtype=int)
+    indices[0] = 0
+    indices[-1] = n - 1
+
+    selected = 0
+    for i in range(threshold - 2):
+        start, stop = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_start, next_stop = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_stop = n - 1, n
+        avg_x = x[next_start:next_stop].mean()
+        avg_y = y[next_start:next_stop].mean()
+
+        ax, ay = x[selected], y[selected]
+        area = np.abs(
+            (ax - avg_x) * (y[start:stop] - ay) - (ax - x[start:stop]) * (avg_y - ay)
+        )
+        selected = start + int(np.argmax(area))
+        indices[i + 1] = selected
+    return indices
+
+
+def min_max(y, threshold):
+    """
+    Min/max bucket downsampling.
+
+    Splits the series into threshold // 2 buckets and keeps the smallest and
+    largest point of each, in their original order. Returns indices.
+    """
+    n = len(y)
+    if threshold >= n:
+        return np.arange(n)
+    y = np.asarray(y, dtype=float)
+    n_buckets = max(threshold // 2, 1)
+    edges = np.linspace(0, n, n_buckets + 1).astype(int)
+    indices = []
+    for start, stop in zip(edges[:-1], edges[1:]):
+        if stop <= start:
+            continue
+        bucket = y[start:stop]
+        lo = start + int(np.argmin(bucket))
+        hi = start + int(np.argmax(bucket))
+        indices.extend(sorted({lo, hi}))
+    return np.array(indices, dtype=int)
+
+
+METHODS = {
+    "lttb": lambda x, y, threshold: lttb(x, y, threshold),
+    "minmax": lambda x, y, threshold: min_max(y, threshold),
+}
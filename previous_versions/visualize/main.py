@@ -1,36 +1,196 @@
 import datetime as dt
+import io
+import threading
+import time
+from functools import lru_cache
 
 import numpy as np
 import pandas as pd
-from flask import Flask, abort, render_template, request, send_file, send_from_directory
+from flask import Flask, Response, abort, jsonify, render_template, request, send_from_directory
 from google.cloud import storage
 
+import downsample
+
 app = Flask(__name__)
 
 # Replace these values with your own
 BUCKET_NAME = "bike-crowding"
 DATA_FILE_NAME = "logs/central_park.csv"
+CSV_COLUMNS = ["timestamp", "raw_count", "location"]
+# How long a cached copy is trusted before the blob generation is checked again
+REVALIDATE_SECONDS = 15
+RAW_PREFIX = "/home/mattzouf/bike-crowding/raw/"
+RAW_CHUNK_SIZE = 256 * 1024
+# Raw captures never change once written, so browsers may keep them for a day
+RAW_CACHE_CONTROL = "public, max-age=86400"
+# Chart payloads never carry more than this many points, whatever the window length
+DEFAULT_SERIES_POINTS = 1000
+MAX_SERIES_POINTS = 5000
+
+
+@lru_cache
+def get_storage_client():
+    return storage.Client()
+
+
+def parse_counts_csv(content):
+    """
+    Parse raw CSV bytes into a DataFrame indexed by timestamp.
+    """
+    df = pd.read_csv(io.BytesIO(content), names=CSV_COLUMNS)
+    # drop the fractional seconds by slicing, to_datetime does not have a good time with them
+    df = df.assign(
+        timestamp=pd.to_datetime(
+            df["timestamp"].astype(str).str.slice(0, 19), format="%Y-%m-%dT%H:%M:%S"
+        ),
+        raw_count=pd.to_numeric(df["raw_count"]),
+    )
+    return df.set_index("timestamp")
+
+
+class CountsCache:
+    """
+    In-process copy of the parsed counts CSV.
+
+    The blob generation is checked at most every REVALIDATE_SECONDS. When the
+    object has only grown, just the appended tail is fetched with a ranged read,
+    starting at the last cached line so we can verify the old content is intact.
+    """
+
+    def __init__(self, bucket_name, blob_name):
+        self.bucket_name = bucket_name
+        self.blob_name = blob_name
+        self.df = None
+        self.generation = None
+        self.size = 0
+        self.last_line_offset = 0
+        self.last_line = b""
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def get(self):
+        with self.lock:
+            if self.df is not None and time.monotonic() - self.checked_at < REVALIDATE_SECONDS:
+                return self.df
+            self._refresh()
+            self.checked_at = time.monotonic()
+            return self.df
+
+    def _refresh(self):
+        bucket = get_storage_client().bucket(self.bucket_name)
+        blob = bucket.get_blob(self.blob_name)
+        if blob is None:
+            raise FileNotFoundError(f"gs://{self.bucket_name}/{self.blob_name} not found")
+        if self.df is not None and blob.generation == self.generation:
+            return
+
+        if self.df is not None and self.last_line and blob.size > self.size:
+            # Re-read from the start of the last cached line: it is compared against
+            # what we have and re-parsed in case it was unterminated before
+            tail = blob.download_as_bytes(start=self.last_line_offset, if_generation_match=blob.generation)
+            if tail.startswith(self.last_line):
+                cached = self.df.iloc[:-1]
+                self._load(tail, self.last_line_offset, blob, cached)
+                return
+            app.logger.info("Counts CSV was rewritten, reloading it in full")
+
+        content = blob.download_as_bytes(if_generation_match=blob.generation)
+        self._load(content, 0, blob)
+
+    def _load(self, content, offset, blob, cached=None):
+        start = content.rstrip(b"\r\n").rfind(b"\n") + 1
+        df = parse_counts_csv(content)
+        if cached is not None and len(cached):
+            df = pd.concat([cached, df])
+        if not df.index.is_monotonic_increasing:
+            df = df.sort_index(kind="stable")
+        self.df = df
+        self.generation = blob.generation
+        self.size = offset + len(content)
+        self.last_line_offset = offset + start
+        self.last_line = content[start:]
+
+
+counts_cache = CountsCache(BUCKET_NAME, DATA_FILE_NAME)
+
+
+def stream_blob_range(blob, start, stop):
+    """
+    Yield bytes [start, stop) of a blob in chunks, pinned to its generation.
+    """
+    with blob.open("rb", chunk_size=RAW_CHUNK_SIZE, if_generation_match=blob.generation) as reader:
+        reader.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            chunk = reader.read(min(RAW_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
 
 
 @app.route("/raw/<path:path>")
 def serve_raw_file(path):
-    # Extract filename and date from path
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(BUCKET_NAME)
-    blob = bucket.blob(f"/home/mattzouf/bike-crowding/raw/{path}")
-    if blob.exists():
-        # Download and send the file
-        with open("/tmp/image.jpg", "wb") as f:
-            blob.download_to_file(f)
-        return send_file("/tmp/image.jpg", mimetype="image/jpg")
-    else:
-        # Return 404 Not Found
+    # Single metadata request: returns None for a missing object, so no exists() round-trip
+    bucket = get_storage_client().bucket(BUCKET_NAME)
+    blob = bucket.get_blob(f"{RAW_PREFIX}{path}")
+    if blob is None:
         return abort(404)
 
+    etag = str(blob.generation)
+    last_modified = blob.updated.replace(microsecond=0) if blob.updated else None
+    headers = {"Cache-Control": RAW_CACHE_CONTROL, "Accept-Ranges": "bytes"}
 
-@app.route("/")
-def plot_data():
-    # Extract window size from URL parameter
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains_weak(etag)
+    else:
+        not_modified = (
+            last_modified is not None
+            and request.if_modified_since is not None
+            and request.if_modified_since >= last_modified
+        )
+    if not_modified:
+        response = Response(status=304, headers=headers)
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        return response
+
+    size = blob.size
+    start, stop, status = 0, size, 200
+    # An If-Range that no longer matches means the client gets the whole new object
+    if_range = request.if_range
+    if if_range.etag is not None:
+        if_range_ok = if_range.etag == etag
+    elif if_range.date is not None:
+        if_range_ok = last_modified is not None and if_range.date >= last_modified
+    else:
+        if_range_ok = True
+    if request.range and if_range_ok:
+        byte_range = request.range.range_for_length(size)
+        if byte_range is None:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status=416, headers=headers)
+        start, stop = byte_range
+        status = 206
+        headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+
+    response = Response(
+        stream_blob_range(blob, start, stop),
+        status=status,
+        mimetype=blob.content_type or "image/jpeg",
+        headers=headers,
+        direct_passthrough=True,
+    )
+    response.content_length = stop - start
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    return response
+
+
+def parse_window_args():
+    """
+    Read the window_size / smoothing_minutes query parameters shared by the page and the data API.
+    """
     try:
         window_size = int(request.args.get("window_size"))
     except (TypeError, ValueError):
@@ -42,46 +202,110 @@ def plot_data():
         smoothing_minutes = 60  # Default smoothing
     smoothing_minutes = min(max(smoothing_minutes, 1), 360)
     window_size = max(window_size, 2)
-    date_range_max = dt.datetime.now().strftime("%Y%m%d")
-    min_day = dt.datetime.today() - dt.timedelta(days=window_size)
-    date_range_min = min_day.strftime("%Y%m%d")
+    return window_size, smoothing_minutes
 
-    # Download data from GCS
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(BUCKET_NAME)
-    blob = bucket.blob(DATA_FILE_NAME)
-    with open("/tmp/data.csv", "wb") as f:
-        blob.download_to_file(f)
-
-    df = pd.read_csv("/tmp/data.csv", names=["timestamp", "raw_count", "location"])
-    # remove ms. to_datetime does not have a good time with this
-    df["timestamp"] = df["timestamp"].apply(lambda x: x.split(".")[0])
-    print(df.head())
-    df = df.assign(
-        timestamp=pd.to_datetime(df["timestamp"], format="%Y-%m-%dT%H:%M:%S"),
-        raw_count=pd.to_numeric(df["raw_count"]),
-    )
 
-    df = df[df["timestamp"] > min_day]
-    df = df.set_index("timestamp")
-    avg_count = np.round(df["raw_count"].median())
+def parse_time_arg(name, default):
+    value = request.args.get(name)
+    if not value:
+        return default
+    try:
+        ts = pd.Timestamp(value)
+    except ValueError:
+        return abort(400, f"Invalid {name}: {value}")
+    # Stored timestamps are naive UTC
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert("UTC").tz_localize(None)
+    return ts
 
-    dfs = (
+
+def smooth_counts(df, smoothing_minutes):
+    return (
         df.resample(f"{smoothing_minutes}min")
         .agg({"raw_count": np.mean, "location": "last"})
         .reset_index()
     )
-    max_count = dfs["raw_count"].fillna(0).max()
 
-    def fix_location(x):
-        if not x:
-            return ""
-        rval = request.base_url + "raw" + x.split("raw")[1]
-        if not ("127" in request.base_url or "192" in request.base_url):
-            rval = rval.replace("http:", "https:")
-        return rval
 
-    dfs["location"] = dfs["location"].map(fix_location)
+def fix_location(x):
+    if not isinstance(x, str) or "raw" not in x:
+        return ""
+    rval = request.url_root + "raw" + x.split("raw")[1]
+    if not ("127" in request.url_root or "192" in request.url_root):
+        rval = rval.replace("http:", "https:")
+    return rval
+
+
+@app.route("/data.json")
+def series_data():
+    """
+    Downsampled counts for [start, end], at most `points` points whatever the window length.
+
+    Query parameters: start / end (ISO timestamps, default to the window_size window),
+    smoothing_minutes, points, method (lttb or minmax) and format (columnar or records).
+    """
+    window_size, smoothing_minutes = parse_window_args()
+    start = parse_time_arg("start", pd.Timestamp(dt.datetime.today() - dt.timedelta(days=window_size)))
+    end = parse_time_arg("end", pd.Timestamp(dt.datetime.today()))
+    try:
+        points = int(request.args.get("points", DEFAULT_SERIES_POINTS))
+    except ValueError:
+        points = DEFAULT_SERIES_POINTS
+    points = min(max(points, 3), MAX_SERIES_POINTS)
+    method = request.args.get("method", "lttb")
+    if method not in downsample.METHODS:
+        return abort(400, f"Unknown method: {method}")
+    output_format = request.args.get("format", "columnar")
+    if output_format not in ("columnar", "records"):
+        return abort(400, f"Unknown format: {output_format}")
+
+    df = counts_cache.get()
+    df = df.iloc[df.index.searchsorted(start, side="left"):df.index.searchsorted(end, side="right")]
+    if smoothing_minutes > 1:
+        dfs = smooth_counts(df, smoothing_minutes)
+    else:
+        dfs = df.reset_index()
+    dfs = dfs.dropna(subset=["raw_count"])
+
+    # Milliseconds since the epoch are both compact and what Plotly takes for date axes
+    timestamps = dfs["timestamp"].values.astype("datetime64[ms]").astype(np.int64)
+    counts = dfs["raw_count"].to_numpy(dtype=float)
+    keep = downsample.METHODS[method](timestamps, counts, points)
+
+    series = {
+        "timestamp": timestamps[keep].tolist(),
+        "raw_count": np.round(counts[keep], 1).tolist(),
+        "location": [fix_location(x) for x in dfs["location"].values[keep]],
+    }
+    payload = {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "source_points": len(dfs),
+        "method": method,
+    }
+    if output_format == "columnar":
+        payload["columns"] = series
+    else:
+        payload["records"] = [dict(zip(series, row)) for row in zip(*series.values())]
+    return jsonify(payload)
+
+
+@app.route("/")
+def plot_data():
+    window_size, smoothing_minutes = parse_window_args()
+    date_range_max = dt.datetime.now().strftime("%Y%m%d")
+    min_day = dt.datetime.today() - dt.timedelta(days=window_size)
+    date_range_min = min_day.strftime("%Y%m%d")
+
+    # Cached copy of the data in GCS, sorted by timestamp
+    df = counts_cache.get()
+    df = df.iloc[df.index.searchsorted(min_day, side="right"):]
+    avg_count = np.round(df["raw_count"].median())
+
+    # Only the summary table is rendered here, the chart loads its points from /data.json
+    dfs = smooth_counts(df, smoothing_minutes)
+    max_count = dfs["raw_count"].fillna(0).max()
+
     peak_time_utc = pd.to_datetime(
         dfs[dfs["raw_count"] == max_count].timestamp.values[0],
         utc=True,
@@ -89,13 +313,10 @@ def plot_data():
         format="mixed",
     ).tz_convert("US/Eastern")
     latest_count = np.round(dfs["raw_count"].values[-1])
-    dfs["timestamp"] = dfs.timestamp.map(lambda x: x.isoformat())
-    dfs["raw_count"] = np.round(dfs["raw_count"])
-    img_url = dfs["location"].values[-1]
-    data = dfs[["timestamp", "raw_count", "location"]].to_dict("records")
+    img_url = fix_location(dfs["location"].values[-1])
     return render_template(
         "index.html",
-        data=data,
+        series_params={"window_size": window_size, "smoothing_minutes": smoothing_minutes},
         peak_time=peak_time_utc,
         max_count=np.round(max_count),
         avg_count=avg_count,
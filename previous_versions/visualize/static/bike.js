@@ -1,55 +1,42 @@
 
-// Function to format datetime with ET
-function formatDateTime(datetimeStr) {
-  const dateObj = new Date(datetimeStr);
-  dateObj.setTime(dateObj.getTime() - dateObj.getTimezoneOffset() * 60 * 1000); // Convert from UTC to local time
+// Points fetched for the first, quick render and for the full-resolution one
+const PREVIEW_POINTS = 200;
+const FULL_POINTS = Math.min(Math.max(Math.round(window.innerWidth * 2), 500), 5000);
 
-  const options = {
-    year: "numeric",
-    month: "short",
-    day: "numeric",
-    hour: "numeric",
-    minute: "numeric",
-    second: "numeric",
-    timeZone: "America/New_York", // Set time zone to ET
-  };
-  return dateObj; 
+// Fetch a downsampled, columnar slice of the series from the server
+function loadSeries(points, range) {
+  const params = new URLSearchParams({ ...seriesParams, points: points, format: 'columnar' });
+  if (range) {
+    params.set('start', new Date(range[0].replace(' ', 'T')).toISOString());
+    params.set('end', new Date(range[1].replace(' ', 'T')).toISOString());
+  }
+  return fetch('data.json?' + params.toString())
+    .then(response => response.json())
+    .then(payload => payload.columns);
 }
 
-// Format labels and data points
-const labels = bikeData.map(d => formatDateTime(d.timestamp));
-const dataPoints = bikeData.map(d => d.raw_count);
-const imgLocations = bikeData.map(d => d.location);
-
-
-// Calculate min and max values
-const minValue = Math.min(...dataPoints);
-const maxValue = Math.max(...dataPoints);
-
-function getColor(value) {
-  // Color mapping based on value
-  const normalizedValue = (value - minValue) / (maxValue - minValue);
-  const green = Math.round(255 * normalizedValue);
-  const red = Math.round(255 * (1 - normalizedValue));
-  return `rgba( ${green},${red}, 0, 0.5)`;
+function buildTrace(columns) {
+  return {
+    type: 'scatter',
+    mode: 'lines',
+    // Timestamps are UTC milliseconds, shown in the viewer's local time
+    x: columns.timestamp.map(ms => new Date(ms)),
+    y: columns.raw_count,
+    line: {
+      width: 1,
+      shape: 'linear', // Change to 'linear' for a straight line
+    },
+    fill: false,
+    hovertemplate: `Time: %{x}<br>Count: %{y}`, // Custom hover template
+    customdata: columns.location, // Add image locations as custom data
+  };
 }
 
-// Define Plotly data and layout
-const data = [{
-  type: 'scatter',
-  mode: 'lines',
-  x: labels,
-  y: dataPoints,
-  line: {
-    // color: dataPoints.map(getColor),
-    width: 1,
-    shape: 'linear', // Change to 'linear' for a straight line
-  },
-  fill: false,
-  hovertemplate: `Time: %{x}<br>Count: %{y}`, // Custom hover template
-  customdata: imgLocations, // Add image locations as custom data
-
-}];
+function yRange(values) {
+  const minValue = Math.min(...values);
+  const maxValue = Math.max(...values);
+  return [minValue - 0.1 * (maxValue - minValue), maxValue + 0.1 * (maxValue - minValue)]; // Add some padding
+}
 
 const layout = {
   title: {
@@ -68,7 +55,6 @@ const layout = {
     title: {
       text: 'Value'
     },
-    range: [minValue - 0.1 * (maxValue - minValue), maxValue + 0.1 * (maxValue - minValue)], // Add some padding
   },
   width: window.innerWidth,
   height: window.innerHeight * 0.8,
@@ -76,6 +62,7 @@ const layout = {
   legend: {
     visible: false, // Hide legend by default
   },
+  uirevision: 'series', // Keep the user's zoom when new points arrive
 };
 
 
@@ -85,24 +72,50 @@ imageContainer.id = 'imageContainer';
 imageContainer.style.display = 'inline-block'; // Display the image container inline
 imageContainer.style.verticalAlign = 'top'; // Align the container to the top
 
-Plotly.newPlot(timeSeriesChart, data, layout);
+function render(columns, keepRange) {
+  if (!keepRange) {
+    layout.yaxis.range = yRange(columns.raw_count);
+  }
+  return Plotly.react(timeSeriesChart, [buildTrace(columns)], layout);
+}
+
+// Progressive load: a coarse preview first, then the full-resolution series
+loadSeries(PREVIEW_POINTS)
+  .then(columns => render(columns))
+  .then(() => {
+    bindHover();
+    return loadSeries(FULL_POINTS);
+  })
+  .then(columns => render(columns))
+  .then(() => {
+    // Re-fetch at full resolution for the zoomed range, the payload size stays the same
+    timeSeriesChart.on('plotly_relayout', function (event) {
+      if (event['xaxis.range[0]'] && event['xaxis.range[1]']) {
+        const range = [event['xaxis.range[0]'], event['xaxis.range[1]']];
+        loadSeries(FULL_POINTS, range).then(columns => render(columns, true));
+      } else if (event['xaxis.autorange']) {
+        loadSeries(FULL_POINTS).then(columns => render(columns));
+      }
+    });
+  });
 
 // Add hover event listener
-timeSeriesChart.on('plotly_hover', function (event) {
-  const imageLocation = event.points[0].customdata;
-  // Make an HTTP GET request to the image location
-  fetch(imageLocation)
-    .then(response => response.blob())
-    .then(blob => {
-      // Display the image
-      const imageUrl = URL.createObjectURL(blob);
-      const imageElement = document.createElement('img');
-      imageElement.src = imageUrl;
+// Reuse a single <img> and let the browser cache (ETag / max-age on /raw) serve repeat hovers
+const imageElement = document.createElement('img');
+imageElement.alt = 'Snapshot';
+function bindHover() {
+  timeSeriesChart.on('plotly_hover', function (event) {
+    const imageLocation = event.points[0].customdata;
+    if (!imageLocation || imageElement.getAttribute('src') === imageLocation) {
+      return;
+    }
+    imageElement.src = imageLocation;
+    if (imageElement.parentNode !== imageContainer) {
       // Clear previous image
       while (imageContainer.firstChild) {
         imageContainer.removeChild(imageContainer.firstChild);
       }
-      // Append the new image to the container
       imageContainer.appendChild(imageElement);
-    });
-});
+    }
+  });
+}
@@ -0,0 +1,101 @@
+"""
+Cold-start benchmark for the scraper Cloud Function.
+
+Each run starts a fresh interpreter, imports main and makes the first camera-list
+request through the module-level session, reporting:
+
+    import_ms       time to import main
+    first_fetch_ms  time from interpreter start to the first response
+    process_ms      wall time of the whole child process, as seen by the parent
+
+Usage:
+    python bench_cold_start.py --runs 5
+    python bench_cold_start.py --offline --max-import-ms 300   # CI: fail on import regressions
+    python bench_cold_start.py --importtime                    # slowest modules imported by main
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CAMERAS_URL = "https://webcams.nyctmc.org/api/cameras"
+
+CHILD = """
+import json, os, time
+t0 = time.perf_counter()
+import main
+t_import = time.perf_counter()
+result = {'import_ms': (t_import - t0) * 1000}
+if os.environ.get('BENCH_STORAGE'):
+    main.get_storage_client()
+    result['storage_client_ms'] = (time.perf_counter() - t_import) * 1000
+if os.environ.get('BENCH_URL'):
+    response = main.get_http_session().get(os.environ['BENCH_URL'], timeout=60)
+    result['status'] = response.status_code
+result['first_fetch_ms'] = (time.perf_counter() - t0) * 1000
+print(json.dumps(result))
+"""
+
+
+def run_once(url, storage):
+    env = dict(os.environ, BENCH_URL=url or '', BENCH_STORAGE='1' if storage else '')
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", CHILD], cwd=HERE, env=env, capture_output=True, text=True, check=True)
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result['process_ms'] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def importtime(top):
+    """Slowest modules (cumulative microseconds) pulled in by `import main`."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=HERE,
+                         capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--url", default=CAMERAS_URL, help="URL used for the first fetch")
+    parser.add_argument("--offline", action="store_true", help="skip the first fetch, measure imports only")
+    parser.add_argument("--storage", action="store_true", help="also create the storage client")
+    parser.add_argument("--importtime", action="store_true", help="list the slowest imports instead")
+    parser.add_argument("--max-import-ms", type=float, help="exit 1 if the median import time is above this")
+    parser.add_argument("--max-first-fetch-ms", type=float, help="exit 1 if the median time-to-first-fetch is above this")
+    args = parser.parse_args()
+
+    if args.importtime:
+        for cumulative_us, name in importtime(20):
+            print(f"{cumulative_us / 1000:8.1f} ms  {name}")
+        return 0
+
+    url = None if args.offline else args.url
+    runs = [run_once(url, args.storage) for _ in range(args.runs)]
+    summary = {
+        key: round(statistics.median(r[key] for r in runs), 1)
+        for key in runs[0] if key.endswith("_ms")
+    }
+    print(json.dumps({'runs': len(runs), 'median': summary}, indent=2))
+
+    failed = False
+    if args.max_import_ms is not None and summary['import_ms'] > args.max_import_ms:
+        print(f"import_ms {summary['import_ms']} > {args.max_import_ms}", file=sys.stderr)
+        failed = True
+    if args.max_first_fetch_ms is not None and summary['first_fetch_ms'] > args.max_first_fetch_ms:
+        print(f"first_fetch_ms {summary['first_fetch_ms']} > {args.max_first_fetch_ms}", file=sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+"""
+Scale test for the file index (create_file_index_gcs / list_blobs_for_camera).
+
+Runs the real indexer against a local fake object store holding a synthetic bucket:
+data/{safe_name}/{Y}/{M}/{D}/{H}/{timestamp}_{id}.jpg keys for a number of cameras
+over a number of days. Keys are generated while they are listed, so the store itself
+takes no memory. Each scale point runs in a fresh process and reports:
+
+    objects             objects in the synthetic bucket
+    wall_s              wall time of the indexer
+    rss_before_mb       process RSS before the indexer ran (includes the seeded index)
+    peak_rss_mb         peak process RSS while the indexer ran (whole run where the
+                        high-water mark cannot be reset, i.e. outside Linux)
+    list_calls          list_blobs calls made by the indexer
+    list_pages          listing requests they cost (1000 objects per page, like GCS)
+    blobs_listed        objects the listings returned
+    index_mb            size of the uploaded metadata/file_index.json
+
+By default the bucket starts with an index of everything but the last hour, as in steady
+state; --cold starts without one.
+
+Usage:
+    python bench_index_scale.py --cameras 100,300 --days 30,90 --frames-per-hour 12
+    python bench_index_scale.py --cameras 800 --days 90 --cold --output index_scale.json
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytz
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+INDEX_PATH = 'metadata/file_index.json'
+LIST_PAGE_SIZE = 1000
+
+
+def camera_list(count):
+    return [
+        {'id': f"{i:08x}-0000-4000-8000-{i:012x}", 'name': f"Camera {i} @ Street {i % 97} Ave {i % 13}"}
+        for i in range(count)
+    ]
+
+
+def safe_camera_name(name):
+    return "".join(c if c.isalnum() else "_" for c in name)
+
+
+class FakeBlob:
+    __slots__ = ('name', 'time_created', 'bucket')
+
+    def __init__(self, name, time_created=None, bucket=None):
+        self.name = name
+        self.time_created = time_created
+        self.bucket = bucket
+
+    @property
+    def generation(self):
+        return self.bucket.generations.get(self.name)
+
+    def exists(self):
+        return self.name in self.bucket.stored
+
+    def download_as_string(self, **kwargs):
+        return self.bucket.stored[self.name]
+
+    download_as_bytes = download_as_string
+
+    def upload_from_string(self, data, content_type=None, if_generation_match=None):
+        self.bucket.stored[self.name] = data.encode() if isinstance(data, str) else data
+        self.bucket.generations[self.name] = self.bucket.generations.get(self.name, 0) + 1
+
+
+class SyntheticBucket:
+    """
+    Frames for `cameras` every 3600 / frames_per_hour seconds over the `days` days up to `end`
+    (New York time), listed in name order like GCS. Other objects live in `stored`.
+    """
+
+    def __init__(self, cameras, days, frames_per_hour, end):
+        self.cameras = cameras
+        self.days = days
+        self.frames_per_hour = frames_per_hour
+        self.end = end.replace(minute=0, second=0, microsecond=0)
+        self.start = self.end - timedelta(days=days)
+        self.stored = {}
+        self.generations = {}
+        self.list_calls = 0
+        self.list_pages = 0
+        self.blobs_listed = 0
+        self.lock = threading.Lock()
+
+    @property
+    def object_count(self):
+        return len(self.cameras) * self.days * 24 * self.frames_per_hour
+
+    def blob(self, name):
+        return FakeBlob(name, bucket=self)
+
+    def get_blob(self, name):
+        return FakeBlob(name, bucket=self) if name in self.stored else None
+
+    def camera_keys(self, camera):
+        """(name, time_created) of every frame of a camera, in name order."""
+        safe_name = safe_camera_name(camera['name'])
+        step = timedelta(seconds=3600 // self.frames_per_hour)
+        hour = self.start
+        while hour < self.end:
+            prefix = f"data/{safe_name}/{hour.year}/{hour.month:02d}/{hour.day:02d}/{hour.hour:02d}/"
+            created = hour.astimezone(pytz.utc)
+            for i in range(self.frames_per_hour):
+                captured = hour + step * i
+                yield f"{prefix}{captured:%Y%m%d_%H%M%S}_{camera['id']}.jpg", created + step * i
+            hour += timedelta(hours=1)
+
+    def list_blobs(self, prefix='', **kwargs):
+        with self.lock:
+            self.list_calls += 1
+        return self._list(prefix)
+
+    def _list(self, prefix):
+        # Called from the indexer's worker threads, counts are added up once the listing ends
+        listed = 0
+        try:
+            for camera in self.cameras:
+                camera_prefix = f"data/{safe_camera_name(camera['name'])}/"
+                if not (camera_prefix.startswith(prefix) or prefix.startswith(camera_prefix)):
+                    continue
+                for name, created in self.camera_keys(camera):
+                    if name.startswith(prefix):
+                        listed += 1
+                        yield FakeBlob(name, created, self)
+        finally:
+            with self.lock:
+                self.list_pages += max(1, -(-listed // LIST_PAGE_SIZE))
+                self.blobs_listed += listed
+
+
+class FakeStorageClient:
+    def __init__(self, bucket):
+        self._bucket = bucket
+
+    def bucket(self, name):
+        return self._bucket
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+        self.status_code = 200
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+class FakeSession:
+    def __init__(self, cameras):
+        self.cameras = cameras
+
+    def get(self, url, **kwargs):
+        return FakeResponse(list(self.cameras))
+
+
+def current_rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+def reset_peak_rss():
+    """Reset the kernel's RSS high-water mark (Linux), so building the seed index is not counted."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+
+def run_point(cameras, days, frames_per_hour, cold):
+    """Run the indexer once against a fresh synthetic bucket, in this process."""
+    import main
+
+    end = datetime.now(pytz.timezone('America/New_York'))
+    camera_dicts = camera_list(cameras)
+    bucket = SyntheticBucket(camera_dicts, days, frames_per_hour, end)
+    if not cold:
+        last_hour = bucket.end - timedelta(hours=1)
+        seeded = [
+            name
+            for camera in camera_dicts
+            for name, created in bucket.camera_keys(camera)
+            if created < last_hour.astimezone(pytz.utc)
+        ]
+        bucket.blob(INDEX_PATH).upload_from_string(json.dumps({'files': seeded, 'total_files': len(seeded)}))
+        del seeded
+
+    main._storage_client = FakeStorageClient(bucket)
+    main._http_session = FakeSession(camera_dicts)
+    bucket.list_calls = bucket.list_pages = bucket.blobs_listed = 0
+
+    reset_peak_rss()
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    main._create_file_index_gcs('synthetic')
+    wall = time.perf_counter() - start
+
+    index = bucket.stored.get(INDEX_PATH, b'')
+    return {
+        'cameras': cameras,
+        'days': days,
+        'frames_per_hour': frames_per_hour,
+        'cold': cold,
+        'objects': bucket.object_count,
+        'wall_s': round(wall, 2),
+        'rss_before_mb': round(rss_before, 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'list_calls': bucket.list_calls,
+        'list_pages': bucket.list_pages,
+        'blobs_listed': bucket.blobs_listed,
+        'index_mb': round(len(index) / (1024 * 1024), 1),
+    }
+
+
+def run_in_child(cameras, days, frames_per_hour, cold):
+    args = [sys.executable, os.path.abspath(__file__), '--child', str(cameras), str(days), str(frames_per_hour)]
+    if cold:
+        args.append('--cold')
+    out = subprocess.run(args, cwd=HERE, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1] if out.stderr.strip() else f"exit {out.returncode}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def parse_ints(value):
+    return [int(v) for v in value.split(',')]
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        import logging
+        logging.disable(logging.INFO)
+        cameras, days, frames_per_hour = (int(v) for v in sys.argv[2:5])
+        print(json.dumps(run_point(cameras, days, frames_per_hour, '--cold' in sys.argv)))
+        return 0
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cameras', type=parse_ints, default=[100, 300], help='comma-separated camera counts')
+    parser.add_argument('--days', type=parse_ints, default=[7, 30], help='comma-separated history lengths')
+    parser.add_argument('--frames-per-hour', type=int, default=12)
+    parser.add_argument('--cold', action='store_true', help='start without an existing index')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'cameras':>8} {'days':>5} {'objects':>11} {'wall_s':>8} {'peak_mb':>8} {'pages':>8} {'listed':>11} {'index_mb':>9}")
+    for cameras in args.cameras:
+        for days in args.days:
+            try:
+                result = run_in_child(cameras, days, args.frames_per_hour, args.cold)
+            except RuntimeError as e:
+                print(f"{cameras:>8} {days:>5} failed: {e}")
+                continue
+            results.append(result)
+            print(f"{cameras:>8} {days:>5} {result['objects']:>11,} {result['wall_s']:>8} {result['peak_rss_mb']:>8} "
+                  f"{result['list_pages']:>8,} {result['blobs_listed']:>11,} {result['index_mb']:>9}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'created': datetime.now().isoformat(timespec='seconds'), 'results': results}, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""
+metadata/file_index.json, the list of every frame path the viewers can show.
+
+The scraper adds new frames to it after each sweep and the retention job (retention.py)
+removes the frames it deletes. Both read-modify-write the same object, so every write is
+conditional on the generation that was read and is redone on a conflict.
+"""
+import json
+import logging
+from datetime import datetime
+
+import pytz
+
+logger = logging.getLogger()
+
+INDEX_PATH = 'metadata/file_index.json'
+UPDATE_ATTEMPTS = 5
+
+
+def load_file_index(bucket):
+    """(set of paths, generation); generation 0 when there is no index yet."""
+    blob = bucket.get_blob(INDEX_PATH)
+    if blob is None:
+        return set(), 0
+    try:
+        files = set(json.loads(blob.download_as_bytes(if_generation_match=blob.generation)).get('files', []))
+    except json.JSONDecodeError:
+        logger.warning("Could not decode existing index file. Starting from scratch.")
+        files = set()
+    return files, blob.generation
+
+
+def save_file_index(bucket, files, generation):
+    """Write the index unless it changed since `generation` was read (raises PreconditionFailed)."""
+    all_files = sorted(files)
+    index = {
+        'files': all_files,
+        'total_files': len(all_files),
+        'last_updated': datetime.now(pytz.timezone('America/New_York')).isoformat()
+    }
+    bucket.blob(INDEX_PATH).upload_from_string(json.dumps(index, indent=2), 'application/json', if_generation_match=generation)
+
+
+def update_file_index(bucket, update, loaded=None):
+    """
+    Apply update(set of paths) -> set of paths to the index and save it, returns the saved set.
+
+    loaded: the (files, generation) of an earlier load_file_index, used for the first attempt.
+    """
+    from google.api_core.exceptions import PreconditionFailed
+
+    for attempt in range(UPDATE_ATTEMPTS):
+        try:
+            files, generation = loaded if attempt == 0 and loaded is not None else load_file_index(bucket)
+            files = update(set(files))
+            save_file_index(bucket, files, generation)
+            return files
+        except PreconditionFailed:
+            logger.info("File index changed while it was being updated, retrying.")
+    raise RuntimeError(f"{INDEX_PATH} kept changing, gave up after {UPDATE_ATTEMPTS} attempts")
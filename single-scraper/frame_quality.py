@@ -0,0 +1,200 @@
+"""
+Quality gate for camera frames, run before the full decode.
+
+The frame is decoded at 1/8 resolution (JPEG DCT scaling, grayscale) and rejected as:
+
+    truncated       no JPEG end-of-image marker, or the decoder gives up
+    dark            mean luminance below DARK_MEAN (night frames with no lights, dead sensor)
+    flat            luminance standard deviation below FLAT_STDDEV (blank / single-color frame)
+    placeholder     average hash within PLACEHOLDER_MAX_DISTANCE bits of a known placeholder
+
+Known placeholders are kept in metadata/placeholder_hashes.json, keyed by the SHA-256 of
+the frame bytes. A frame that several cameras return byte for byte in the same sweep (the
+TMC "camera unavailable" image) is added to it; similar-looking scenes (night, fog, snow)
+never are, as their bytes differ. A learned placeholder expires once no camera has sent
+it for PLACEHOLDER_TTL_DAYS; entries added by hand with "manual": true never expire.
+Per-camera counts of checked and rejected frames are kept in metadata/frame_quality.json.
+
+    python frame_quality.py frame.jpg ...   # statistics, hash and verdict of local frames
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+
+from poll_schedule import average_hash
+
+logger = logging.getLogger()
+
+QUALITY_PATH = 'metadata/frame_quality.json'
+PLACEHOLDERS_PATH = 'metadata/placeholder_hashes.json'
+# off: store everything; tag: store rejected frames with a quality tag; skip: do not store them
+QUALITY_GATE = os.environ.get('QUALITY_GATE', 'tag').lower()
+REJECTED = "Rejected"
+
+DRAFT_SCALE = 8
+DARK_MEAN = 16
+FLAT_STDDEV = 3.0
+PLACEHOLDER_MAX_DISTANCE = 5
+PLACEHOLDER_MIN_CAMERAS = 3  # distinct cameras sending the identical frame in one sweep
+PLACEHOLDER_TTL_DAYS = int(os.environ.get('PLACEHOLDER_TTL_DAYS', 30))
+
+
+class FrameQuality:
+    def __init__(self, reason=None, mean=None, stddev=None, frame_hash=None, sha256=None):
+        self.reason = reason
+        self.mean = mean
+        self.stddev = stddev
+        self.hash = frame_hash
+        self.sha256 = sha256
+
+    @property
+    def ok(self):
+        return self.reason is None
+
+    def __repr__(self):
+        return f"FrameQuality(reason={self.reason}, mean={self.mean}, stddev={self.stddev}, hash={self.hash})"
+
+
+def analyze_frame(data, placeholders=()):
+    """FrameQuality of raw image bytes, from a reduced-resolution grayscale decode."""
+    from PIL import Image, ImageStat
+
+    if data[:2] == b'\xff\xd8' and data.rstrip(b'\0')[-2:] != b'\xff\xd9':
+        return FrameQuality('truncated')
+    try:
+        img = Image.open(io.BytesIO(data))
+        if img.format == 'JPEG':
+            img.draft('L', (max(1, img.width // DRAFT_SCALE), max(1, img.height // DRAFT_SCALE)))
+        small = img.convert('L')
+    except (OSError, SyntaxError, ValueError):
+        return FrameQuality('truncated')
+    sha256 = hashlib.sha256(data).hexdigest()
+
+    stat = ImageStat.Stat(small)
+    mean, stddev = round(stat.mean[0], 1), round(stat.stddev[0], 1)
+    frame_hash = average_hash(small)
+    reason = None
+    if mean < DARK_MEAN:
+        reason = 'dark'
+    elif stddev < FLAT_STDDEV:
+        reason = 'flat'
+    elif any(bin(frame_hash ^ known).count('1') <= PLACEHOLDER_MAX_DISTANCE for known in placeholders):
+        reason = 'placeholder'
+    return FrameQuality(reason, mean, stddev, frame_hash, sha256)
+
+
+class QualityGate:
+    """
+    Checks frames at ingest and keeps per-camera rejection counts.
+
+    mode is QUALITY_GATE: 'tag' stores rejected frames with a `quality` metadata tag
+    (which the detector skips), 'skip' does not store them at all. Truncated frames
+    cannot be re-encoded and are never stored.
+    """
+
+    def __init__(self, bucket, mode=QUALITY_GATE):
+        self.bucket = bucket
+        self.mode = mode
+        self.cameras = {}
+        self.known = {}  # sha256 -> {"hash", "first_seen", "last_seen", "cameras", "manual"}
+        self.sweep_digests = {}  # sha256 -> (average hash, cameras that sent it this sweep)
+        self.sweep_checked = 0
+        self.sweep_rejected = 0
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.mode in ('tag', 'skip')
+
+    @property
+    def placeholders(self):
+        """Average hashes of the known placeholders, as matched by analyze_frame."""
+        return {int(entry['hash'], 16) for entry in self.known.values()}
+
+    def load(self):
+        for path in (QUALITY_PATH, PLACEHOLDERS_PATH):
+            try:
+                blob = self.bucket.get_blob(path)
+                if blob is None:
+                    continue
+                content = json.loads(blob.download_as_bytes())
+                if path == QUALITY_PATH:
+                    self.cameras = content
+                else:
+                    # Hashes learned by the older, similarity-based rule ({"hashes": [...]}) are dropped
+                    self.known = content.get('placeholders', {})
+            except Exception as e:
+                logger.warning(f"Could not load {path}, starting without it: {e}")
+        return self
+
+    def save(self, now=None):
+        now = now or datetime.now(timezone.utc)
+        expired_before = (now - timedelta(days=PLACEHOLDER_TTL_DAYS)).isoformat(timespec='seconds')
+        with self.lock:
+            before = json.dumps(self.known, sort_keys=True)
+            learned = []
+            for sha256, (frame_hash, cameras) in self.sweep_digests.items():
+                entry = self.known.get(sha256)
+                if entry is None and len(cameras) >= PLACEHOLDER_MIN_CAMERAS:
+                    entry = self.known[sha256] = {
+                        'hash': f"{frame_hash:016x}", 'first_seen': now.isoformat(timespec='seconds'), 'cameras': 0,
+                    }
+                    learned.append(sha256)
+                if entry is not None:
+                    entry['last_seen'] = now.isoformat(timespec='seconds')
+                    entry['cameras'] = max(entry.get('cameras', 0), len(cameras))
+            expired = [
+                sha256 for sha256, entry in self.known.items()
+                if not entry.get('manual') and entry.get('last_seen', '') < expired_before
+            ]
+            for sha256 in expired:
+                del self.known[sha256]
+            changed = json.dumps(self.known, sort_keys=True) != before
+            stats = json.dumps(self.cameras, separators=(',', ':'))
+            placeholders = json.dumps({'placeholders': self.known}, separators=(',', ':'))
+        self.bucket.blob(QUALITY_PATH).upload_from_string(stats, 'application/json')
+        if learned or expired:
+            logger.info(f"Placeholders: learned {len(learned)} frames sent identically by several cameras, expired {len(expired)}.")
+        if changed:
+            self.bucket.blob(PLACEHOLDERS_PATH).upload_from_string(placeholders, 'application/json')
+
+    def record(self, camera_id, camera_name, quality):
+        """Count the FrameQuality that transcode.process_frame computed for a frame (in the CPU worker pool)."""
+        with self.lock:
+            stats = self.cameras.setdefault(camera_id, {'name': camera_name, 'checked': 0, 'rejected': 0, 'reasons': {}})
+            stats['checked'] += 1
+            self.sweep_checked += 1
+            if quality.sha256 and (quality.ok or quality.reason == 'placeholder'):
+                self.sweep_digests.setdefault(quality.sha256, (quality.hash, set()))[1].add(camera_id)
+            if not quality.ok:
+                stats['rejected'] += 1
+                stats['reasons'][quality.reason] = stats['reasons'].get(quality.reason, 0) + 1
+                self.sweep_rejected += 1
+        return quality
+
+    def rejection_rate(self, camera_id):
+        stats = self.cameras.get(camera_id)
+        return stats['rejected'] / stats['checked'] if stats and stats['checked'] else 0.0
+
+    def report(self, top=10):
+        """Log this sweep's rejections and the cameras with the highest rejection rate overall."""
+        logger.info(f"Quality gate ({self.mode}): rejected {self.sweep_rejected} of {self.sweep_checked} frames this sweep.")
+        worst = sorted(
+            (camera_id for camera_id, stats in self.cameras.items() if stats['rejected']),
+            key=self.rejection_rate, reverse=True,
+        )[:top]
+        for camera_id in worst:
+            stats = self.cameras[camera_id]
+            logger.info(f"  {stats['name']}: {self.rejection_rate(camera_id):.0%} of {stats['checked']} frames rejected {stats['reasons']}")
+        return {'checked': self.sweep_checked, 'rejected': self.sweep_rejected}
+
+
+if __name__ == '__main__':
+    for path in sys.argv[1:]:
+        with open(path, 'rb') as f:
+            print(path, analyze_frame(f.read()))
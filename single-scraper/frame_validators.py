@@ -0,0 +1,78 @@
+import hashlib
+import json
+import logging
+import threading
+
+logger = logging.getLogger()
+
+VALIDATORS_PATH = 'metadata/frame_validators.json'
+UNCHANGED = "Unchanged"
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class FrameValidators:
+    """
+    Each camera's last ETag / Last-Modified and the SHA-256 of its last stored frame.
+
+    They turn the image request into a conditional one. A 304, a repeated ETag or
+    identical bytes mean the camera has not produced a new frame, so the sweep can
+    skip it before decoding, re-encoding or uploading anything.
+
+    path: the object they are kept in; each scraper sharing a bucket needs its own.
+    """
+
+    def __init__(self, bucket, path=VALIDATORS_PATH):
+        self.bucket = bucket
+        self.path = path
+        self.cameras = {}
+        self.lock = threading.Lock()
+
+    def load(self):
+        try:
+            blob = self.bucket.get_blob(self.path)
+            if blob is not None:
+                self.cameras = json.loads(blob.download_as_bytes())
+        except Exception as e:
+            logger.warning(f"Could not load frame validators, fetching every frame in full: {e}")
+        return self
+
+    def save(self):
+        with self.lock:
+            payload = json.dumps(self.cameras, separators=(',', ':'))
+        self.bucket.blob(self.path).upload_from_string(payload, 'application/json')
+
+    def request_headers(self, camera_id):
+        """If-None-Match / If-Modified-Since for the camera's last stored frame."""
+        with self.lock:
+            known = self.cameras.get(camera_id, {})
+        headers = {}
+        if known.get('etag'):
+            headers['If-None-Match'] = known['etag']
+        if known.get('last_modified'):
+            headers['If-Modified-Since'] = known['last_modified']
+        return headers
+
+    def is_unchanged(self, camera_id, response):
+        """True for a 304, or a 200 whose ETag or bytes match the last stored frame."""
+        if response.status_code == 304:
+            return True
+        with self.lock:
+            known = self.cameras.get(camera_id)
+        if not known:
+            return False
+        etag = response.headers.get('ETag')
+        if etag and etag == known.get('etag'):
+            return True
+        return known.get('sha256') == content_hash(response.content)
+
+    def record(self, camera_id, response):
+        """Remember the validators of a frame once it has been stored."""
+        with self.lock:
+            self.cameras[camera_id] = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'sha256': content_hash(response.content),
+            }
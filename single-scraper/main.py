@@ -1,26 +1,97 @@
 import os
 import requests
+from requests.adapters import HTTPAdapter
 from datetime import datetime, timedelta
 import pytz
 import json
 import logging
-from google.cloud import storage
-from PIL import Image
-import imagehash
-import io
-import base64
 import concurrent.futures
+import threading
 import time
 
+from file_index import load_file_index, update_file_index
+from frame_quality import REJECTED, QualityGate
+from frame_validators import UNCHANGED, FrameValidators
+from poll_schedule import PollSchedule
+from transcode import RENDITION_SPECS, process_frame
+from sampling_profiler import merge_profiles, profiled
+from stages import SweepStages
+from sweep import STORED, SWEEP_BUDGET_SECONDS, SWEEP_SAFETY_MARGIN_SECONDS, SweepState, run_sweep
+
+# google-cloud-storage, PIL and packing are imported on first use (see get_storage_client,
+# download_and_process_camera, pack_hourly_frames) to keep cold starts short.
+
 BUCKET_NAME = 'nyc-webcam-capture'
+MAX_WORKERS = int(os.environ.get('MAX_WORKERS', 4))  # I/O threads fetching/uploading cameras; HTTP pools are sized to match
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/tmp/profiles')
+PROFILE_PREFIX = 'metadata/profiles'
+# Poll each camera at its own interval (see poll_schedule.py) instead of every camera on every trigger
+ADAPTIVE_POLLING = os.environ.get('ADAPTIVE_POLLING', '').lower() in ('1', 'true', 'yes')
+DEADLINE_REACHED = "sweep deadline reached"
+# A new frame that landed in the same second as the stored one and was dropped (not "Unchanged")
+DUPLICATE = "Duplicate"
+POLL_SLACK_SECONDS = int(os.environ.get('POLL_SLACK_SECONDS', 30))  # about half the trigger period
+
+# Extra renditions written next to each capture, e.g. RENDITIONS=thumb,detect (see transcode.py)
+RENDITIONS = [r for r in os.environ.get('RENDITIONS', '').split(',') if r in RENDITION_SPECS]
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-def download_and_process_camera(camera, bucket):
+_clients_lock = threading.Lock()
+_http_session = None
+_storage_client = None
+
+def get_http_session():
+    """
+    Module-level requests session, reused across warm invocations.
+    """
+    global _http_session
+    with _clients_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _http_session = session
+        return _http_session
+
+def get_storage_client():
+    """
+    Module-level storage client, reused across warm invocations, with a connection
+    pool as large as the number of worker threads uploading through it.
+    """
+    global _storage_client
+    with _clients_lock:
+        if _storage_client is None:
+            from google.cloud import storage
+            client = storage.Client()
+            client._http.mount("https://", HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS))
+            _storage_client = client
+        return _storage_client
+
+def rendition_path(rendition, filename):
+    """Renditions live under a parallel prefix: data/X/... -> thumb/data/X/..."""
+    return f"{rendition}/{filename}"
+
+def download_and_process_camera(camera, bucket, schedule=None, deadline=None, validators=None, quality_gate=None, stages=None):
     """
     Downloads and processes a single camera image with retry logic.
+
+    With a PollSchedule, the frame's average hash (or the failure) is recorded to adapt
+    the camera's polling interval. deadline (a time.monotonic() value) caps the request
+    timeouts and retries so the camera finishes within the sweep budget. With
+    FrameValidators the request is conditional, and a frame the camera has not replaced
+    yet returns "Unchanged: ..." without being decoded or uploaded. A QualityGate checks
+    the frame on a reduced decode first; rejected frames are stored with a `quality` tag,
+    or not at all ("Rejected: ...") in skip mode.
+
+    The CPU work (quality check, decode, hash, re-encode, renditions) goes through
+    stages.run_cpu, i.e. the CPU process pool, and each stage is tracked in its gauge.
     """
+    from google.api_core.exceptions import PreconditionFailed
+
+    stages = stages or SweepStages(1)
     camera_name = camera.get("name")
     camera_id = camera.get("id")
     logger.info(f"Attempting to scrape camera: {camera_name} ({camera_id})")
@@ -29,10 +100,43 @@ def download_and_process_camera(camera, bucket):
     for i in range(retries):
         try:
             url = f"https://webcams.nyctmc.org/api/cameras/{camera_id}/image"
-            
-            response = requests.get(url, timeout=60)
+
+            timeout = 60
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.monotonic())
+                if timeout <= 1:
+                    return f"Error: {camera_name}: {DEADLINE_REACHED}"
+
+            headers = validators.request_headers(camera_id) if validators is not None else None
+            with stages.fetch.track():
+                response = get_http_session().get(url, timeout=timeout, headers=headers)
             response.raise_for_status()
 
+            if validators is not None and validators.is_unchanged(camera_id, response):
+                logger.info(f"Frame unchanged for {camera_name} ({camera_id}), skipping")
+                if schedule is not None:
+                    schedule.record_unchanged(camera_id)
+                return f"{UNCHANGED}: {camera_name}"
+
+            gate = quality_gate is not None and quality_gate.enabled
+            processed = stages.run_cpu(
+                process_frame, response.content, tuple(RENDITIONS),
+                quality_gate.mode if gate else None, frozenset(quality_gate.placeholders) if gate else (),
+            )
+            quality = processed['quality']
+            if quality is not None:
+                quality_gate.record(camera_id, camera_name, quality)
+            if not processed['store']:
+                logger.info(f"Rejected {quality.reason} frame from {camera_name} ({camera_id})")
+                if quality.reason != 'truncated':
+                    if schedule is not None:
+                        schedule.record_success(camera_id, quality.hash)
+                    if validators is not None:
+                        validators.record(camera_id, response)
+                return f"{REJECTED}: {camera_name}: {quality.reason}"
+            if schedule is not None:
+                schedule.record_success(camera_id, processed['hash'])
+
             ny_tz = pytz.timezone('America/New_York')
             now = datetime.now(ny_tz)
             timestamp = now.strftime('%Y%m%d_%H%M%S')
@@ -41,42 +145,92 @@ def download_and_process_camera(camera, bucket):
             
             filename = f"data/{safe_name}/{now.year}/{now.month:02d}/{now.day:02d}/{now.hour:02d}/{timestamp}_{camera_id}.jpg"
             
-            img_byte_arr = io.BytesIO()
-            img = Image.open(io.BytesIO(response.content))
-            if img.mode == 'RGBA':
-                img = img.convert('RGB')
-            img.save(img_byte_arr, format='JPEG', quality=85)
             logger.info(f"Successfully processed image for {camera_name} ({camera_id})")
-            img_byte_arr = img_byte_arr.getvalue()
 
-            blob = bucket.blob(filename)
-            blob.upload_from_string(img_byte_arr, 'image/jpeg')
+            with stages.upload.track():
+                blob = bucket.blob(filename)
+                if quality is not None and not quality.ok:
+                    # Kept for inspection, but left out of detection work lists
+                    blob.metadata = {'quality': quality.reason}
+                try:
+                    # Never replace a capture taken in the same second (names have 1 s resolution)
+                    blob.upload_from_string(processed['jpeg'], 'image/jpeg', if_generation_match=0)
+                except PreconditionFailed:
+                    logger.warning(f"{filename} already exists, new frame from {camera_name} dropped")
+                    return f"{DUPLICATE}: {camera_name}"
+
+                for rendition, error in processed['rendition_errors'].items():
+                    logger.warning(f"Failed to make {rendition} rendition for {camera_name} ({camera_id}): {error}")
+                for rendition, data in processed['renditions'].items():
+                    try:
+                        bucket.blob(rendition_path(rendition, filename)).upload_from_string(data, 'image/jpeg')
+                    except Exception as e:
+                        logger.warning(f"Failed to write {rendition} rendition for {camera_name} ({camera_id}): {e}")
+            if validators is not None:
+                validators.record(camera_id, response)
             
             logger.info(f"Successfully scraped and uploaded image for {camera_name} ({camera_id}) to gs://{BUCKET_NAME}/{filename}")
             print(f"Image saved to: gs://{BUCKET_NAME}/{filename}")
             time.sleep(0.2) # Add a 0.2-second sleep
-            return f"Success: {camera_name}"
+            return f"{STORED}: {camera_name}"
 
         except requests.exceptions.RequestException as e:
             logger.warning(f"Attempt {i + 1} of {retries} failed for camera {camera_name} ({camera_id}): {e}")
-            if i < retries - 1:
+            if i < retries - 1 and (deadline is None or deadline - time.monotonic() > 5):
                 time.sleep(2) # Sleep for 2 seconds before retrying
             else:
                 logger.error(f"All retries failed for camera {camera_name} ({camera_id})")
+                if schedule is not None:
+                    schedule.record_failure(camera_id)
                 return f"Error: {camera_name}: {e}"
     
     return f"Error: {camera_name}: All retries failed"
 
+def upload_profile(paths, run_name):
+    """
+    Uploads profiler artifacts next to the run's metadata, under metadata/profiles/{run_name}/.
+    """
+    if not paths:
+        return
+    try:
+        bucket = get_storage_client().bucket(BUCKET_NAME)
+        for path in paths:
+            blob = bucket.blob(f"{PROFILE_PREFIX}/{run_name}/{os.path.basename(path)}")
+            blob.upload_from_filename(path, content_type='text/plain')
+        logger.info(f"Uploaded profile to gs://{BUCKET_NAME}/{PROFILE_PREFIX}/{run_name}/")
+    except Exception as e:
+        logger.error(f"Failed to upload profile {run_name}: {e}")
+
+def profile_run_name(name):
+    return f"{datetime.now(pytz.timezone('America/New_York')).strftime('%Y%m%d_%H%M%S')}_{name}"
+
 def scrape_all_cameras(event, context):
     """
     Cloud Function that scrapes a list of cameras.
+
+    Set PROFILE=1 to sample the whole run (including the file index update) and the CPU
+    workers, and upload collapsed stacks and hot-function summaries to metadata/profiles/.
     """
+    run_name = profile_run_name('scrape_all_cameras')
+    out_dir = os.path.join(PROFILE_DIR, run_name)
+    with profiled('scrape_all_cameras', out_dir) as profile:
+        result = _scrape_all_cameras(event, context, profile_dir=out_dir if profile.profiler else None)
+    paths = profile.paths
+    if paths:
+        # The CPU workers wrote their own profiles next to this one
+        merge_profiles(out_dir)
+        paths = [os.path.join(out_dir, name) for name in sorted(os.listdir(out_dir))]
+    upload_profile(paths, run_name)
+    return result
+
+def _scrape_all_cameras(event, context, profile_dir=None):
+    started_at = time.monotonic()
     try:
         logger.info(f"Function started. Message ID: {context.event_id}")
 
         # Fetch all cameras
         url = "https://webcams.nyctmc.org/api/cameras"
-        response = requests.get(url, timeout=60)
+        response = get_http_session().get(url, timeout=60)
         response.raise_for_status()
         all_cameras = response.json()
         logger.info(f"Fetched {len(all_cameras)} cameras from API.")
@@ -89,16 +243,63 @@ def scrape_all_cameras(event, context):
         # Add Central Park camera if it's not already in the list
         if not any(c['id'] == central_park_camera['id'] for c in cameras_to_scrape):
             cameras_to_scrape.append(central_park_camera)
-        logger.info(f"Will attempt to scrape {len(cameras_to_scrape)} cameras.")
 
-        storage_client = storage.Client()
+        storage_client = get_storage_client()
         bucket = storage_client.bucket(BUCKET_NAME)
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor: # Reduced to 4
-            future_to_camera = {executor.submit(download_and_process_camera, camera, bucket): camera for camera in cameras_to_scrape}
-            for future in concurrent.futures.as_completed(future_to_camera):
-                result = future.result()
-                logger.info(result)
+        schedule = None
+        if ADAPTIVE_POLLING:
+            # Only poll the cameras whose adaptive interval has elapsed
+            schedule = PollSchedule(bucket).load()
+            cameras_to_scrape = schedule.due_cameras(cameras_to_scrape, slack=POLL_SLACK_SECONDS)
+        logger.info(f"Will attempt to scrape {len(cameras_to_scrape)} cameras.")
+
+        validators = FrameValidators(bucket).load()
+        quality_gate = QualityGate(bucket)
+        if quality_gate.enabled:
+            quality_gate.load()
+
+        # Stalest cameras first; no new camera is started after stop_at, so the index update
+        # below always has SWEEP_SAFETY_MARGIN_SECONDS left and the sweep ends cleanly
+        sweep_state = SweepState(bucket).load()
+        cameras_to_scrape = sweep_state.order(cameras_to_scrape)
+        stop_at = started_at + SWEEP_BUDGET_SECONDS - SWEEP_SAFETY_MARGIN_SECONDS
+        # I/O threads fetch and upload, decoding and encoding run in a pool of CPU worker processes
+        stages = SweepStages(MAX_WORKERS, profile_dir=profile_dir)
+        logger.info(f"Sweeping with {MAX_WORKERS} I/O threads and {stages.cpu_workers} CPU workers.")
+        try:
+            with stages.monitoring():
+                results, leftovers = run_sweep(
+                    cameras_to_scrape,
+                    lambda camera: download_and_process_camera(
+                        camera, bucket, schedule, deadline=stop_at, validators=validators,
+                        quality_gate=quality_gate, stages=stages,
+                    ),
+                    stop_at,
+                    MAX_WORKERS,
+                )
+        finally:
+            stages.close()
+        stages.report()
+        for camera, result in results:
+            logger.info(result)
+        sweep_state.record_results(results)
+        unchanged = sum(result.startswith(UNCHANGED) for _, result in results)
+        logger.info(f"{unchanged} of {len(results)} cameras returned an unchanged frame.")
+        duplicates = sum(result.startswith(DUPLICATE) for _, result in results)
+        if duplicates:
+            logger.warning(f"{duplicates} new frames were dropped, a capture from the same second was already stored.")
+        # Cameras that never started, or gave up on the deadline, go first next time
+        leftovers += [camera for camera, result in results if result.endswith(DEADLINE_REACHED)]
+        sweep_state.carry_over = [camera['id'] for camera in leftovers]
+        sweep_state.save()
+        validators.save()
+        if quality_gate.enabled:
+            quality_gate.report()
+            quality_gate.save()
+
+        if schedule is not None:
+            schedule.save()
         
         logger.info("Overall scraping process complete.")
         create_file_index_gcs(BUCKET_NAME) # Call the new function
@@ -124,26 +325,29 @@ def list_blobs_for_camera(camera, bucket, one_day_ago, existing_files):
 def create_file_index_gcs(bucket_name):
     """
     Builds an index of all available files in the GCS bucket from the past day and saves it as a JSON object.
+
+    Profiled when PROFILE=1, unless it runs inside an already profiled scrape.
     """
+    run_name = profile_run_name('create_file_index_gcs')
+    with profiled('create_file_index_gcs', os.path.join(PROFILE_DIR, run_name)) as profile:
+        _create_file_index_gcs(bucket_name)
+    upload_profile(profile.paths, run_name)
+
+def _create_file_index_gcs(bucket_name):
     try:
         logger.info("Starting to build file index in GCS for the past day.")
-        storage_client = storage.Client()
+        storage_client = get_storage_client()
         bucket = storage_client.bucket(bucket_name)
 
         # Load existing index if it exists
-        existing_files = set()
-        index_blob = bucket.blob('metadata/file_index.json')
-        if index_blob.exists():
-            try:
-                existing_index = json.loads(index_blob.download_as_string())
-                existing_files = set(existing_index.get('files', []))
-                logger.info(f"Loaded existing index with {len(existing_files)} files.")
-            except json.JSONDecodeError:
-                logger.warning("Could not decode existing index file. Starting from scratch.")
+        loaded = load_file_index(bucket)
+        existing_files = loaded[0]
+        if existing_files:
+            logger.info(f"Loaded existing index with {len(existing_files)} files.")
 
         # Fetch all cameras
         url = "https://webcams.nyctmc.org/api/cameras"
-        response = requests.get(url, timeout=60)
+        response = get_http_session().get(url, timeout=60)
         response.raise_for_status()
         all_cameras = response.json()
         logger.info(f"Fetched {len(all_cameras)} cameras for indexing.")
@@ -152,7 +356,7 @@ def create_file_index_gcs(bucket_name):
         one_day_ago = now - timedelta(days=3)
         
         new_files = []
-        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor: # Reduced to 4
+        with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
             future_to_camera = {executor.submit(list_blobs_for_camera, camera, bucket, one_day_ago, existing_files): camera for camera in all_cameras}
             for future in concurrent.futures.as_completed(future_to_camera):
                 try:
@@ -164,17 +368,52 @@ def create_file_index_gcs(bucket_name):
 
         logger.info(f"Found {len(new_files)} new files from the past day.")
 
-        # Merge and save the index
-        all_files = sorted(list(existing_files) + new_files)
-        index = {
-            'files': all_files,
-            'total_files': len(all_files),
-            'last_updated': datetime.now(pytz.timezone('America/New_York')).isoformat()
-        }
-
-        index_blob.upload_from_string(json.dumps(index, indent=2), 'application/json')
+        # Merge and save the index; if the retention job changed it meanwhile, merge into its version
+        all_files = update_file_index(bucket, lambda files: files | set(new_files), loaded=loaded)
 
         logger.info(f"Successfully updated metadata/file_index.json with {len(all_files)} files.")
 
     except Exception as e:
-        logger.error(f"Error creating file index in GCS: {e}")
\ No newline at end of file
+        logger.error(f"Error creating file index in GCS: {e}")
+
+def pack_hourly_frames(event, context):
+    """
+    Cloud Function that packs each camera's closed hours of frames into one archive per hour.
+    """
+    try:
+        logger.info(f"Packing started. Message ID: {context.event_id}")
+        url = "https://webcams.nyctmc.org/api/cameras"
+        response = get_http_session().get(url, timeout=60)
+        response.raise_for_status()
+        all_cameras = response.json()
+
+        from packing import pack_closed_hours
+
+        storage_client = get_storage_client()
+        bucket = storage_client.bucket(BUCKET_NAME)
+        packed = pack_closed_hours(bucket, all_cameras)
+        logger.info(f"Packed {packed} frames.")
+        return "Packing complete.", 200
+
+    except Exception as e:
+        logger.error(f"Fatal error in pack_hourly_frames function: {e}")
+        return "Error: " + str(e), 500
+
+def apply_retention(event, context):
+    """
+    Cloud Function that moves aging frames down the retention tiers (see retention.py),
+    resuming where the previous run stopped.
+    """
+    started_at = time.monotonic()
+    try:
+        logger.info(f"Retention started. Message ID: {context.event_id}")
+        from retention import run_retention
+
+        bucket = get_storage_client().bucket(BUCKET_NAME)
+        # The margin leaves time for the file index update and the state save at the end
+        totals = run_retention(bucket, stop_at=started_at + SWEEP_BUDGET_SECONDS - SWEEP_SAFETY_MARGIN_SECONDS)
+        return f"Retention complete: {totals['partitions']} partitions, {totals['left']} left for the next run.", 200
+
+    except Exception as e:
+        logger.error(f"Fatal error in apply_retention function: {e}")
+        return "Error: " + str(e), 500
@@ -0,0 +1,141 @@
+import json
+import logging
+from datetime import datetime, timedelta
+
+import pytz
+
+logger = logging.getLogger()
+
+DATA_PREFIX = 'data/'
+PACK_PREFIX = 'packed/'
+COMPOSE_MAX_SOURCES = 32
+
+
+def safe_camera_name(name):
+    return "".join(c if c.isalnum() else "_" for c in name)
+
+
+def hour_prefix(safe_name, hour):
+    """data/{safe_name}/{Y}/{M}/{D}/{H}/ for an hour in New York time."""
+    return f"{DATA_PREFIX}{safe_name}/{hour.year}/{hour.month:02d}/{hour.day:02d}/{hour.hour:02d}/"
+
+
+def packed_paths(prefix):
+    """
+    Archive and index object names for an hour prefix.
+
+    data/X/2024/11/02/16/ -> packed/X/2024/11/02/16.jpgpack and packed/X/2024/11/02/16.index.json
+    """
+    base = PACK_PREFIX + prefix[len(DATA_PREFIX):].rstrip('/')
+    return f"{base}.jpgpack", f"{base}.index.json"
+
+
+def split_frame_path(path):
+    """Split data/X/Y/M/D/H/file.jpg into its hour prefix and file name."""
+    prefix, _, name = path.rpartition('/')
+    return prefix + '/', name
+
+
+def pack_hour(bucket, prefix, delete_originals=True, keep=frozenset()):
+    """
+    Concatenate every JPEG under an hour prefix into a single archive object.
+
+    The archive is built server-side with GCS compose (no frame is downloaded) and a
+    sidecar index records each frame's byte offset and length in the archive. Frames
+    that arrive after an hour was packed are appended on the next run. Originals are
+    deleted only once the index pointing at their packed copy has been written; originals
+    already in the index (a run that died before deleting them) are deleted by the next
+    run. Paths in `keep` are packed but stay in place as originals.
+
+    Offsets come from the archive object's actual size, and every compose is conditional
+    on the generation it extends. A run that died after composing but before writing the
+    index leaves unindexed bytes at the end of the archive; the rerun appends the frames
+    again after them, so the index still points at the right bytes.
+    """
+    archive_name, index_name = packed_paths(prefix)
+    index_blob = bucket.get_blob(index_name)
+    index_generation = index_blob.generation if index_blob is not None else 0
+    index = json.loads(index_blob.download_as_bytes(if_generation_match=index_generation)) if index_blob is not None else None
+    index = index or {'archive': archive_name, 'generation': None, 'frames': []}
+    # The retention job rewrites thinned hours under a new archive name
+    archive_name = index['archive']
+    packed = {frame['name'] for frame in index['frames']}
+
+    blobs = sorted(
+        (b for b in bucket.list_blobs(prefix=prefix, delimiter='/') if b.name.endswith('.jpg')),
+        key=lambda b: b.name,
+    )
+    new_blobs = [b for b in blobs if split_frame_path(b.name)[1] not in packed]
+    if delete_originals:
+        leftovers = [b for b in blobs if split_frame_path(b.name)[1] in packed and b.name not in keep]
+        if leftovers:
+            logger.info(f"Deleting {len(leftovers)} frames from {prefix} that were packed by an earlier run")
+            bucket.delete_blobs(leftovers, on_error=lambda blob: None)
+    if not new_blobs:
+        return 0
+
+    archive = bucket.get_blob(archive_name)
+    has_archive = archive is not None
+    if archive is None:
+        archive = bucket.blob(archive_name)
+    elif archive.generation != index['generation']:
+        logger.warning(f"{archive_name} has bytes its index does not know of (an interrupted run), appending after them")
+    offset = archive.size if has_archive else 0
+    step = COMPOSE_MAX_SOURCES - 1 if has_archive else COMPOSE_MAX_SOURCES
+    for i in range(0, len(new_blobs), step):
+        chunk = new_blobs[i:i + step]
+        archive.content_type = 'application/octet-stream'
+        # Fails (PreconditionFailed) if another run changed the archive meanwhile
+        archive.compose(([archive] if has_archive else []) + chunk, if_generation_match=archive.generation if has_archive else 0)
+        has_archive = True
+        step = COMPOSE_MAX_SOURCES - 1
+        for blob in chunk:
+            frame = {'name': split_frame_path(blob.name)[1], 'offset': offset, 'length': blob.size}
+            # Frames tagged by the quality gate keep their tag in the index
+            if (blob.metadata or {}).get('quality'):
+                frame['quality'] = blob.metadata['quality']
+            index['frames'].append(frame)
+            offset += blob.size
+
+    index['generation'] = archive.generation
+    bucket.blob(index_name).upload_from_string(json.dumps(index), 'application/json', if_generation_match=index_generation)
+
+    if delete_originals:
+        bucket.delete_blobs([b for b in new_blobs if b.name not in keep], on_error=lambda blob: None)
+    logger.info(f"Packed {len(new_blobs)} frames from {prefix} into {archive_name}")
+    return len(new_blobs)
+
+
+def latest_frame(bucket, safe_name, now, hours_back):
+    """Path of a camera's newest original frame in the last `hours_back` hours, or None."""
+    for h in range(0, hours_back + 1):
+        prefix = hour_prefix(safe_name, now - timedelta(hours=h))
+        names = [b.name for b in bucket.list_blobs(prefix=prefix, delimiter='/') if b.name.endswith('.jpg')]
+        if names:
+            return max(names)
+    return None
+
+
+def pack_closed_hours(bucket, cameras, hours_back=24, delete_originals=True):
+    """
+    Pack every closed hour (before the current New York hour) of the last `hours_back` hours.
+
+    Each camera's newest frame keeps its original: the latest camera status (and the map's
+    link to it) names that data/ path. It is deleted by a later run once a newer frame exists.
+    """
+    now = datetime.now(pytz.timezone('America/New_York')).replace(minute=0, second=0, microsecond=0)
+    total = 0
+    for camera in cameras:
+        safe_name = safe_camera_name(camera['name'])
+        try:
+            keep = frozenset(filter(None, [latest_frame(bucket, safe_name, now, hours_back)]))
+        except Exception as e:
+            logger.error(f"Error finding the latest frame of {safe_name}, not packing it: {e}")
+            continue
+        for h in range(1, hours_back + 1):
+            prefix = hour_prefix(safe_name, now - timedelta(hours=h))
+            try:
+                total += pack_hour(bucket, prefix, delete_originals, keep)
+            except Exception as e:
+                logger.error(f"Error packing {prefix}: {e}")
+    return total
@@ -0,0 +1,162 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime
+
+import pytz
+
+logger = logging.getLogger()
+
+SCHEDULE_PATH = 'metadata/poll_schedule.json'
+BIKE_COUNTS_PATH = 'metadata/bike_counts_by_hour.json'  # {safe_name: [24 hourly averages]}
+
+# Captures are named by the second they were taken in, so a camera is never polled more
+# often than this whatever POLL_MIN_SECONDS says
+POLL_FLOOR_SECONDS = 10
+EWMA_ALPHA = 0.2  # weight of the newest observation in the change and failure rates
+HASH_CHANGE_BITS = 4  # average-hash bits that must differ for a frame to count as changed
+
+
+def config_seconds(name, value):
+    """A positive, finite number of seconds, or ValueError naming the setting."""
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        seconds = math.nan
+    if not math.isfinite(seconds) or seconds <= 0:
+        raise ValueError(f"{name} must be a positive, finite number of seconds, got {value!r}")
+    return seconds
+
+
+def average_hash(img, size=8):
+    """
+    64-bit average hash of a PIL image (same idea as imagehash.average_hash, without the dependency).
+    """
+    pixels = list(img.convert('L').resize((size, size)).getdata())
+    mean = sum(pixels) / len(pixels)
+    bits = 0
+    for p in pixels:
+        bits = (bits << 1) | (p > mean)
+    return bits
+
+
+def _ewma(previous, value):
+    return value if previous is None else EWMA_ALPHA * value + (1 - EWMA_ALPHA) * previous
+
+
+class PollSchedule:
+    """
+    Per-camera polling statistics and the interval derived from them.
+
+    For each camera it keeps the frame change rate (from average hashes), the failure
+    rate and the last poll time; hourly bike counts come from BIKE_COUNTS_PATH when the
+    detector has written it. A camera that changes often or is busy at this hour of the
+    day is polled close to POLL_MIN_SECONDS, a frozen or failing one close to POLL_MAX_SECONDS.
+    min_seconds is raised to POLL_FLOOR_SECONDS.
+    """
+
+    def __init__(self, bucket, min_seconds=None, max_seconds=None):
+        # The environment is only read (and validated) when adaptive polling builds a schedule
+        if min_seconds is None:
+            min_seconds = config_seconds('POLL_MIN_SECONDS', os.environ.get('POLL_MIN_SECONDS', 60))
+        if max_seconds is None:
+            max_seconds = config_seconds('POLL_MAX_SECONDS', os.environ.get('POLL_MAX_SECONDS', 30 * 60))
+        self.bucket = bucket
+        self.min_seconds = max(config_seconds('min_seconds', min_seconds), POLL_FLOOR_SECONDS)
+        self.max_seconds = config_seconds('max_seconds', max_seconds)
+        if self.max_seconds < self.min_seconds:
+            raise ValueError(f"max_seconds ({max_seconds}) is below min_seconds ({self.min_seconds})")
+        self.cameras = {}
+        self.bike_counts = {}
+        self.lock = threading.Lock()
+
+    def load(self):
+        for path, attr in ((SCHEDULE_PATH, 'cameras'), (BIKE_COUNTS_PATH, 'bike_counts')):
+            try:
+                blob = self.bucket.get_blob(path)
+                if blob is not None:
+                    setattr(self, attr, json.loads(blob.download_as_bytes()))
+            except Exception as e:
+                logger.warning(f"Could not load {path}, starting without it: {e}")
+        logger.info(f"Loaded poll schedule for {len(self.cameras)} cameras.")
+        return self
+
+    def save(self):
+        with self.lock:
+            payload = json.dumps(self.cameras, separators=(',', ':'))
+        self.bucket.blob(SCHEDULE_PATH).upload_from_string(payload, 'application/json')
+
+    def _stats(self, camera_id):
+        return self.cameras.setdefault(camera_id, {
+            'last_polled': 0, 'change_rate': None, 'failure_rate': None, 'hash': None,
+        })
+
+    def record_success(self, camera_id, frame_hash):
+        with self.lock:
+            stats = self._stats(camera_id)
+            changed = 1.0
+            if stats['hash'] is not None:
+                changed = float(bin(int(stats['hash'], 16) ^ frame_hash).count('1') >= HASH_CHANGE_BITS)
+            stats['change_rate'] = _ewma(stats['change_rate'], changed)
+            stats['failure_rate'] = _ewma(stats['failure_rate'], 0.0)
+            stats['hash'] = f"{frame_hash:016x}"
+            stats['last_polled'] = time.time()
+
+    def record_unchanged(self, camera_id):
+        """The camera answered but still serves its previous frame (304 or same bytes)."""
+        with self.lock:
+            stats = self._stats(camera_id)
+            stats['change_rate'] = _ewma(stats['change_rate'], 0.0)
+            stats['failure_rate'] = _ewma(stats['failure_rate'], 0.0)
+            stats['last_polled'] = time.time()
+
+    def record_failure(self, camera_id):
+        with self.lock:
+            stats = self._stats(camera_id)
+            stats['failure_rate'] = _ewma(stats['failure_rate'] or 0.0, 1.0)
+            stats['last_polled'] = time.time()
+
+    def busyness(self, camera_name, hour):
+        """This hour's average bike count relative to the camera's busiest hour, 0..1."""
+        # Keyed like the data/ prefixes, by the camera's safe name
+        counts = self.bike_counts.get("".join(c if c.isalnum() else "_" for c in camera_name or ''))
+        if not counts or not max(counts):
+            return None
+        return counts[hour] / max(counts)
+
+    def interval(self, camera, hour):
+        stats = self.cameras.get(camera['id'])
+        if stats is None:
+            return self.min_seconds
+        # A camera that has never returned a frame counts as active until failures back it off
+        activity = 1.0 if stats['change_rate'] is None else stats['change_rate']
+        busy = self.busyness(camera.get('name'), hour)
+        if busy is not None:
+            activity = max(activity, busy)
+        interval = self.max_seconds - (self.max_seconds - self.min_seconds) * activity
+        # Back off cameras that keep failing, up to max_seconds for one that always fails
+        interval += (self.max_seconds - interval) * (stats['failure_rate'] or 0.0)
+        if not math.isfinite(interval):
+            # Damaged stats (e.g. NaN in the saved schedule), poll it like a new camera
+            return self.min_seconds
+        return min(max(interval, self.min_seconds), self.max_seconds)
+
+    def due_cameras(self, cameras, now=None, slack=0.0):
+        """
+        Cameras whose interval has elapsed since their last poll.
+
+        slack (seconds) lets a camera through slightly early, typically half the trigger
+        period, so a camera isn't pushed back a whole trigger by a few seconds.
+        """
+        now = time.time() if now is None else now
+        hour = datetime.fromtimestamp(now, pytz.timezone('America/New_York')).hour
+        due = []
+        for camera in cameras:
+            stats = self.cameras.get(camera['id'])
+            last_polled = stats['last_polled'] if stats else 0
+            if now - last_polled + slack >= self.interval(camera, hour):
+                due.append(camera)
+        return due
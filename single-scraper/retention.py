@@ -0,0 +1,408 @@
+"""
+Retention tiers for captured frames, applied by a resumable sweep over (camera, day) partitions.
+
+A day's frames move through three tiers as the day ages (days in New York time, like the
+data/{safe_name}/{Y}/{M}/{D}/ layout):
+
+    full    younger than RETENTION_FULL_DAYS: everything is kept
+    thin    then, until RETENTION_THUMB_DAYS: one frame per RETENTION_THIN_MINUTES, plus
+            every frame with detections; the other frames and their renditions are deleted
+    thumb   after that: the same frames, but only as thumb/ renditions (made here when the
+            scraper did not write one); full frames, detect renditions and archives go
+
+Frames with detections are read from metadata/detections/{YYYY-MM-DD}.json,
+{"frames": {path: bike_count}, "cameras": {safe_name: last path checked}}, as exported by
+the detector. Only the cameras the detector runs on, DETECTION_CAMERAS (safe names, the
+same setting count/main.py reads), wait for it: their days are thinned once the detector
+has checked that camera, and their frames after the last path checked are kept. Every
+other camera is thinned without detections, since none will ever be written for it.
+RETENTION_REQUIRE_DETECTIONS=0 stops waiting for any camera. Frames tagged by the quality
+gate are never the frame kept for an interval.
+
+Hours packed into archives (packing.py) are thinned by writing the kept frames to a new
+archive and switching the hour's index to it. The frames deleted from a partition are removed from metadata/file_index.json
+(see file_index.py) at the end of the run, and the partitions are then recorded in
+metadata/retention_state.json so the next run skips them. A run stops starting partitions
+at its deadline; a partition interrupted before the index update is simply redone, which
+is harmless because the frames it keeps are chosen the same way every time.
+"""
+import io
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+import pytz
+
+from file_index import update_file_index
+from sweep import run_sweep
+from transcode import RENDITION_SPECS, make_rendition
+
+logger = logging.getLogger()
+
+RETENTION_STATE_PATH = 'metadata/retention_state.json'
+DETECTIONS_PREFIX = 'metadata/detections/'
+DATA_PREFIX = 'data/'
+PACK_PREFIX = 'packed/'
+
+RETENTION_FULL_DAYS = int(os.environ.get('RETENTION_FULL_DAYS', 7))
+RETENTION_THUMB_DAYS = int(os.environ.get('RETENTION_THUMB_DAYS', 30))
+RETENTION_THIN_MINUTES = int(os.environ.get('RETENTION_THIN_MINUTES', 15))
+RETENTION_LOOKBACK_DAYS = int(os.environ.get('RETENTION_LOOKBACK_DAYS', 400))  # oldest day looked at
+RETENTION_REQUIRE_DETECTIONS = os.environ.get('RETENTION_REQUIRE_DETECTIONS', '1').lower() in ('1', 'true', 'yes')
+# Cameras the detector counts bikes on, by safe name; keep in sync with count/main.py
+DETECTION_CAMERAS = frozenset(c for c in os.environ.get('DETECTION_CAMERAS', 'Central_Park___72nd_St_Post_37').split(',') if c)
+RETENTION_WORKERS = int(os.environ.get('RETENTION_WORKERS', 16))
+
+TIERS = ('full', 'thin', 'thumb')
+# Hours are packed up to a day back; thinning never runs on a day that can still be packed into
+MIN_FULL_DAYS = 2
+
+
+def rendition_name(rendition, path):
+    # Same layout as main.rendition_path: data/X/... -> thumb/data/X/...
+    return f"{rendition}/{path}"
+
+
+class RetentionPolicy:
+    def __init__(self, full_days=RETENTION_FULL_DAYS, thumb_days=RETENTION_THUMB_DAYS,
+                 thin_minutes=RETENTION_THIN_MINUTES, require_detections=RETENTION_REQUIRE_DETECTIONS,
+                 detection_cameras=DETECTION_CAMERAS):
+        if full_days < MIN_FULL_DAYS or thumb_days < full_days or thin_minutes < 1:
+            raise ValueError(f"Invalid retention tiers: full {full_days} days, thumb after {thumb_days} days, "
+                             f"one frame per {thin_minutes} minutes (full days must be at least {MIN_FULL_DAYS})")
+        self.full_days = full_days
+        self.thumb_days = thumb_days
+        self.thin_minutes = thin_minutes
+        self.require_detections = require_detections
+        self.detection_cameras = frozenset(detection_cameras)
+
+    def tier(self, day, today):
+        age = (today - day).days
+        if age < self.full_days:
+            return 'full'
+        return 'thin' if age < self.thumb_days else 'thumb'
+
+    def waits_for_detections(self, safe_name, checked):
+        """Whether a camera's day must wait for the detector, given the cameras it has checked."""
+        return self.require_detections and safe_name in self.detection_cameras and safe_name not in checked
+
+    def select(self, frames, detections, checked_through=None):
+        """
+        Paths of the frames to keep out of {path: quality tag or None} for one camera and day:
+        the first untagged frame of every thin_minutes interval, every frame with detections,
+        and every frame after checked_through (the last path the detector checked, if known).
+        """
+        keep = {path for path in frames if detections.get(path, 0) > 0}
+        if checked_through is not None:
+            keep.update(path for path in frames if path > checked_through)
+        intervals = set()
+        # Path order is capture order: hour directories, then {YYYYmmdd_HHMMSS} file names
+        for path in sorted(frames):
+            if frames[path]:
+                continue
+            captured = frame_time(path)
+            if captured is None:
+                keep.add(path)  # not a capture name, leave it alone
+                continue
+            interval = (captured.hour * 60 + captured.minute) // self.thin_minutes
+            if interval not in intervals:
+                intervals.add(interval)
+                keep.add(path)
+        return keep
+
+
+def frame_time(path):
+    try:
+        # {YYYYmmdd}_{HHMMSS}_{camera_id}.jpg
+        return datetime.strptime('_'.join(os.path.basename(path).split('_')[:2]), '%Y%m%d_%H%M%S')
+    except ValueError:
+        return None
+
+
+def day_path(safe_name, day):
+    return f"{safe_name}/{day.year}/{day.month:02d}/{day.day:02d}/"
+
+
+class RetentionState:
+    """
+    The tier each (camera, day) partition has been brought to:
+
+        {"days": {"2024-11-02": {"tier": "thumb"}, "2024-11-20": {"tier": "full", "cameras": {safe_name: "thin"}}}}
+
+    Once every camera of a day reaches a tier, the day records it and drops its camera list.
+    """
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.days = {}
+
+    def load(self):
+        try:
+            blob = self.bucket.get_blob(RETENTION_STATE_PATH)
+            if blob is not None:
+                self.days = json.loads(blob.download_as_bytes()).get('days', {})
+        except Exception as e:
+            logger.warning(f"Could not load retention state, starting from scratch: {e}")
+        return self
+
+    def save(self):
+        state = {'days': self.days, 'updated': datetime.now(pytz.utc).isoformat(timespec='seconds')}
+        self.bucket.blob(RETENTION_STATE_PATH).upload_from_string(json.dumps(state, separators=(',', ':')), 'application/json')
+
+    def tier(self, day, safe_name):
+        entry = self.days.get(day.isoformat(), {})
+        tier = entry.get('cameras', {}).get(safe_name, 'full')
+        return max(tier, entry.get('tier', 'full'), key=TIERS.index)
+
+    def day_done(self, day, tier):
+        return TIERS.index(self.days.get(day.isoformat(), {}).get('tier', 'full')) >= TIERS.index(tier)
+
+    def record(self, day, safe_name, tier):
+        self.days.setdefault(day.isoformat(), {}).setdefault('cameras', {})[safe_name] = tier
+
+    def collapse(self, day, cameras, tier):
+        entry = self.days.get(day.isoformat())
+        if entry and all(TIERS.index(self.tier(day, camera)) >= TIERS.index(tier) for camera in cameras):
+            self.days[day.isoformat()] = {'tier': tier}
+
+
+class Detections:
+    """metadata/detections/{day}.json per day ({"frames", "cameras"}), loaded once per run; None for days without one."""
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.days = {}
+        self.lock = threading.Lock()
+
+    def get(self, day):
+        with self.lock:
+            if day not in self.days:
+                blob = self.bucket.get_blob(f"{DETECTIONS_PREFIX}{day.isoformat()}.json")
+                self.days[day] = json.loads(blob.download_as_bytes()) if blob is not None else None
+            return self.days[day]
+
+
+def list_cameras(bucket):
+    """Safe names of every camera with frames or archives, including cameras the API no longer lists."""
+    names = set()
+    for prefix in (DATA_PREFIX, PACK_PREFIX):
+        iterator = bucket.list_blobs(prefix=prefix, delimiter='/')
+        for _ in iterator:
+            pass
+        names.update(p[len(prefix):].rstrip('/') for p in iterator.prefixes)
+    return sorted(names)
+
+
+def _make_thumb(data):
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(data))
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    return make_rendition(img, 'thumb')
+
+
+def _rewrite_archive(bucket, index_name, index, index_generation, keep_names):
+    """
+    Rewrite a packed hour with only the kept frames; deletes it when none are left.
+
+    The kept frames go to a new archive object, the index is switched to it only if it has
+    not changed since it was read, and the old archive is deleted last. A run that dies
+    in between leaves either the old index and archive or the new ones, both readable;
+    the stray archive it may leave is deleted by the next run (see retain_partition).
+    """
+    frames = [frame for frame in index['frames'] if frame['name'] in keep_names]
+    if not frames:
+        bucket.delete_blobs([index_name, index['archive']], on_error=lambda blob: None)
+        return
+    data = bucket.blob(index['archive']).download_as_bytes(if_generation_match=index['generation'])
+    chunks, offset = [], 0
+    for i, frame in enumerate(frames):
+        chunks.append(data[frame['offset']:frame['offset'] + frame['length']])
+        frames[i] = dict(frame, offset=offset)
+        offset += frame['length']
+
+    archive = bucket.blob(f"{index_name[:-len('.index.json')]}.{uuid.uuid4().hex[:8]}.jpgpack")
+    archive.upload_from_string(b''.join(chunks), 'application/octet-stream', if_generation_match=0)
+    # Readers holding the old index keep reading the old archive until it is deleted, then
+    # fail their read and reload the index (count/main.py get_uri_as_bytes)
+    bucket.blob(index_name).upload_from_string(
+        json.dumps(dict(index, archive=archive.name, generation=archive.generation, frames=frames)),
+        'application/json', if_generation_match=index_generation,
+    )
+    bucket.delete_blobs([index['archive']], on_error=lambda blob: None)
+
+
+def retain_partition(bucket, partition, policy, detections):
+    """
+    Bring one camera's day to partition['tier'].
+
+    Returns {'frames', 'kept', 'deleted', 'thumbs_made', 'indexed'}, where indexed are the
+    paths of the day that stay in the file index.
+    """
+    safe_name, day, tier = partition['safe_name'], partition['day'], partition['tier']
+    path = day_path(safe_name, day)
+
+    loose = {blob.name: blob for blob in bucket.list_blobs(prefix=DATA_PREFIX + path) if blob.name.endswith('.jpg')}
+    packed, index_generations, archives_listed = {}, {}, set()
+    for blob in bucket.list_blobs(prefix=PACK_PREFIX + path):
+        if blob.name.endswith('.index.json'):
+            packed[blob.name] = json.loads(blob.download_as_bytes(if_generation_match=blob.generation))
+            index_generations[blob.name] = blob.generation
+        elif blob.name.endswith('.jpgpack'):
+            archives_listed.add(blob.name)
+    # Archives no index points at, left by a rewrite that was interrupted
+    deletions = sorted(archives_listed - {index['archive'] for index in packed.values()})
+    if not loose and not packed:
+        if deletions:
+            bucket.delete_blobs(deletions, on_error=lambda blob: None)
+        return {'frames': 0, 'kept': 0, 'deleted': len(deletions), 'thumbs_made': 0, 'indexed': set()}
+    renditions = {
+        rendition: {blob.name for blob in bucket.list_blobs(prefix=rendition_name(rendition, DATA_PREFIX + path))}
+        for rendition in RENDITION_SPECS
+    }
+
+    # path -> quality tag, and path -> (index name, frame) for packed frames
+    frames = {name: (blob.metadata or {}).get('quality') for name, blob in loose.items()}
+    in_archive = {}
+    for index_name, index in packed.items():
+        hour = DATA_PREFIX + index_name[len(PACK_PREFIX):-len('.index.json')] + '/'
+        for frame in index['frames']:
+            frames.setdefault(hour + frame['name'], frame.get('quality'))
+            in_archive[hour + frame['name']] = (index_name, frame)
+
+    detections = detections or {}
+    keep = policy.select(frames, detections.get('frames', {}), detections.get('cameras', {}).get(safe_name))
+    for frame_path in frames:
+        if frame_path not in keep:
+            if frame_path in loose:
+                deletions.append(frame_path)
+            deletions.extend(
+                rendition_name(r, frame_path) for r in RENDITION_SPECS if rendition_name(r, frame_path) in renditions[r]
+            )
+
+    thumbs_made = 0
+    if tier == 'thumb':
+        # Thumbnails of the kept frames first, nothing is deleted before they exist
+        missing = sorted(p for p in keep if rendition_name('thumb', p) not in renditions['thumb'])
+        archives = {}
+        for frame_path in missing:
+            if frame_path in loose:
+                data = loose[frame_path].download_as_bytes()
+            else:
+                index_name, frame = in_archive[frame_path]
+                index = packed[index_name]
+                if index_name not in archives:
+                    archives[index_name] = bucket.blob(index['archive']).download_as_bytes(if_generation_match=index['generation'])
+                data = archives[index_name][frame['offset']:frame['offset'] + frame['length']]
+            bucket.blob(rendition_name('thumb', frame_path)).upload_from_string(_make_thumb(data), 'image/jpeg')
+            thumbs_made += 1
+        for frame_path in keep:
+            if frame_path in loose:
+                deletions.append(frame_path)
+            deletions.extend(
+                rendition_name(r, frame_path) for r in RENDITION_SPECS
+                if r != 'thumb' and rendition_name(r, frame_path) in renditions[r]
+            )
+        for index_name, index in packed.items():
+            deletions.extend([index_name, index['archive']])
+    else:
+        for index_name, index in packed.items():
+            hour = DATA_PREFIX + index_name[len(PACK_PREFIX):-len('.index.json')] + '/'
+            keep_names = {frame['name'] for frame in index['frames'] if hour + frame['name'] in keep}
+            if len(keep_names) < len(index['frames']):
+                _rewrite_archive(bucket, index_name, index, index_generations[index_name], keep_names)
+
+    if deletions:
+        # Missing objects (e.g. deleted by an earlier, interrupted run) are not an error
+        bucket.delete_blobs(deletions, on_error=lambda blob: None)
+    return {
+        'frames': len(frames),
+        'kept': len(keep),
+        'deleted': len(deletions),
+        'thumbs_made': thumbs_made,
+        'indexed': keep if tier == 'thin' else set(),
+    }
+
+
+def prune_file_index(files, retained):
+    """Drop the paths of retained partitions ({data/X/Y/M/D/: paths kept}) that were not kept."""
+    def kept(path):
+        partition = '/'.join(path.split('/')[:5]) + '/'
+        return partition not in retained or path in retained[partition]
+    return {path for path in files if kept(path)}
+
+
+def run_retention(bucket, policy=None, stop_at=None, today=None, workers=RETENTION_WORKERS):
+    """
+    Apply the retention tiers to every partition that is behind, oldest day first, in
+    `workers` threads, starting none after stop_at (a time.monotonic() value). Returns
+    counts for the run.
+    """
+    policy = policy or RetentionPolicy()
+    today = today or datetime.now(pytz.timezone('America/New_York')).date()
+    if stop_at is None:
+        stop_at = time.monotonic() + 7 * 24 * 3600  # no deadline, but a finite wait timeout for run_sweep
+    state = RetentionState(bucket).load()
+    detections = Detections(bucket)
+    cameras = list_cameras(bucket)
+
+    partitions, waiting = [], []
+    for age in range(RETENTION_LOOKBACK_DAYS, policy.full_days - 1, -1):
+        day = today - timedelta(days=age)
+        tier = policy.tier(day, today)
+        if tier == 'full' or state.day_done(day, tier):
+            continue
+        checked = (detections.get(day) or {}).get('cameras', {})
+        for safe_name in cameras:
+            if TIERS.index(state.tier(day, safe_name)) >= TIERS.index(tier):
+                continue
+            partition = {'name': f"{safe_name}/{day.isoformat()}", 'safe_name': safe_name, 'day': day, 'tier': tier}
+            # Without detections for a camera the detector covers, frames with bikes cannot be told apart
+            if policy.waits_for_detections(safe_name, checked):
+                waiting.append(partition)
+            else:
+                partitions.append(partition)
+    if waiting:
+        logger.info(f"Retention waits for detections of {len(waiting)} partitions, oldest {waiting[0]['name']}.")
+    logger.info(f"Retention: {len(partitions)} partitions to bring to their tier.")
+
+    results, leftovers = run_sweep(
+        partitions, lambda partition: retain_partition(bucket, partition, policy, detections.get(partition['day'])),
+        stop_at, workers,
+    )
+    done = [(partition, result) for partition, result in results if isinstance(result, dict)]
+    totals = {key: sum(result[key] for _, result in done) for key in ('frames', 'kept', 'deleted', 'thumbs_made')}
+    totals.update(partitions=len(done), failed=len(results) - len(done), left=len(leftovers), waiting=len(waiting))
+
+    if done:
+        retained = {DATA_PREFIX + day_path(p['safe_name'], p['day']): result['indexed'] for p, result in done}
+        files = update_file_index(bucket, lambda files: prune_file_index(files, retained))
+        totals['indexed'] = len(files)
+        # Recorded only once the index matches, so an interrupted run redoes the partition
+        for partition, _ in done:
+            state.record(partition['day'], partition['safe_name'], partition['tier'])
+        for day, tier in {(p['day'], p['tier']) for p, _ in done}:
+            state.collapse(day, cameras, tier)
+        state.save()
+    logger.info(f"Retention run: {totals}")
+    return totals
+
+
+if __name__ == '__main__':
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Apply the retention tiers to a bucket')
+    parser.add_argument('--bucket', default='nyc-webcam-capture')
+    parser.add_argument('--budget', type=float, help='seconds after which no new partition is started')
+    parser.add_argument('--today', type=date.fromisoformat, help='pretend today is this day (YYYY-MM-DD)')
+    args = parser.parse_args()
+
+    from google.cloud import storage
+    stop_at = time.monotonic() + args.budget if args.budget else None
+    run_retention(storage.Client().bucket(args.bucket), stop_at=stop_at, today=args.today)
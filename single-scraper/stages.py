@@ -0,0 +1,211 @@
+"""
+Stages of a sweep and their queue depths.
+
+I/O threads (MAX_WORKERS in main.py) fetch frames and upload the results; the CPU work
+in between (transcode.process_frame) runs in a process pool of CPU_WORKERS processes,
+so decoding and encoding neither hold the GIL the I/O threads need nor share one core.
+CPU_WORKERS=0 runs it in the I/O thread instead.
+
+Each I/O thread waits for the CPU work of its own frame, so at most MAX_WORKERS frames
+are in the pool at once. CPU_WORKERS therefore defaults to min(cores, MAX_WORKERS):
+more processes would sit idle and only cost memory in the function. Raise MAX_WORKERS
+to keep more cores busy.
+
+Frames travel to the pool as the bytes object of the response and come back as the
+encoded bytes: one pickle each way and no intermediate decoded copies.
+
+With a profile_dir (PROFILE=1) the sweep gets a pool of its own whose workers run the
+sampling profiler; SweepStages.close() shuts it down so each worker writes its profile.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+logger = logging.getLogger()
+
+CPU_WORKERS = os.environ.get('CPU_WORKERS')  # unset: min(cores, I/O threads), see cpu_worker_count
+STAGE_LOG_SECONDS = float(os.environ.get('STAGE_LOG_SECONDS', 30))  # 0 only reports at the end
+
+_pool_lock = threading.Lock()
+_cpu_pool = None
+
+
+def _init_worker(profile_dir=None):
+    # Pay for the PIL import once per worker rather than on its first frame
+    import PIL.Image  # noqa: F401
+    if profile_dir:
+        from sampling_profiler import start_worker_profiler
+        start_worker_profiler(profile_dir, prefix='cpu-worker')
+
+
+def _new_cpu_pool(workers, profile_dir=None):
+    # Workers are started from the I/O threads, where forking the whole process is unsafe
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(profile_dir,))
+
+
+def cpu_worker_count(io_workers):
+    """CPU_WORKERS if set, else one process per core up to the number of I/O threads feeding them."""
+    if CPU_WORKERS is not None:
+        return int(CPU_WORKERS)
+    return min(os.cpu_count() or 1, io_workers)
+
+
+def get_cpu_pool(workers):
+    """Module-level process pool of `workers` processes, reused across warm invocations; None for 0 workers."""
+    global _cpu_pool
+    if workers <= 0:
+        return None
+    with _pool_lock:
+        if _cpu_pool is None:
+            _cpu_pool = _new_cpu_pool(workers)
+        return _cpu_pool
+
+
+def _reset_cpu_pool(pool):
+    global _cpu_pool
+    with _pool_lock:
+        if _cpu_pool is pool:
+            _cpu_pool = None
+    pool.shutdown(wait=False)
+
+
+class StageGauge:
+    """
+    Items currently in a stage (its queue depth), with the peak and time-weighted mean
+    depth, the number of items and their mean time in the stage.
+
+    capacity is the number of items the stage works on at once; depth above it is
+    reported as queued.
+    """
+
+    def __init__(self, name, capacity=None):
+        self.name = name
+        self.capacity = capacity
+        self.depth = 0
+        self.peak = 0
+        self.items = 0
+        self.busy = 0.0
+        self.lock = threading.Lock()
+        self._started = self._last = time.monotonic()
+        self._area = 0.0
+
+    def _advance(self, now):
+        self._area += self.depth * (now - self._last)
+        self._last = now
+
+    @contextmanager
+    def track(self):
+        start = time.monotonic()
+        with self.lock:
+            self._advance(start)
+            self.depth += 1
+            self.peak = max(self.peak, self.depth)
+        try:
+            yield
+        finally:
+            end = time.monotonic()
+            with self.lock:
+                self._advance(end)
+                self.depth -= 1
+                self.items += 1
+                self.busy += end - start
+
+    def snapshot(self):
+        with self.lock:
+            now = time.monotonic()
+            self._advance(now)
+            elapsed = now - self._started
+            snapshot = {
+                'depth': self.depth,
+                'peak': self.peak,
+                'mean_depth': round(self._area / elapsed, 2) if elapsed else 0.0,
+                'items': self.items,
+                'mean_seconds': round(self.busy / self.items, 3) if self.items else 0.0,
+            }
+            if self.capacity:
+                snapshot['queued'] = max(0, self.depth - self.capacity)
+                snapshot['peak_queued'] = max(0, self.peak - self.capacity)
+        return snapshot
+
+
+class SweepStages:
+    """The fetch, cpu and upload gauges of one sweep, and the way CPU work is run."""
+
+    def __init__(self, io_workers, profile_dir=None):
+        """profile_dir: profile the CPU workers into this directory (a pool for this sweep only)."""
+        self.cpu_workers = cpu_worker_count(io_workers)
+        self.profile_dir = profile_dir
+        self.fetch = StageGauge('fetch', io_workers)
+        self.cpu = StageGauge('cpu', self.cpu_workers or io_workers)
+        self.upload = StageGauge('upload', io_workers)
+        self._pool_lock = threading.Lock()
+        self._profiled_pool = None
+
+    def _pool(self):
+        if not self.profile_dir:
+            return get_cpu_pool(self.cpu_workers)
+        with self._pool_lock:
+            if self._profiled_pool is None and self.cpu_workers > 0:
+                self._profiled_pool = _new_cpu_pool(self.cpu_workers, self.profile_dir)
+            return self._profiled_pool
+
+    def run_cpu(self, fn, *args):
+        """fn(*args) in the CPU pool (in this thread without one); the calling thread waits without the GIL."""
+        with self.cpu.track():
+            pool = self._pool()
+            if pool is None:
+                return fn(*args)
+            try:
+                return pool.submit(fn, *args).result()
+            except BrokenProcessPool:
+                # A worker died (e.g. out of memory); start a fresh pool for the next frames
+                logger.error("CPU worker pool broke, recreating it and processing this frame in-thread.")
+                if self.profile_dir:
+                    with self._pool_lock:
+                        if self._profiled_pool is pool:
+                            self._profiled_pool = None
+                    pool.shutdown(wait=False)
+                else:
+                    _reset_cpu_pool(pool)
+                return fn(*args)
+
+    def close(self):
+        """Shut down this sweep's profiled pool; its workers exit normally and write their profiles."""
+        with self._pool_lock:
+            pool, self._profiled_pool = self._profiled_pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def depths(self):
+        return {gauge.name: gauge.snapshot() for gauge in (self.fetch, self.cpu, self.upload)}
+
+    @contextmanager
+    def monitoring(self, interval=STAGE_LOG_SECONDS):
+        """Log every stage's current depth every `interval` seconds while the sweep runs."""
+        if interval <= 0:
+            yield self
+            return
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                logger.info("Stage depths: " + ", ".join(f"{name} {s['depth']}" for name, s in self.depths().items()))
+
+        thread = threading.Thread(target=run, name='stage-monitor', daemon=True)
+        thread.start()
+        try:
+            yield self
+        finally:
+            stop.set()
+            thread.join()
+
+    def report(self):
+        for name, snapshot in self.depths().items():
+            logger.info(f"Stage {name}: {snapshot}")
@@ -0,0 +1,97 @@
+import concurrent.futures
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger()
+
+SWEEP_STATE_PATH = 'metadata/sweep_state.json'
+STORED = "Success"  # result of a camera whose new frame was stored
+# Time the function may run for and the part of it kept for the index update. The budget must
+# match the deployed --timeout (deploy.sh deploys with 540s; the default timeout is only 60s).
+SWEEP_BUDGET_SECONDS = int(os.environ.get('SWEEP_BUDGET_SECONDS', 540))
+SWEEP_SAFETY_MARGIN_SECONDS = int(os.environ.get('SWEEP_SAFETY_MARGIN_SECONDS', 90))
+
+
+class SweepState:
+    """
+    What a sweep needs to know about the previous ones: each camera's last successful
+    capture (a new frame stored), and the cameras the last sweep ran out of time for (the
+    carry-over queue).
+    """
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.last_success = {}
+        self.carry_over = []
+
+    def load(self):
+        try:
+            blob = self.bucket.get_blob(SWEEP_STATE_PATH)
+            if blob is not None:
+                state = json.loads(blob.download_as_bytes())
+                self.last_success = state.get('last_success', {})
+                self.carry_over = state.get('carry_over', [])
+        except Exception as e:
+            logger.warning(f"Could not load sweep state, starting from scratch: {e}")
+        return self
+
+    def save(self):
+        state = {'last_success': self.last_success, 'carry_over': self.carry_over}
+        self.bucket.blob(SWEEP_STATE_PATH).upload_from_string(json.dumps(state, separators=(',', ':')), 'application/json')
+
+    def order(self, cameras):
+        """Carried-over cameras first, then the stalest (longest since a successful capture)."""
+        carried = set(self.carry_over)
+        return sorted(cameras, key=lambda c: (c['id'] not in carried, self.last_success.get(c['id'], 0)))
+
+    def record_success(self, camera_id):
+        self.last_success[camera_id] = time.time()
+
+    def record_results(self, results):
+        """
+        Record the cameras of [(camera, result)] that stored a new frame. Unchanged, rejected
+        and truncated frames do not count, so a camera serving them keeps getting older and
+        goes first.
+        """
+        for camera, result in results:
+            if result.startswith(STORED):
+                self.record_success(camera['id'])
+
+
+def run_sweep(cameras, fn, stop_at, max_workers):
+    """
+    Run fn(camera) over cameras in order with at most max_workers in flight, starting no new
+    camera after stop_at (a time.monotonic() value).
+
+    Cameras already running at stop_at are waited for; their own timeouts are expected to
+    respect the deadline. Returns ([(camera, result)], cameras that were never started).
+    """
+    results = []
+    queue = list(cameras)
+    next_index = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = {}
+        while True:
+            while next_index < len(queue) and len(in_flight) < max_workers and time.monotonic() < stop_at:
+                camera = queue[next_index]
+                in_flight[executor.submit(fn, camera)] = camera
+                next_index += 1
+            if not in_flight:
+                break
+            # Wake up at stop_at at the latest while there is still work that could be started
+            remaining = stop_at - time.monotonic()
+            timeout = remaining if next_index < len(queue) and remaining > 0 else None
+            done, _ = concurrent.futures.wait(in_flight, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                camera = in_flight.pop(future)
+                try:
+                    results.append((camera, future.result()))
+                except Exception as e:
+                    logger.error(f"Error processing camera {camera.get('name')}: {e}")
+                    results.append((camera, f"Error: {camera.get('name')}: {e}"))
+    leftovers = queue[next_index:]
+    if leftovers:
+        logger.warning(f"Sweep budget reached, carrying over {len(leftovers)} cameras to the next run.")
+    return results, leftovers
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The scraper modules are top-level modules of single-scraper/, as in the deployed function
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,97 @@
+"""
+In-memory stand-in for the parts of a google.cloud.storage bucket the scraper uses:
+objects with generations and custom metadata, generation preconditions, ranged reads,
+compose and prefix/delimiter listings.
+"""
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+
+def _check(bucket, name, if_generation_match):
+    if if_generation_match is not None and bucket.generations.get(name, 0) != if_generation_match:
+        raise PreconditionFailed(f"{name} is not at generation {if_generation_match}")
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.metadata = bucket.metadata.get(name)
+        self.content_type = None
+
+    @property
+    def generation(self):
+        return self.bucket.generations.get(self.name)
+
+    @property
+    def size(self):
+        return len(self.bucket.data[self.name])
+
+    def download_as_bytes(self, start=None, end=None, if_generation_match=None):
+        if self.name not in self.bucket.data:
+            raise NotFound(self.name)
+        _check(self.bucket, self.name, if_generation_match)
+        data = self.bucket.data[self.name]
+        return data[start:end + 1 if end is not None else None] if start is not None else data
+
+    def upload_from_string(self, data, content_type=None, if_generation_match=None):
+        _check(self.bucket, self.name, if_generation_match)
+        self.bucket.put(self.name, data, self.metadata)
+
+    def compose(self, sources, if_generation_match=None):
+        _check(self.bucket, self.name, if_generation_match)
+        self.bucket.put(self.name, b''.join(self.bucket.data[source.name] for source in sources), self.metadata)
+
+    def delete(self):
+        if self.name not in self.bucket.data:
+            raise NotFound(self.name)
+        self.bucket.remove(self.name)
+
+
+class FakeListing(list):
+    prefixes = frozenset()
+
+
+class FakeBucket:
+    def __init__(self, name='test-bucket'):
+        self.name = name
+        self.data, self.generations, self.metadata = {}, {}, {}
+        self._generation = 0
+
+    def put(self, name, data, metadata=None):
+        self._generation += 1
+        self.data[name] = data.encode() if isinstance(data, str) else data
+        self.generations[name] = self._generation
+        if metadata:
+            self.metadata[name] = dict(metadata)
+
+    def remove(self, name):
+        del self.data[name]
+        self.generations.pop(name, None)
+        self.metadata.pop(name, None)
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def get_blob(self, name):
+        return FakeBlob(self, name) if name in self.data else None
+
+    def list_blobs(self, prefix='', delimiter=None):
+        listing, prefixes = FakeListing(), set()
+        for name in sorted(self.data):
+            if not name.startswith(prefix):
+                continue
+            rest = name[len(prefix):]
+            if delimiter and delimiter in rest:
+                prefixes.add(prefix + rest.split(delimiter)[0] + delimiter)
+            else:
+                listing.append(FakeBlob(self, name))
+        listing.prefixes = frozenset(prefixes)
+        return listing
+
+    def delete_blobs(self, blobs, on_error=None):
+        for blob in blobs:
+            name = getattr(blob, 'name', blob)
+            if name in self.data:
+                self.remove(name)
+            elif on_error is not None:
+                on_error(blob)
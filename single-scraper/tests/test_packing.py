@@ -0,0 +1,38 @@
+import json
+
+from fake_gcs import FakeBucket
+from packing import pack_hour, packed_paths
+
+PREFIX = 'data/Cam/2024/11/02/16/'
+
+
+def capture_hour(bucket, count=3):
+    paths = [f"{PREFIX}20241102_16{minute:02d}00_id.jpg" for minute in range(count)]
+    for i, path in enumerate(paths):
+        bucket.put(path, bytes([i]) * (10 + i))
+    return paths
+
+
+def test_originals_left_by_an_interrupted_run_are_deleted():
+    bucket = FakeBucket()
+    paths = capture_hour(bucket)
+    # Index written, originals not deleted: what a run that died at that point leaves
+    assert pack_hour(bucket, PREFIX, delete_originals=False) == 3
+
+    assert pack_hour(bucket, PREFIX) == 0
+    assert not any(path in bucket.data for path in paths)
+    archive_name, index_name = packed_paths(PREFIX)
+    index = json.loads(bucket.data[index_name])
+    archive = bucket.data[archive_name]
+    assert [archive[f['offset']:f['offset'] + f['length']] for f in index['frames']] == [bytes([i]) * (10 + i) for i in range(3)]
+
+
+def test_kept_frame_stays_an_original_until_it_is_not_kept():
+    bucket = FakeBucket()
+    paths = capture_hour(bucket)
+
+    pack_hour(bucket, PREFIX, keep=frozenset([paths[-1]]))
+    assert [path for path in paths if path in bucket.data] == [paths[-1]]
+
+    pack_hour(bucket, PREFIX)
+    assert not any(path in bucket.data for path in paths)
@@ -0,0 +1,70 @@
+import io
+import json
+from datetime import date, timedelta
+
+from PIL import Image
+
+from fake_gcs import FakeBucket
+from retention import RetentionPolicy, run_retention
+
+TODAY = date(2024, 12, 31)
+DAY = TODAY - timedelta(days=10)  # in the thin tier
+COVERED = 'Central_Park___72nd_St_Post_37'
+UNCOVERED = 'FDR_Dr___E_63rd_St'
+
+
+def jpeg():
+    out = io.BytesIO()
+    Image.new('RGB', (64, 48), (90, 90, 90)).save(out, 'JPEG')
+    return out.getvalue()
+
+
+def capture_day(bucket, safe_name):
+    """A frame every 5 minutes from 08:00 to 08:55, returns their paths."""
+    paths = [
+        f"data/{safe_name}/{DAY.year}/{DAY.month:02d}/{DAY.day:02d}/08/{DAY:%Y%m%d}_08{minute:02d}00_id.jpg"
+        for minute in range(0, 60, 5)
+    ]
+    for path in paths:
+        bucket.put(path, jpeg())
+    return paths
+
+
+def frames_left(bucket, safe_name):
+    return sorted(name for name in bucket.data if name.startswith(f"data/{safe_name}/"))
+
+
+def policy():
+    return RetentionPolicy(full_days=7, thumb_days=30, thin_minutes=15, detection_cameras={COVERED})
+
+
+def test_uncovered_camera_is_thinned_without_detections():
+    bucket = FakeBucket()
+    covered = capture_day(bucket, COVERED)
+    uncovered = capture_day(bucket, UNCOVERED)
+
+    run_retention(bucket, policy(), today=TODAY, workers=2)
+
+    # The detector never checked the covered camera, so its day waits
+    assert frames_left(bucket, COVERED) == covered
+    # The detector never runs on the other camera: one frame per 15 minutes is kept
+    assert frames_left(bucket, UNCOVERED) == [uncovered[i] for i in (0, 3, 6, 9)]
+    state = json.loads(bucket.data['metadata/retention_state.json'])
+    assert state['days'][DAY.isoformat()]['cameras'] == {UNCOVERED: 'thin'}
+
+
+def test_covered_camera_is_thinned_once_checked():
+    bucket = FakeBucket()
+    covered = capture_day(bucket, COVERED)
+    bucket.put(f"metadata/detections/{DAY.isoformat()}.json", json.dumps({
+        'frames': {covered[1]: 2},
+        'cameras': {COVERED: covered[-1]},
+    }))
+
+    run_retention(bucket, policy(), today=TODAY, workers=2)
+
+    # One frame per 15 minutes plus the frame with bikes
+    assert frames_left(bucket, COVERED) == [covered[i] for i in (0, 1, 3, 6, 9)]
+    # Its only camera is done, so the whole day is recorded
+    state = json.loads(bucket.data['metadata/retention_state.json'])
+    assert state['days'][DAY.isoformat()] == {'tier': 'thin'}
@@ -0,0 +1,28 @@
+import time
+
+from fake_gcs import FakeBucket
+from frame_quality import REJECTED
+from frame_validators import UNCHANGED
+from sweep import STORED, SweepState
+
+CAMERAS = [{'id': 'stored', 'name': 'Stored'}, {'id': 'rejected', 'name': 'Rejected'},
+           {'id': 'unchanged', 'name': 'Unchanged'}]
+
+
+def test_only_stored_frames_count_as_success():
+    state = SweepState(FakeBucket())
+    before = time.time() - 3600
+    state.last_success = {camera['id']: before for camera in CAMERAS}
+
+    state.record_results([
+        (CAMERAS[0], f"{STORED}: Stored"),
+        (CAMERAS[1], f"{REJECTED}: Rejected: truncated"),
+        (CAMERAS[2], f"{UNCHANGED}: Unchanged"),
+    ])
+
+    assert state.last_success['stored'] > before
+    assert state.last_success['rejected'] == before
+    assert state.last_success['unchanged'] == before
+    # The camera serving broken frames stays ahead of the one that stored a frame
+    order = [camera['id'] for camera in state.order(CAMERAS)]
+    assert order.index('rejected') < order.index('stored')
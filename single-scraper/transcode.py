@@ -0,0 +1,65 @@
+"""
+CPU stage of the scraper: everything done to a frame between download and upload.
+
+process_frame only takes and returns bytes and small values, so it can run in a worker
+process (see stages.py) as well as in the calling thread.
+"""
+import io
+
+from frame_quality import analyze_frame
+from poll_schedule import average_hash
+
+# thumb: 160 px wide for map InfoWindows, detect: 416x416 as fed to YOLOv3
+RENDITION_SPECS = {'thumb': (160, None), 'detect': (416, 416)}
+
+
+def make_rendition(img, rendition):
+    """
+    Resizes an already decoded image for a rendition and returns its JPEG bytes.
+    """
+    width, height = RENDITION_SPECS[rendition]
+    if height is None:
+        width = min(width, img.width)
+        height = max(1, round(img.height * width / img.width))
+    from PIL import Image
+    resized = img.resize((width, height), Image.BILINEAR, reducing_gap=2.0)
+    out = io.BytesIO()
+    resized.save(out, format='JPEG', quality=80)
+    return out.getvalue()
+
+
+def process_frame(data, renditions=(), gate_mode=None, placeholders=()):
+    """
+    Quality check, decode, hash and re-encode one downloaded frame.
+
+    Returns {'quality': FrameQuality or None, 'store': bool, 'hash': int, 'jpeg': bytes,
+    'renditions': {name: bytes}, 'rendition_errors': {name: message}}. With gate_mode
+    'skip', or for a truncated frame, a rejected frame is not decoded any further and
+    'store' is False.
+    """
+    from PIL import Image
+
+    quality = None
+    if gate_mode in ('tag', 'skip'):
+        quality = analyze_frame(data, placeholders)
+        if not quality.ok and (gate_mode == 'skip' or quality.reason == 'truncated'):
+            return {'quality': quality, 'store': False, 'hash': quality.hash, 'jpeg': None, 'renditions': {}, 'rendition_errors': {}}
+
+    img = Image.open(io.BytesIO(data))
+    if img.mode == 'RGBA':
+        img = img.convert('RGB')
+    frame_hash = average_hash(img)
+    out = io.BytesIO()
+    img.save(out, format='JPEG', quality=85)
+
+    # Smaller renditions from the same decode, so viewers and the detector can skip the full frame
+    rendered, errors = {}, {}
+    for rendition in renditions:
+        try:
+            rendered[rendition] = make_rendition(img, rendition)
+        except Exception as e:
+            errors[rendition] = str(e)
+    return {
+        'quality': quality, 'store': True, 'hash': frame_hash, 'jpeg': out.getvalue(),
+        'renditions': rendered, 'rendition_errors': errors,
+    }